@@ -38,6 +38,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'salon.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -82,6 +83,26 @@ DATABASES = {
         conn_max_age=600
     )
 }
+# SQLite's default in-memory test database shares one cache between
+# connections, where lock contention fails at once instead of waiting out the
+# busy timeout. A file lets the concurrent booking tests queue like prod does.
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default']['TEST'] = {'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3')}
+
+# Django's cache framework backs the salon catalog cache (salon/cache.py).
+# Defaults to an in-process cache; point CACHE_BACKEND/CACHE_LOCATION at
+# e.g. django.core.cache.backends.filebased.FileBasedCache or Redis in prod.
+# Catalog versions must be seen by every worker, Celery and management
+# commands alike, so outside DEBUG a process-local cache refuses to start
+# (salon/cache.py).
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'glowapp'),
+    }
+}
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', 300))
 
 AUTH_PASSWORD_VALIDATORS = [
     { 'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator', },
@@ -100,9 +121,16 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 # --- Local Media Files Configuration ---
 # All uploaded files will be stored locally in the 'backend/media/' directory.
-DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
+# File names carry a content hash (a.<hash>.jpg) so media can be cached as immutable.
+DEFAULT_FILE_STORAGE = 'salon.media.HashedMediaStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# How /media/ is served (salon/media.py): 'django' streams files with Range
+# support; 'x-accel' (nginx) or 'x-sendfile' (Apache/lighttpd) hand the
+# transfer to the front proxy; 'off' leaves /media/ entirely to the proxy.
+# See deploy/nginx-media.conf for the matching nginx config.
+MEDIA_SERVE_MODE = os.environ.get('MEDIA_SERVE_MODE', 'django')
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -112,13 +140,17 @@ REST_FRAMEWORK = {
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
     ],
+    # Bearer tokens carry role/stylist claims, so authenticating costs no
+    # query (salon/authentication.py). Session auth is only for the
+    # browsable API in development.
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-        'rest_framework.authentication.SessionAuthentication',
-    ),
+        'salon.authentication.TokenUserAuthentication',
+    ) + (('rest_framework.authentication.SessionAuthentication',) if DEBUG else ()),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.AllowAny',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'salon.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
 }
 
 from datetime import timedelta
@@ -144,6 +176,49 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
 
+# How bookings without a preferred stylist are assigned: 'least_booked',
+# 'round_robin', 'fewest_gaps', 'first_available' or a dotted path (see
+# salon/assignment.py).
+SALON_ASSIGNMENT_POLICY = os.environ.get('SALON_ASSIGNMENT_POLICY', 'least_booked')
+
+# Loyalty ledger rows older than this are folded into per-customer snapshots
+# by the compact_loyalty_ledger task/command.
+LOYALTY_LEDGER_RETENTION_DAYS = int(os.environ.get('LOYALTY_LEDGER_RETENTION_DAYS', 365))
+# Points a loyalty-redemption promotion costs per currency unit of discount
+# (salon/pricing.py). Points are earned at one per unit charged.
+LOYALTY_POINTS_PER_UNIT = int(os.environ.get('LOYALTY_POINTS_PER_UNIT', 10))
+# Each process rebuilds its promotion index (salon/pricing.py) on every
+# Promotion write and at least this often, in seconds.
+PROMOTION_INDEX_TTL = int(os.environ.get('PROMOTION_INDEX_TTL', 60))
+
+# Async login (salon.views.LoginView) checks passwords on this many threads;
+# past LOGIN_MAX_PENDING queued logins it answers 503. Defaults to one per CPU.
+LOGIN_HASH_WORKERS = int(os.environ.get('LOGIN_HASH_WORKERS', 0)) or None
+LOGIN_MAX_PENDING = int(os.environ.get('LOGIN_MAX_PENDING', 256))
+
+# Token users load their full row from a per-process cache kept this many
+# seconds (salon/authentication.py).
+TOKEN_USER_CACHE_TTL = int(os.environ.get('TOKEN_USER_CACHE_TTL', 30))
+
+# Request metrics (salon/metrics.py): every request is timed; this fraction
+# also records DB, serializer and cache detail. Scraped from /metrics, which
+# requires METRICS_TOKEN as a bearer token; without one it is DEBUG-only.
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', 0.05))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Celery (salon/tasks.py). Without a broker, tasks run inline in the caller;
+# image variants are then left pending for `manage.py render_image_variants`.
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', '')
+CELERY_TASK_ALWAYS_EAGER = not CELERY_BROKER_URL
+
+# Style recommendation index (salon/recommendations.py). Catalog writes queue
+# a refresh this many seconds out, so a burst of edits shares one. Without a
+# broker they only mark the index stale for the next recommendation request.
+RECOMMENDATION_INDEX_PATH = os.environ.get('RECOMMENDATION_INDEX_PATH', os.path.join(BASE_DIR, 'var', 'recommendations.npz'))
+RECOMMENDATION_REFRESH_DELAY = int(os.environ.get('RECOMMENDATION_REFRESH_DELAY', 30))
+# Memory-mapped image embeddings for "find similar looks" (salon/embeddings.py).
+IMAGE_EMBEDDINGS_DIR = os.environ.get('IMAGE_EMBEDDINGS_DIR', os.path.join(BASE_DIR, 'var', 'embeddings'))
+
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 FRONTEND_URL = os.environ.get('FRONTEND_URL', 'http://localhost:9002')
 DEFAULT_FROM_EMAIL = 'no-reply@glowapp.com'
@@ -1,9 +1,20 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+
+from salon.media import serve_media
+from salon.metrics import METRICS_PATH, metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/salon/', include('salon.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path(METRICS_PATH.lstrip('/'), metrics_view, name='metrics'),
+]
+
+# Media is served by salon.media.serve_media (streamed, or handed to the
+# front proxy) unless MEDIA_SERVE_MODE is 'off' and the proxy serves
+# MEDIA_ROOT directly.
+if settings.MEDIA_SERVE_MODE != 'off':
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % settings.MEDIA_URL.lstrip('/'), serve_media, name='media'),
+    ]
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, Service, Stylist, Appointment, Review, Promotion, LoyaltyPoint, SalonSetting, PortfolioImage, InspiredWork # Import InspiredWork
+from .models import User, Service, Stylist, Appointment, Review, Promotion, LoyaltyPoint, LoyaltyTransaction, SalonSetting, PortfolioImage, InspiredWork # Import InspiredWork
 from .forms import CustomUserCreationForm, CustomUserChangeForm
 
 @admin.register(User)
@@ -42,10 +42,11 @@ class ServiceAdmin(admin.ModelAdmin):
 
 @admin.register(Stylist)
 class StylistAdmin(admin.ModelAdmin):
-    list_display = ('user', 'is_available', 'is_featured')
+    list_display = ('user', 'is_available', 'is_featured', 'average_rating', 'review_count')
     search_fields = ('user__email', 'user__first_name', 'user__last_name')
     raw_id_fields = ('user',)
     filter_horizontal = ('specialties',)
+    readonly_fields = ('rating_sum', 'review_count')
 
 @admin.register(Appointment)
 class AppointmentAdmin(admin.ModelAdmin):
@@ -55,6 +56,8 @@ class AppointmentAdmin(admin.ModelAdmin):
     raw_id_fields = ('customer', 'stylist')
     filter_horizontal = ('services',)
     date_hierarchy = 'appointment_date'
+    # Skip the unfiltered COUNT(*) on every changelist page.
+    show_full_result_count = False
 
     def display_services(self, obj):
         return ", ".join([service.name for service in obj.services.all()])
@@ -66,6 +69,7 @@ class ReviewAdmin(admin.ModelAdmin):
     list_filter = ('rating', 'created_at', 'stylist')
     search_fields = ('customer__email', 'stylist__user__email', 'comment')
     raw_id_fields = ('appointment', 'customer', 'stylist')
+    show_full_result_count = False
 
 @admin.register(Promotion)
 class PromotionAdmin(admin.ModelAdmin):
@@ -78,6 +82,23 @@ class LoyaltyPointAdmin(admin.ModelAdmin):
     list_display = ('customer', 'points', 'last_updated')
     search_fields = ('customer__email',)
     raw_id_fields = ('customer',)
+    # Balances only move through the ledger (salon.loyalty).
+    readonly_fields = ('points',)
+
+@admin.register(LoyaltyTransaction)
+class LoyaltyTransactionAdmin(admin.ModelAdmin):
+    list_display = ('customer', 'kind', 'points', 'appointment', 'created_at')
+    list_filter = ('kind',)
+    search_fields = ('customer__email',)
+    raw_id_fields = ('customer', 'appointment')
+    show_full_result_count = False
+
+    # The ledger is append-only; balances are moved through salon.loyalty.
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 @admin.register(SalonSetting)
 class SalonSettingAdmin(admin.ModelAdmin):
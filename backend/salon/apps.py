@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class SalonConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'salon'
+
+    def ready(self):
+        from . import cache, metrics, signals  # noqa: F401
+        cache.require_shared_cache()
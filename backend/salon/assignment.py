@@ -0,0 +1,129 @@
+from django.conf import settings
+from django.db.models import Count, IntegerField, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils.module_loading import import_string
+
+from . import snapshots
+from .models import Appointment, Stylist
+
+
+def qualified_stylists(category_ids):
+    """
+    Available stylists who specialize in every one of ``category_ids``.
+    """
+    return Stylist.objects.filter(
+        is_available=True,
+        specialties__id__in=category_ids
+    ).annotate(
+        num_matching_specialties=Count('specialties', filter=Q(specialties__id__in=category_ids), distinct=True)
+    ).filter(
+        num_matching_specialties=len(category_ids)
+    )
+
+
+def free_stylists(category_ids, appointment_date, appointment_time, duration, exclude_ids=()):
+    """
+    Qualified stylists who are working at ``appointment_time`` and whose busy
+    bitmap for the day is clear for the booking, from a single query. Each
+    stylist is annotated with that bitmap (``busy``, an int), their booked
+    minutes that day and their most recent assignment time for the
+    assignment policies below.
+    """
+    day_bookings = Appointment.objects.active().filter(
+        stylist=OuterRef('pk'), appointment_date=appointment_date
+    ).order_by().values('stylist')
+
+    stylists = snapshots.with_busy(qualified_stylists(category_ids), appointment_date).filter(
+        Q(working_hours_start__isnull=True) | Q(working_hours_start__lte=appointment_time),
+        Q(working_hours_end__isnull=True) | Q(working_hours_end__gte=appointment_time),
+    ).exclude(
+        pk__in=list(exclude_ids)
+    ).annotate(
+        booked_minutes=Coalesce(
+            Subquery(day_bookings.annotate(total=Sum('duration_minutes')).values('total'), output_field=IntegerField()),
+            Value(0),
+        ),
+        last_assigned_at=Subquery(
+            Appointment.objects.filter(stylist=OuterRef('pk')).order_by().values('stylist')
+            .annotate(latest=Max('created_at')).values('latest')
+        ),
+    ).select_related('user').order_by('id')
+
+    window = snapshots.window_mask(appointment_time.hour * 60 + appointment_time.minute, duration)
+    candidates = []
+    for stylist in stylists:
+        stylist.busy = snapshots.decode(stylist.busy_bitmap)
+        if not stylist.busy & window:
+            candidates.append(stylist)
+    return candidates
+
+
+def first_available(candidates, appointment_date, appointment_time, duration):
+    return candidates[0]
+
+
+def least_booked(candidates, appointment_date, appointment_time, duration):
+    return min(candidates, key=lambda stylist: (stylist.booked_minutes, stylist.id))
+
+
+def round_robin(candidates, appointment_date, appointment_time, duration):
+    # Never-assigned stylists first, then whoever has waited longest.
+    return min(candidates, key=lambda stylist: (
+        stylist.last_assigned_at is not None, stylist.last_assigned_at or 0, stylist.id
+    ))
+
+
+def fewest_gaps(candidates, appointment_date, appointment_time, duration):
+    """
+    Prefers the stylist whose day stays most compact: the booking is scored by
+    the idle minutes it leaves next to that stylist's neighbouring bookings,
+    read off their busy bitmaps.
+    """
+    start = appointment_time.hour * 60 + appointment_time.minute
+    first = start // snapshots.SLOT_MINUTES
+    last = -(-(start + duration) // snapshots.SLOT_MINUTES)
+
+    def gap(stylist):
+        if not stylist.busy:
+            # An empty day opens a new block; rank it after any that extend one.
+            return (1, 0, stylist.id)
+        gaps = []
+        before = stylist.busy & ((1 << first) - 1)
+        if before:
+            gaps.append(first - before.bit_length())
+        after = stylist.busy >> last
+        if after:
+            gaps.append((after & -after).bit_length() - 1)
+        return (0, min(gaps) * snapshots.SLOT_MINUTES, stylist.id)
+
+    return min(candidates, key=gap)
+
+
+POLICIES = {
+    'first_available': first_available,
+    'least_booked': least_booked,
+    'round_robin': round_robin,
+    'fewest_gaps': fewest_gaps,
+}
+
+
+def get_policy(name=None):
+    """
+    Resolves ``name`` (or ``settings.SALON_ASSIGNMENT_POLICY``) to a policy
+    callable. Accepts a key of POLICIES or a dotted path to a function with
+    the same signature.
+    """
+    name = name or getattr(settings, 'SALON_ASSIGNMENT_POLICY', 'least_booked')
+    if name in POLICIES:
+        return POLICIES[name]
+    return import_string(name)
+
+
+def assign_stylist(category_ids, appointment_date, appointment_time, duration, exclude_ids=(), policy=None):
+    """
+    Picks a conflict-free qualified stylist for the booking, or None.
+    """
+    candidates = free_stylists(category_ids, appointment_date, appointment_time, duration, exclude_ids)
+    if not candidates:
+        return None
+    return get_policy(policy)(candidates, appointment_date, appointment_time, duration)
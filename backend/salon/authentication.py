@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import cache
+from .models import ClaimsUser, Stylist, User
+
+ROLE_CLAIM = 'role'
+STYLIST_CLAIM = 'stylist_id'
+ACCESS_KEY_PREFIX = 'salon:access:'
+
+
+def tokens_for_user(user):
+    """
+    A refresh token (and through it, the access token) for ``user`` carrying
+    the claims TokenUserAuthentication needs to skip loading the user.
+    """
+    refresh = RefreshToken.for_user(user)
+    refresh[ROLE_CLAIM] = user.role
+    refresh[STYLIST_CLAIM] = (
+        Stylist.objects.filter(user=user).values_list('id', flat=True).first() if user.role == 'stylist' else None
+    )
+    return refresh
+
+
+def publish_access(user, deleted=False):
+    """
+    Tells every process (through the shared catalog cache) that ``user``'s
+    role or active flag changed, so tokens claiming the old role, or any
+    token once the user is inactive or deleted, stop working on their next
+    request. Kept until every token issued before the change has expired.
+    """
+    cache.get_cache().set(
+        f'{ACCESS_KEY_PREFIX}{user.pk}', (user.role, user.is_active and not deleted),
+        timeout=int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()),
+    )
+
+
+class UserCache:
+    """
+    Process-local, short-lived cache of full User rows for token users that
+    need more than their claims. Entries expire after ``ttl`` seconds and are
+    dropped early when the user is saved or deleted in this process; other
+    processes may serve the old row until then. Access changes don't wait
+    for that (see publish_access).
+    """
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def peek(self, pk):
+        with self._lock:
+            entry = self._entries.get(pk)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def get(self, pk):
+        user = self.peek(pk)
+        if user is None:
+            user = User.objects.filter(pk=pk).first()
+            if user is not None:
+                with self._lock:
+                    self._entries[pk] = (time.monotonic() + self.ttl, user)
+                    self._entries.move_to_end(pk)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+        return user
+
+    def forget(self, pk):
+        with self._lock:
+            self._entries.pop(pk, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(ttl=getattr(settings, 'TOKEN_USER_CACHE_TTL', 30))
+
+
+def get_cached_user(pk):
+    """
+    A private copy of the cached User, so callers can change it freely.
+    """
+    user = user_cache.get(pk)
+    if user is None:
+        return None
+    fields = User._meta.concrete_fields
+    return User.from_db(user._state.db, [field.attname for field in fields], [getattr(user, field.attname) for field in fields])
+
+
+class TokenUserAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that builds the request user from the token's claims
+    (a ClaimsUser with ``id``, ``role`` and ``stylist_id``) instead of loading
+    the row on every request. Permission checks and queries filtered by the
+    user need nothing else; anything that does fills in from the user cache.
+
+    Role changes and deactivation take effect on the next request, through
+    the access state publish_access shares with every process (one cache
+    read per request). A user row this process has cached only decides when
+    nothing was published, since it may be older than the shared state.
+    Tokens issued before the claims existed fall back to a database lookup.
+    """
+    def get_user(self, validated_token):
+        if ROLE_CLAIM not in validated_token or api_settings.USER_ID_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        role = validated_token[ROLE_CLAIM]
+
+        access = cache.get_cache().get(f'{ACCESS_KEY_PREFIX}{user_id}')
+        if access is None:
+            # Nothing published since the token was issued; a row this
+            # process holds may still be newer than the claims.
+            cached = user_cache.peek(user_id)
+            if cached is not None:
+                access = (cached.role, cached.is_active)
+        if access is not None:
+            current_role, is_active = access
+            if not is_active:
+                raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+            if current_role != role:
+                raise AuthenticationFailed(_("Token role is out of date"), code="token_role_changed")
+
+        user = ClaimsUser.from_db(router.db_for_read(User), ['id', 'role'], [user_id, role])
+        user.stylist_id = validated_token.get(STYLIST_CLAIM)
+        return user
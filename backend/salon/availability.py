@@ -0,0 +1,121 @@
+from datetime import datetime, time
+
+import pytz
+from django.conf import settings
+
+from . import snapshots
+
+SLOT_INTERVAL_MINUTES = 15
+DEFAULT_START_HOUR = 8
+DEFAULT_END_HOUR = 20  # 8 PM
+MAX_RANGE_DAYS = 62
+
+
+def salon_now():
+    """
+    Current time in the salon's local timezone.
+    """
+    return datetime.now(pytz.utc).astimezone(pytz.timezone(settings.TIME_ZONE))
+
+
+def _to_minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def _format_minutes(minutes):
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+def working_hours(stylist):
+    start_hour = DEFAULT_START_HOUR
+    end_hour = DEFAULT_END_HOUR
+    if stylist.working_hours_start:
+        start_hour = stylist.working_hours_start.hour
+    if stylist.working_hours_end:
+        end_hour = stylist.working_hours_end.hour
+    return start_hour, end_hour
+
+
+def free_slots(start_hour, end_hour, duration, busy, cutoff=None):
+    """
+    Returns the 'HH:MM' start of every 15-minute slot in working hours whose
+    window is clear in the ``busy`` bitmap (see snapshots.py). Slots starting
+    at or before ``cutoff`` (a time) are skipped.
+    """
+    slots = []
+    slot_start = start_hour * 60
+    while slot_start < end_hour * 60:
+        is_valid_slot = cutoff is None or time(slot_start // 60, slot_start % 60) > cutoff
+        if is_valid_slot and snapshots.is_free(busy, slot_start, duration):
+            slots.append(_format_minutes(slot_start))
+        slot_start += SLOT_INTERVAL_MINUTES
+    return slots
+
+
+def stylist_slots(stylist, appointment_date, duration, busy_masks, now=None):
+    now = now or salon_now()
+    start_hour, end_hour = working_hours(stylist)
+    cutoff = now.time() if appointment_date == now.date() else None
+    busy = busy_masks.get((stylist.id, appointment_date), 0)
+    return free_slots(start_hour, end_hour, duration, busy, cutoff)
+
+
+def next_free_slot(stylist, appointment_date, duration, busy, after=None, now=None):
+    """
+    The first 'HH:MM' start at or after ``after`` (a time; the stylist's
+    opening when omitted) at which ``stylist`` is free for ``duration``
+    minutes on ``appointment_date``, given their ``busy`` bitmap, or None.
+    ``after`` itself is tried first even when it's off the slot grid; later
+    starts follow the grid, within working hours and not in the past.
+    """
+    now = now or salon_now()
+    start_hour, end_hour = working_hours(stylist)
+    first = start_hour * 60
+    starts = range(first, end_hour * 60, SLOT_INTERVAL_MINUTES)
+    if after is not None and _to_minutes(after) > first:
+        requested = _to_minutes(after)
+        starts = [requested] + [start for start in starts if start > requested]
+    cutoff = now.time() if appointment_date == now.date() else None
+    for start in starts:
+        if start >= end_hour * 60:
+            break
+        if cutoff is not None and time(start // 60, start % 60) <= cutoff:
+            continue
+        if snapshots.is_free(busy, start, duration):
+            return _format_minutes(start)
+    return None
+
+
+def day_availability(stylists, appointment_date, duration, busy_masks, now):
+    available_slots = {}
+    for stylist in stylists:
+        slots = stylist_slots(stylist, appointment_date, duration, busy_masks, now)
+        if slots:
+            available_slots[stylist.id] = {
+                "stylist_name": stylist.user.get_full_name(),
+                "slots": slots
+            }
+    return available_slots
+
+
+def get_availability(stylists, appointment_date, duration):
+    """
+    Builds the ``/appointments/availability/`` payload for ``stylists`` on
+    ``appointment_date`` from one query for the stylists' busy bitmaps.
+    """
+    stylists = list(stylists)
+    busy_masks = snapshots.load_masks([s.id for s in stylists], [appointment_date])
+    return day_availability(stylists, appointment_date, duration, busy_masks, salon_now())
+
+
+def iter_availability(stylists, dates, duration):
+    """
+    Yields (date, payload) for each of ``dates`` in order. Busy bitmaps for the
+    whole range are fetched once, before the first day is produced.
+    """
+    stylists = list(stylists)
+    dates = list(dates)
+    busy_masks = snapshots.load_masks([s.id for s in stylists], dates)
+    now = salon_now()
+    for appointment_date in dates:
+        yield appointment_date, day_availability(stylists, appointment_date, duration, busy_masks, now)
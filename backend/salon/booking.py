@@ -0,0 +1,37 @@
+from django.db import transaction
+from django.db.models import F
+
+from .models import Stylist
+
+# Postgres advisory locks take two int4 keys.
+_INT4_MOD = 2 ** 31
+
+
+def lock_stylist_day(stylist_id, appointment_date):
+    """
+    Serializes bookings for one stylist on one day until the surrounding
+    transaction ends. Must be called inside ``transaction.atomic()``.
+
+    - Postgres: a transaction-scoped advisory lock keyed on (stylist, day), so
+      bookings for other stylists or days never wait. The exclusion constraint
+      added in migration 0008 backs this up at the table level.
+    - Other backends with SELECT ... FOR UPDATE: lock the stylist row, which
+      serializes that stylist's bookings across all days.
+    - SQLite: there are no row locks, and a transaction that reads before it
+      writes can deadlock against a concurrent writer. Touching the stylist
+      row first takes SQLite's database-wide write lock up front, so
+      concurrent bookings queue behind it (up to the connection's busy
+      timeout) and then read committed data. Throughput is one booking at a
+      time, which is fine for local development and tests.
+    """
+    connection = transaction.get_connection()
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_advisory_xact_lock(%s, %s)',
+                [stylist_id % _INT4_MOD, appointment_date.toordinal()],
+            )
+    elif connection.features.has_select_for_update:
+        list(Stylist.objects.select_for_update().filter(pk=stylist_id).values_list('pk', flat=True))
+    else:
+        Stylist.objects.filter(pk=stylist_id).update(id=F('id'))
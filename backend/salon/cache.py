@@ -0,0 +1,229 @@
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import metrics
+
+VERSION_KEY_PREFIX = 'salon:version:'
+MODIFIED_KEY_PREFIX = 'salon:modified:'
+ENTRY_KEY_PREFIX = 'salon:catalog:'
+# Backends whose entries only the process that wrote them can see.
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+class CacheStats:
+    """
+    Process-local hit/miss counters for the catalog cache.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def record(self, hit):
+        metrics.record_cache(hit)
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+stats = CacheStats()
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def require_shared_cache():
+    """
+    Versions are bumped by whichever process wrote the data: a web worker, a
+    Celery task or a management command. In a process-local cache no other
+    process sees the bump, and they serve stale responses and ETags for good,
+    so outside DEBUG such a cache refuses to start.
+    """
+    alias = getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if not settings.DEBUG and backend in PROCESS_LOCAL_BACKENDS:
+        raise ImproperlyConfigured(
+            f'The {alias!r} cache uses {backend}, which is private to each process; set '
+            'CACHE_BACKEND/CACHE_LOCATION to a shared cache (FileBasedCache, Redis or Memcached).'
+        )
+
+
+def _version_key(model):
+    return f'{VERSION_KEY_PREFIX}{model._meta.label_lower}'
+
+
+def _modified_key(model):
+    return f'{MODIFIED_KEY_PREFIX}{model._meta.label_lower}'
+
+
+def bump_version(model):
+    """
+    Invalidates every cached entry that depends on ``model``.
+    """
+    cache = get_cache()
+    key = _version_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Seeding from the clock means a version that was evicted never comes
+        # back with a value an older entry was stored under.
+        cache.set(key, time.time_ns(), timeout=None)
+    cache.set(_modified_key(model), time.time(), timeout=None)
+
+
+def _get_or_seed(keys, seed):
+    cache = get_cache()
+    values = cache.get_many(keys)
+    missing = {key: seed() for key in keys if key not in values}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        values.update(missing)
+    return [values[key] for key in keys]
+
+
+def get_versions(models):
+    return _get_or_seed([_version_key(model) for model in models], time.time_ns)
+
+
+def get_last_modified(models):
+    """
+    Unix time, with sub-second precision, of the most recent write to any of
+    ``models`` that this cache has seen (or of the first time it was asked,
+    if none).
+    """
+    return max(_get_or_seed([_modified_key(model) for model in models], time.time))
+
+
+def build_key(request, models, vary_on_user=False):
+    params = sorted(request.query_params.lists())
+    user = request.user.pk if vary_on_user and request.user.is_authenticated else None
+    raw = repr((
+        request.build_absolute_uri(request.path),
+        params,
+        user,
+        get_versions(models),
+    ))
+    return ENTRY_KEY_PREFIX + hashlib.md5(raw.encode()).hexdigest()
+
+
+class CatalogVersionMixin:
+    """
+    Declares which models a viewset's responses are rendered from. Writes to
+    any of them (see signals.py) bump the versions both mixins below key on.
+    """
+    cache_models = ()
+    cache_vary_on_user = False
+
+    def get_cache_models(self):
+        return (self.queryset.model,) + tuple(self.cache_models)
+
+
+class CachedCatalogMixin(CatalogVersionMixin):
+    """
+    Read-through cache for the list and retrieve actions of catalog viewsets.
+
+    Entries are keyed by URL, query params and the current version of every
+    model in ``cache_models``; signals bump those versions on writes, so stale
+    entries are simply never read again and expire on their own.
+    """
+    def cached_response(self, request, render):
+        if request.method != 'GET':
+            return render()
+
+        cache = get_cache()
+        key = build_key(request, self.get_cache_models(), self.cache_vary_on_user)
+        data = cache.get(key)
+        if data is not None:
+            stats.record(hit=True)
+            return Response(data)
+
+        stats.record(hit=False)
+        response = render()
+        if response.status_code == 200:
+            cache.set(key, response.data, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(CachedCatalogMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(CachedCatalogMixin, self).retrieve(request, *args, **kwargs))
+
+
+class ConditionalGetMixin(CatalogVersionMixin):
+    """
+    Strong ETag / Last-Modified support for list and retrieve. Both values come
+    from the model version stamps, so a matching If-None-Match or
+    If-Modified-Since is answered with a 304 before anything is serialized.
+
+    HTTP dates have one-second precision, so Last-Modified is the end of the
+    second of the last write, and is only sent once that second has passed:
+    otherwise a second write within it would look unmodified.
+    """
+    def conditional_response(self, request, render):
+        if request.method not in ('GET', 'HEAD'):
+            return render()
+
+        models = self.get_cache_models()
+        user = request.user.pk if self.cache_vary_on_user and request.user.is_authenticated else None
+        raw = repr((
+            request.build_absolute_uri(request.path),
+            sorted(request.query_params.lists()),
+            getattr(request, 'accepted_media_type', None),
+            user,
+            get_versions(models),
+        ))
+        etag = '"%s"' % hashlib.sha256(raw.encode()).hexdigest()
+        last_modified = math.ceil(get_last_modified(models))
+
+        if self._is_not_modified(request, etag, last_modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = render()
+            if response.status_code != 200:
+                return response
+
+        response['ETag'] = etag
+        if last_modified <= time.time():
+            response['Last-Modified'] = http_date(last_modified)
+        if self.cache_vary_on_user:
+            patch_vary_headers(response, ('Authorization', 'Cookie'))
+        return response
+
+    def _is_not_modified(self, request, etag, last_modified):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            etags = parse_etags(if_none_match)
+            return '*' in etags or etag in etags
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        return if_modified_since is not None and last_modified <= min(if_modified_since, time.time())
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(request, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs))
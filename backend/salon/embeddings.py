@@ -0,0 +1,311 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import InspiredWork, PortfolioImage
+
+logger = logging.getLogger(__name__)
+
+# What a row embeds. Removed rows keep their slot as TOMBSTONE until the
+# store is compacted.
+KIND_WORK = 0
+KIND_PORTFOLIO = 1
+TOMBSTONE = -1
+SOURCES = {KIND_WORK: InspiredWork, KIND_PORTFOLIO: PortfolioImage}
+
+# 8 hue x 4 saturation x 4 value color bins, plus an 8x8 luma thumbnail for
+# rough layout. Cosine similarity is COLOR_WEIGHT * color + LUMA_WEIGHT * layout.
+HIST_BINS = (8, 4, 4)
+LUMA_SIDE = 8
+DIM = HIST_BINS[0] * HIST_BINS[1] * HIST_BINS[2] + LUMA_SIDE * LUMA_SIDE
+COLOR_WEIGHT = 0.7
+LUMA_WEIGHT = 0.3
+WORKING_SIZE = (64, 64)
+SEARCH_BLOCK_ROWS = 65536
+COMPACT_RATIO = 0.25
+
+
+def embed(image):
+    """
+    A unit-length float32 vector of ``DIM`` for ``image`` (a PIL image, path
+    or file object). Color is a square-rooted HSV histogram, so the dot
+    product of two is their Bhattacharyya coefficient; layout is the
+    zero-mean, normalized 8x8 luma thumbnail.
+    """
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+    # Lets JPEG decode at reduced scale; a no-op for other formats.
+    image.draft('RGB', (WORKING_SIZE[0] * 2, WORKING_SIZE[1] * 2))
+    small = ImageOps.exif_transpose(image).convert('RGB').resize(WORKING_SIZE, Image.BILINEAR)
+
+    hsv = np.asarray(small.convert('HSV'), dtype=np.uint16)
+    hue_bins, saturation_bins, value_bins = HIST_BINS
+    bins = (
+        (hsv[..., 0] * hue_bins >> 8) * saturation_bins + (hsv[..., 1] * saturation_bins >> 8)
+    ) * value_bins + (hsv[..., 2] * value_bins >> 8)
+    histogram = np.bincount(bins.ravel(), minlength=DIM - LUMA_SIDE * LUMA_SIDE).astype(np.float32)
+    color = np.sqrt(histogram / histogram.sum())
+
+    luma = np.asarray(small.convert('L').resize((LUMA_SIDE, LUMA_SIDE), Image.BOX), dtype=np.float32).ravel()
+    luma -= luma.mean()
+    norm = np.linalg.norm(luma)
+    if norm:
+        luma /= norm
+
+    # A flat image has no layout component; renormalize so it still scores on color alone.
+    vector = np.concatenate([color * np.sqrt(COLOR_WEIGHT), luma * np.sqrt(LUMA_WEIGHT)])
+    return (vector / np.linalg.norm(vector)).astype(np.float32)
+
+
+def _lock_file(handle):
+    try:
+        import fcntl
+    except ImportError:
+        # Windows has no flock; lock the file's first byte instead.
+        import msvcrt
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+    else:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+
+
+def _unlock_file(handle):
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _fingerprint(name):
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), 'little', signed=True)
+
+
+class EmbeddingStore:
+    """
+    Embeddings in a memory-mapped float32 matrix on disk.
+
+    ``keys.npz`` holds one (kind, id, image fingerprint) row per matrix row;
+    ``vectors-<generation>.f32`` holds the rows. New embeddings are appended
+    and the keys file is replaced afterwards, so readers never see a key
+    without its vector. Compaction writes a new generation, so readers
+    holding the old map keep a consistent view. Writers take a file lock.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.keys_path = os.path.join(directory, 'keys.npz')
+        self._loaded = (None, None, None)
+        self._loaded_lock = threading.Lock()
+
+    def _vectors_path(self, generation):
+        return os.path.join(self.directory, f'vectors-{generation}.f32')
+
+    def _read(self):
+        try:
+            with np.load(self.keys_path) as data:
+                return int(data['generation']), data['keys']
+        except FileNotFoundError:
+            return 0, np.empty((0, 3), dtype=np.int64)
+
+    def _write_keys(self, generation, keys):
+        tmp_path = f'{self.keys_path}.{os.getpid()}.tmp.npz'
+        np.savez(tmp_path, generation=generation, keys=keys)
+        os.replace(tmp_path, self.keys_path)
+
+    def snapshot(self):
+        """
+        ``(keys, vectors)`` as of the last write, reloaded only when the keys
+        file changes.
+        """
+        try:
+            mtime = os.stat(self.keys_path).st_mtime_ns
+        except FileNotFoundError:
+            return np.empty((0, 3), dtype=np.int64), np.empty((0, DIM), dtype=np.float32)
+        with self._loaded_lock:
+            if self._loaded[0] != mtime:
+                generation, keys = self._read()
+                vectors = (
+                    np.memmap(self._vectors_path(generation), dtype=np.float32, mode='r', shape=(len(keys), DIM))
+                    if len(keys) else np.empty((0, DIM), dtype=np.float32)
+                )
+                self._loaded = (mtime, keys, vectors)
+            return self._loaded[1], self._loaded[2]
+
+    @contextmanager
+    def writing(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            _lock_file(lock)
+            try:
+                yield
+            finally:
+                _unlock_file(lock)
+
+    def write(self, upserts, removals):
+        """
+        Applies ``upserts`` ({(kind, id): (fingerprint, vector)}) and
+        ``removals`` ({(kind, id)}). Must run inside ``writing()``.
+        """
+        generation, keys = self._read()
+        keys = keys.copy()
+        positions = {(int(kind), int(pk)): row for row, (kind, pk, _) in enumerate(keys) if kind != TOMBSTONE}
+
+        in_place = {positions[key]: value for key, value in upserts.items() if key in positions}
+        appended = [(key, value) for key, value in upserts.items() if key not in positions]
+        if in_place:
+            vectors = np.memmap(self._vectors_path(generation), dtype=np.float32, mode='r+', shape=(len(keys), DIM))
+            for row, (fingerprint, vector) in in_place.items():
+                vectors[row] = vector
+                keys[row, 2] = fingerprint
+            vectors.flush()
+            del vectors
+        if appended:
+            with open(self._vectors_path(generation), 'ab') as handle:
+                # Drop rows a crashed writer appended without recording keys.
+                handle.truncate(len(keys) * DIM * np.dtype(np.float32).itemsize)
+                handle.write(np.stack([vector for _, (_, vector) in appended]).astype(np.float32).tobytes())
+            keys = np.concatenate([
+                keys, np.array([[kind, pk, fingerprint] for (kind, pk), (fingerprint, _) in appended], dtype=np.int64)
+            ])
+        for key in removals:
+            if key in positions:
+                keys[positions[key], 0] = TOMBSTONE
+
+        compacted = len(keys) and (keys[:, 0] == TOMBSTONE).mean() > COMPACT_RATIO
+        if compacted:
+            generation, keys = self._compact(generation, keys)
+        self._write_keys(generation, keys)
+        if compacted:
+            self._remove_old_generations(generation)
+
+    def _remove_old_generations(self, generation):
+        """
+        Deletes vector files from before the previous generation. The
+        previous one stays until the next swap: a reader may have read keys
+        naming it just before this one and not have mapped it yet.
+        """
+        for name in os.listdir(self.directory):
+            match = re.fullmatch(r'vectors-(\d+)\.f32', name)
+            if match and int(match.group(1)) < generation - 1:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    # Still mapped on Windows; the next swap retries.
+                    pass
+
+    def _compact(self, generation, keys):
+        live = keys[:, 0] != TOMBSTONE
+        vectors = np.memmap(self._vectors_path(generation), dtype=np.float32, mode='r', shape=(len(keys), DIM))
+        with open(self._vectors_path(generation + 1), 'wb') as handle:
+            handle.write(np.ascontiguousarray(vectors[live]).tobytes())
+        del vectors
+        return generation + 1, keys[live]
+
+    def search(self, vector, limit=5, kinds=None):
+        """
+        Brute-force cosine top-``limit`` over the matrix, a block of rows at a
+        time so the working set stays bounded. Returns ``[(kind, id, score)]``.
+        """
+        keys, vectors = self.snapshot()
+        allowed = keys[:, 0] != TOMBSTONE
+        if kinds is not None:
+            allowed &= np.isin(keys[:, 0], list(kinds))
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, len(keys), SEARCH_BLOCK_ROWS):
+            scores = vectors[start:start + SEARCH_BLOCK_ROWS] @ vector
+            scores[~allowed[start:start + SEARCH_BLOCK_ROWS]] = -np.inf
+            rows = np.arange(start, start + len(scores))
+            best_rows = np.concatenate([best_rows, rows])
+            best_scores = np.concatenate([best_scores, scores])
+            if len(best_scores) > limit:
+                top = np.argpartition(-best_scores, limit - 1)[:limit]
+                best_rows, best_scores = best_rows[top], best_scores[top]
+        order = np.argsort(-best_scores, kind='stable')
+        return [
+            (int(keys[row, 0]), int(keys[row, 1]), float(score))
+            for row, score in zip(best_rows[order], best_scores[order]) if np.isfinite(score)
+        ]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    directory = getattr(settings, 'IMAGE_EMBEDDINGS_DIR', os.path.join(settings.BASE_DIR, 'var', 'embeddings'))
+    with _store_lock:
+        if _store is None or _store.directory != directory:
+            _store = EmbeddingStore(directory)
+        return _store
+
+
+def _embed_field(field):
+    try:
+        with field.open('rb') as handle:
+            return embed(handle)
+    except (OSError, UnidentifiedImageError, ValueError) as exc:
+        logger.warning('Could not embed %s: %s', field.name, exc)
+        return None
+
+
+def sync(keys=None):
+    """
+    Brings the store in line with the database: embeds new or replaced
+    images and drops deleted ones. With ``keys`` ([(kind, id)], e.g. from an
+    upload) only those rows are checked; otherwise every image is.
+    Returns counts of embedded, unchanged and removed rows.
+    """
+    store = get_store()
+    with store.writing():
+        _, stored = store._read()
+        known = {(int(kind), int(pk)): int(fingerprint) for kind, pk, fingerprint in stored if kind != TOMBSTONE}
+
+        if keys is None:
+            wanted = {kind: None for kind in SOURCES}
+        else:
+            wanted = {}
+            for kind, pk in keys:
+                wanted.setdefault(int(kind), set()).add(int(pk))
+
+        upserts, removals, unchanged = {}, set(), 0
+        for kind, ids in wanted.items():
+            queryset = SOURCES[kind].objects.exclude(image='').only('id', 'image')
+            if ids is not None:
+                queryset = queryset.filter(id__in=ids)
+            seen = set()
+            for instance in queryset.iterator():
+                key = (kind, instance.id)
+                seen.add(key)
+                fingerprint = _fingerprint(instance.image.name)
+                if known.get(key) == fingerprint:
+                    unchanged += 1
+                    continue
+                vector = _embed_field(instance.image)
+                if vector is None:
+                    removals.add(key)
+                else:
+                    upserts[key] = (fingerprint, vector)
+            candidates = {key for key in known if key[0] == kind and (ids is None or key[1] in ids)}
+            removals |= candidates - seen
+
+        store.write(upserts, removals)
+    return {'embedded': len(upserts), 'unchanged': unchanged, 'removed': len(removals & set(known))}
+
+
+def similar(image, limit=5, kinds=None):
+    """
+    The stored images that look most like ``image``: ``[(kind, id, score)]``.
+    """
+    return get_store().search(embed(image), limit=limit, kinds=kinds)
@@ -0,0 +1,187 @@
+import logging
+import os
+from io import BytesIO
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import F
+from django.urls import reverse
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from . import cache
+from .models import InspiredWork, PortfolioImage, Service, Stylist, User
+
+logger = logging.getLogger(__name__)
+
+# Widths every uploaded image is resized to, and the formats each width is
+# encoded in (Pillow format, quality). Images are never upscaled: a variant
+# wider than its original is the original size, re-encoded.
+VARIANT_WIDTHS = (160, 320, 640, 1280)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 80),
+    'jpeg': ('JPEG', 82),
+}
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+QUEUED_KEY_PREFIX = 'salon:image-variants-queued:'
+# How long an on-demand request waits before it may queue the same image again.
+QUEUE_DEDUP_SECONDS = 300
+
+# Every ImageField that gets variants, and so the only files the on-demand
+# view will render. Each model has a ``<field>_variants`` column naming the
+# image whose variants exist.
+IMAGE_FIELDS = {
+    Service: 'image',
+    Stylist: 'image',
+    User: 'profile_image',
+    PortfolioImage: 'image',
+    InspiredWork: 'image',
+}
+
+
+def source_model(name):
+    """
+    The model whose image field ``name`` was uploaded to, or None if it
+    isn't an original image (including a variant) of one.
+    """
+    if '__w' in os.path.basename(name):
+        return None
+    for model, field in IMAGE_FIELDS.items():
+        if name.startswith(model._meta.get_field(field).upload_to):
+            return model
+    return None
+
+
+def variant_name(name, width, format):
+    """
+    Variants live next to the original: ``a/b.png`` -> ``a/b__w320.webp``.
+    """
+    stem, _ = os.path.splitext(name)
+    return f'{stem}__w{width}.{EXTENSIONS[format]}'
+
+
+def _all_variants():
+    return [(width, format) for width in VARIANT_WIDTHS for format in VARIANT_FORMATS]
+
+
+def _render(image, width, format):
+    if image.width > width:
+        image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+    pillow_format, quality = VARIANT_FORMATS[format]
+    if format == 'jpeg' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+    output = BytesIO()
+    image.save(output, format=pillow_format, quality=quality, optimize=True)
+    return output.getvalue()
+
+
+def _save(storage, name, data):
+    # Straight to _save: a variant is named after its original, and
+    # HashedMediaStorage.save would rename one of an unhashed (legacy) file.
+    saved = storage._save(name, ContentFile(data))
+    if saved != name:
+        # Another worker wrote it first and the storage picked a new name.
+        storage.delete(saved)
+
+
+def generate_variants(name, storage=default_storage):
+    """
+    Writes whichever variants of the stored image ``name`` are missing.
+    Returns how many were written, or None if the image can't be read or
+    some variant still isn't stored afterwards.
+    """
+    missing = [(width, format) for width, format in _all_variants() if not storage.exists(variant_name(name, width, format))]
+    if missing:
+        try:
+            with storage.open(name, 'rb') as handle:
+                image = ImageOps.exif_transpose(Image.open(handle))
+                image.load()
+        except (OSError, UnidentifiedImageError) as exc:
+            logger.warning('Could not generate variants of %s: %s', name, exc)
+            return None
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or 'A' in image.getbands() else 'RGB')
+        for width, format in missing:
+            _save(storage, variant_name(name, width, format), _render(image, width, format))
+        if not all(storage.exists(variant_name(name, width, format)) for width, format in missing):
+            logger.warning('Variants of %s were not all stored', name)
+            return None
+    return len(missing)
+
+
+def mark_ready(model, name):
+    """
+    Records on every ``model`` row showing ``name`` that its variants exist.
+    Returns how many rows changed.
+    """
+    field = IMAGE_FIELDS[model]
+    return model.objects.filter(**{field: name}).exclude(**{f'{field}_variants': name}).update(**{f'{field}_variants': name})
+
+
+def variants_ready(field_file):
+    """
+    Whether the variants of an ImageField value exist, from its row alone.
+    """
+    model = field_file.instance._meta.concrete_model
+    return getattr(field_file.instance, f'{IMAGE_FIELDS[model]}_variants', None) == field_file.name
+
+
+def queue_variants(name, model=None):
+    """
+    Queues the variants of ``name`` unless that was done in the last
+    QUEUE_DEDUP_SECONDS, so repeated requests can't pile up renders.
+    Without a broker the task would run inline in the caller, so nothing is
+    queued: the row stays pending until ``render_image_variants`` runs.
+    """
+    if _eager():
+        return
+    if cache.get_cache().add(QUEUED_KEY_PREFIX + name, True, timeout=QUEUE_DEDUP_SECONDS):
+        from .tasks import generate_image_variants
+        generate_image_variants.delay(name, (model or source_model(name))._meta.label)
+
+
+def pending():
+    """
+    ``(model, name)`` for every stored image some row shows without
+    recording that its variants exist.
+    """
+    for model, field in IMAGE_FIELDS.items():
+        names = (
+            model.objects.filter(**{f'{field}__gt': ''}).exclude(**{f'{field}_variants': F(field)})
+            .values_list(field, flat=True).distinct()
+        )
+        for name in names:
+            yield model, name
+
+
+def _eager():
+    return getattr(settings, 'CELERY_TASK_ALWAYS_EAGER', False)
+
+
+def srcset(field_file, request):
+    """
+    ``{format: 'url 160w, url 320w, ...'}`` for an ImageField value, or None
+    if it's empty. Until the row records that the upload's variants exist,
+    the URLs point at the on-demand view, which redirects to the variant
+    requested once it's there and to the original until then.
+    """
+    if not field_file:
+        return None
+    name = field_file.name
+    ready = variants_ready(field_file)
+    result = {}
+    for format in VARIANT_FORMATS:
+        candidates = []
+        for width in VARIANT_WIDTHS:
+            if ready:
+                url = field_file.storage.url(variant_name(name, width, format))
+            else:
+                url = reverse('image-variant') + '?' + urlencode({'name': name, 'width': width, 'type': format})
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            candidates.append(f'{url} {width}w')
+        result[format] = ', '.join(candidates)
+    return result
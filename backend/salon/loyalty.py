@@ -0,0 +1,99 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Q, Sum
+
+from .models import LoyaltyPoint, LoyaltyTransaction
+
+
+class InsufficientPoints(Exception):
+    pass
+
+
+def _apply(customer, points, kind, appointment=None, description=''):
+    """
+    Appends a ledger row and moves the cached balance by the same amount in
+    one transaction. The balance is changed with a single UPDATE ... SET
+    points = points + n, so concurrent writers can't lose each other's updates.
+    """
+    with transaction.atomic():
+        entry = LoyaltyTransaction.objects.create(
+            customer=customer, kind=kind, points=points, appointment=appointment, description=description
+        )
+        updated = LoyaltyPoint.objects.filter(customer=customer).update(points=F('points') + points)
+        if not updated:
+            LoyaltyPoint.objects.get_or_create(customer=customer)
+            LoyaltyPoint.objects.filter(customer=customer).update(points=F('points') + points)
+    return entry
+
+
+def points_for_appointment(appointment):
+    # 1 point per currency unit actually charged.
+    price = appointment.final_price
+    if price is None:
+        # Booked before prices were recorded.
+        price = sum(service.price for service in appointment.services.all())
+    return int(price)
+
+
+def award_for_appointment(appointment):
+    """
+    Awards points for a completed appointment. Safe to call more than once:
+    the ledger allows a single award per appointment.
+    """
+    points = points_for_appointment(appointment)
+    if points <= 0:
+        return None
+    try:
+        return _apply(appointment.customer, points, 'award', appointment=appointment)
+    except IntegrityError:
+        return None
+
+
+def redeem(customer, amount, appointment=None, description=''):
+    """
+    Deducts ``amount`` points and returns the new balance. The balance check
+    and the deduction are one conditional UPDATE, so two concurrent
+    redemptions can never take the balance below zero.
+    """
+    with transaction.atomic():
+        updated = LoyaltyPoint.objects.filter(customer=customer, points__gte=amount).update(points=F('points') - amount)
+        if not updated:
+            raise InsufficientPoints()
+        LoyaltyTransaction.objects.create(
+            customer=customer, kind='redeem', points=-amount, appointment=appointment, description=description
+        )
+        return LoyaltyPoint.objects.values_list('points', flat=True).get(customer=customer)
+
+
+def compact_ledger(before, batch_size=1000):
+    """
+    Folds every customer's ledger rows created before ``before`` into a single
+    'snapshot' row dated at the newest row it replaces. Balances don't change.
+    Customers whose only such row is already a snapshot are left alone, so
+    repeated runs only touch customers with new rows to fold. The
+    one-award-per-appointment guarantee only covers the uncompacted window,
+    so keep ``before`` well past any appointment that could still be
+    re-completed. Returns how many rows the ledger shrank by.
+    """
+    old_rows = LoyaltyTransaction.objects.filter(created_at__lt=before)
+    customer_ids = list(
+        old_rows.order_by().values('customer_id')
+        .annotate(rows=Count('id'), snapshots=Count('id', filter=Q(kind='snapshot')))
+        .exclude(rows=1, snapshots=1)
+        .values_list('customer_id', flat=True)
+    )
+    removed = added = 0
+    for start in range(0, len(customer_ids), batch_size):
+        batch = customer_ids[start:start + batch_size]
+        with transaction.atomic():
+            rows = old_rows.filter(customer_id__in=batch)
+            totals = rows.order_by().values('customer_id').annotate(total=Sum('points'), latest=Max('created_at'))
+            snapshots = [
+                LoyaltyTransaction(
+                    customer_id=row['customer_id'], kind='snapshot', points=row['total'],
+                    created_at=row['latest'], description=f'Compacted before {before:%Y-%m-%d}'
+                )
+                for row in totals
+            ]
+            removed += rows.delete()[0]
+            added += len(LoyaltyTransaction.objects.bulk_create(snapshots))
+    return removed - added
@@ -0,0 +1,208 @@
+import json
+import random
+import time
+from datetime import date, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from salon import cache, synthetic
+from salon.authentication import tokens_for_user
+from salon.models import Service, Stylist, User
+
+PERCENTILES = (50, 95, 99)
+
+
+class Scenario:
+    """
+    One endpoint to drive: ``request(rng)`` returns ``(method, path, data)``.
+    Writes run in a transaction that is rolled back, so the data set stays
+    the same from run to run. ``count_queries`` is off for views whose work
+    happens on other threads, where the query capture can't see it.
+    """
+    def __init__(self, name, user, request, write=False, before=None, count_queries=True):
+        self.name = name
+        self.user = user
+        self.request = request
+        self.write = write
+        self.before = before
+        self.count_queries = count_queries
+
+
+class Command(BaseCommand):
+    help = (
+        "Drives the API in-process against the current database (see generate_synthetic_data) and reports "
+        "p50/p95/p99 latency and queries per request for each scenario. Can save the results as a baseline "
+        "and compare later runs against it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--scenario', action='append', help="Only run this scenario (repeatable).")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--save-baseline', metavar='PATH')
+        parser.add_argument('--baseline', metavar='PATH', help="Compare against a saved baseline.")
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help="Relative p95 slowdown counted as a regression when comparing (default 0.2).",
+        )
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        scenarios = self.build_scenarios()
+        if options['scenario']:
+            unknown = set(options['scenario']) - {scenario.name for scenario in scenarios}
+            if unknown:
+                raise CommandError(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+            scenarios = [scenario for scenario in scenarios if scenario.name in options['scenario']]
+
+        rng = random.Random(options['seed'])
+        results = {}
+        self.stdout.write(f"{'scenario':<24} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'4xx':>5}")
+        for scenario in scenarios:
+            result = self.run(scenario, rng, options['iterations'], options['warmup'])
+            results[scenario.name] = result
+            queries = '-' if result['queries'] is None else f"{result['queries']:g}"
+            self.stdout.write(
+                f"{scenario.name:<24} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} "
+                f"{queries:>8} {result['errors']:>5}"
+            )
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as handle:
+                json.dump({'iterations': options['iterations'], 'results': results}, handle, indent=2, sort_keys=True)
+            self.stdout.write(f"Saved baseline to {options['save_baseline']}.")
+        if options['baseline']:
+            regressions = self.compare(results, options['baseline'], options['tolerance'])
+            if regressions and options['fail_on_regression']:
+                raise SystemExit(1)
+
+    def build_scenarios(self):
+        customer = (
+            User.objects.filter(email=f'customer0@{synthetic.DOMAIN}').first()
+            or User.objects.filter(role='customer').first()
+        )
+        stylist = Stylist.objects.select_related('user').order_by('id').first()
+        admin = User.objects.filter(role='admin').first()
+        if not (customer and stylist and admin):
+            raise CommandError("Needs at least one customer, stylist and admin; run generate_synthetic_data first.")
+
+        services = list(Service.objects.filter(category__in=stylist.specialties.all()).values_list('id', flat=True))
+        if not services:
+            raise CommandError(f"Stylist {stylist.id} has no services.")
+        today = date.today()
+
+        def upcoming(rng):
+            return (today + timedelta(days=rng.randint(1, 21))).isoformat()
+
+        def book(rng):
+            # Past the generated schedule, so bookings succeed and go through
+            # stylist assignment rather than failing on conflicts.
+            day = today + timedelta(days=rng.randint(60, 120))
+            return 'post', '/api/salon/appointments/', {
+                'service_ids': [rng.choice(services)], 'appointment_date': day.isoformat(),
+                'appointment_time': f'{rng.randint(11, 14):02d}:{rng.choice((0, 30)):02d}',
+            }
+
+        return [
+            Scenario('stylist-list', None, lambda rng: ('get', '/api/salon/stylists/', None),
+                     before=lambda: cache.bump_version(Stylist)),
+            Scenario('stylist-list-cached', None, lambda rng: ('get', '/api/salon/stylists/', None)),
+            Scenario('availability', customer, lambda rng: (
+                'get', f'/api/salon/appointments/availability/?date={upcoming(rng)}&service_ids={rng.choice(services)}', None
+            )),
+            Scenario('availability-week', customer, lambda rng: (
+                'get', f'/api/salon/appointments/availability/?start_date={today + timedelta(days=1)}'
+                       f'&end_date={today + timedelta(days=7)}&service_ids={rng.choice(services)}', None
+            )),
+            Scenario('booking', customer, book, write=True),
+            Scenario('appointments-customer', customer, lambda rng: ('get', '/api/salon/appointments/', None)),
+            Scenario('appointments-stylist', stylist.user, lambda rng: ('get', '/api/salon/appointments/', None)),
+            Scenario('appointments-admin', admin, lambda rng: ('get', '/api/salon/appointments/?view=compact', None)),
+            # Password checks run on the login executor's threads.
+            Scenario('login', None, lambda rng: (
+                'post', '/api/salon/login/', {'email': customer.email, 'password': synthetic.PASSWORD}
+            ), count_queries=False),
+        ]
+
+    def host(self):
+        # The in-process client still goes through ALLOWED_HOSTS.
+        for host in settings.ALLOWED_HOSTS:
+            if host and host != '*' and not host.startswith('.'):
+                return host
+        return 'localhost'
+
+    def run(self, scenario, rng, iterations, warmup):
+        client = APIClient(HTTP_HOST=self.host())
+        if scenario.user is not None:
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens_for_user(scenario.user).access_token}')
+
+        latencies, queries, errors = [], [], 0
+        for i in range(warmup + iterations):
+            if scenario.before:
+                scenario.before()
+            method, path, data = scenario.request(rng)
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                if scenario.write:
+                    with transaction.atomic():
+                        response = getattr(client, method)(path, data, format='json')
+                        transaction.set_rollback(True)
+                else:
+                    response = getattr(client, method)(path, data, format='json')
+                elapsed = time.perf_counter() - started
+            if response.status_code >= 500:
+                raise CommandError(f"{scenario.name}: {method.upper()} {path} returned {response.status_code}.")
+            if i >= warmup:
+                latencies.append(elapsed * 1000)
+                queries.append(len(captured))
+                errors += response.status_code >= 400
+
+        p50, p95, p99 = np.percentile(latencies, PERCENTILES)
+        return {
+            'p50_ms': round(float(p50), 2),
+            'p95_ms': round(float(p95), 2),
+            'p99_ms': round(float(p99), 2),
+            'queries': float(np.median(queries)) if scenario.count_queries else None,
+            'errors': errors,
+        }
+
+    def compare(self, results, path, tolerance):
+        try:
+            with open(path) as handle:
+                baseline = json.load(handle)['results']
+        except (OSError, ValueError, KeyError) as exc:
+            raise CommandError(f"Can't read baseline {path}: {exc}")
+
+        self.stdout.write(f"\nAgainst {path}:")
+        regressions = []
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                self.stdout.write(f"{name:<24} (not in baseline)")
+                continue
+            deltas = ' '.join(
+                f"p{p} {100 * (result[f'p{p}_ms'] - before[f'p{p}_ms']) / before[f'p{p}_ms']:+.0f}%"
+                for p in PERCENTILES if before[f'p{p}_ms']
+            )
+            notes = []
+            if before['p95_ms'] and result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                notes.append('SLOWER')
+            if None not in (result['queries'], before['queries']) and result['queries'] > before['queries']:
+                notes.append(f"queries {before['queries']:g} -> {result['queries']:g}")
+            line = f"{name:<24} {deltas}"
+            if notes:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(f"{line}  {', '.join(notes)}"))
+            else:
+                self.stdout.write(line)
+        if regressions:
+            self.stderr.write(self.style.ERROR(f"{len(regressions)} scenario(s) regressed."))
+        else:
+            self.stdout.write(self.style.SUCCESS("No regressions."))
+        return regressions
@@ -0,0 +1,72 @@
+import asyncio
+import json
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncRequestFactory
+
+from salon.models import User
+from salon.onboarding import import_customers
+from salon.passwords import BoundedExecutor, set_login_executor
+from salon.views import LoginView
+
+PASSWORD = 'bench-password-123'
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures bulk-import throughput (process-pool hashing) and async login throughput "
+        "(bounded executor) at several worker counts. Creates throwaway users and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+        parser.add_argument('--users', type=int, default=400, help="Accounts to import per run.")
+        parser.add_argument('--logins', type=int, default=200, help="Concurrent logins per run.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'workers':>8} {'imports/sec':>12} {'logins/sec':>12}")
+        for workers in options['workers']:
+            domain = f'bench-{uuid.uuid4().hex[:8]}.invalid'
+            try:
+                imports = self.benchmark_import(workers, options['users'], domain)
+                logins = self.benchmark_login(workers, options['logins'], domain, options['users'])
+            finally:
+                User.objects.filter(email__endswith='@' + domain).delete()
+            self.stdout.write(f"{workers:>8} {imports:>12.1f} {logins:>12.1f}")
+
+    def benchmark_import(self, workers, count, domain):
+        rows = ({'email': f'user{i}@{domain}', 'password': PASSWORD} for i in range(count))
+        started = time.perf_counter()
+        created, _ = import_customers(rows, batch_size=500, workers=workers)
+        return created / (time.perf_counter() - started)
+
+    def benchmark_login(self, workers, count, domain, users):
+        factory = AsyncRequestFactory()
+        requests = [
+            factory.post(
+                '/api/salon/login/',
+                data=json.dumps({'email': f'user{i % users}@{domain}', 'password': PASSWORD}),
+                content_type='application/json',
+            )
+            for i in range(count)
+        ]
+        login_view = LoginView.as_view()
+        executor = BoundedExecutor(max_workers=workers, max_pending=count)
+        previous = set_login_executor(executor)
+
+        async def run():
+            return await asyncio.gather(*(login_view(request) for request in requests))
+
+        try:
+            started = time.perf_counter()
+            responses = asyncio.run(run())
+            elapsed = time.perf_counter() - started
+        finally:
+            set_login_executor(previous)
+            executor.shutdown()
+        failed = sum(response.status_code != 200 for response in responses)
+        if failed:
+            self.stderr.write(f"{failed} login(s) failed with {workers} worker(s).")
+        return count / elapsed
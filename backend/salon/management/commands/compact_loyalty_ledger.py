@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from salon.loyalty import compact_ledger
+
+
+class Command(BaseCommand):
+    help = "Folds loyalty ledger rows older than the retention window into one snapshot row per customer."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=getattr(settings, 'LOYALTY_LEDGER_RETENTION_DAYS', 365),
+            help="Keep individual rows for this many days (default: LOYALTY_LEDGER_RETENTION_DAYS).",
+        )
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['days'])
+        removed = compact_ledger(before)
+        self.stdout.write(self.style.SUCCESS(f"Compacted loyalty ledger before {before:%Y-%m-%d}: {removed} row(s) removed."))
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from salon import synthetic
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-generates a synthetic salon (stylists, customers, a year or so of appointments and reviews) "
+        f"for load testing. Accounts use the @{synthetic.DOMAIN} domain and the password '{synthetic.PASSWORD}'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stylists', type=int, default=20)
+        parser.add_argument('--customers', type=int, default=1000)
+        parser.add_argument('--days', type=int, default=90, help="Days of appointment history before today.")
+        parser.add_argument('--future-days', type=int, default=28, help="Days of upcoming appointments.")
+        parser.add_argument('--occupancy', type=float, default=0.55, help="Base chance a free slot gets booked.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--flush', action='store_true', help="Delete existing synthetic data first.")
+
+    def handle(self, *args, **options):
+        if options['flush']:
+            self.stdout.write(f"Deleted {synthetic.flush()} synthetic row(s).")
+
+        started = time.perf_counter()
+
+        def progress(day, counts):
+            if day.day == 1:
+                self.stdout.write(f"  {day:%Y-%m}: {counts['appointments']} appointments so far")
+
+        counts = synthetic.generate(
+            stylists=options['stylists'], customers=options['customers'], days=options['days'],
+            future_days=options['future_days'], occupancy=options['occupancy'], seed=options['seed'],
+            batch_size=options['batch_size'], progress=progress,
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {counts['stylists']} stylist(s), {counts['customers']} customer(s), "
+            f"{counts['appointments']} appointment(s) and {counts['reviews']} review(s) in {elapsed:.1f}s."
+        ))
@@ -0,0 +1,37 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from salon.onboarding import USER_FIELDS, import_customers
+from salon.passwords import default_workers
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-creates customer accounts from a CSV file with an 'email' column and optional "
+        "'password', 'first_name', 'last_name' and 'phone_number' columns. Existing emails are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--workers', type=int, default=default_workers(),
+            help="Processes to hash passwords on (default: one per CPU).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['csv_path'], newline='', encoding='utf-8-sig') as handle:
+                reader = csv.DictReader(handle)
+                if 'email' not in (reader.fieldnames or ()):
+                    raise CommandError("The CSV file needs an 'email' column.")
+                unknown = set(reader.fieldnames) - {'email', 'password', *USER_FIELDS}
+                if unknown:
+                    self.stderr.write(f"Ignoring column(s): {', '.join(sorted(unknown))}")
+                created, skipped = import_customers(
+                    reader, batch_size=options['batch_size'], workers=options['workers']
+                )
+        except OSError as exc:
+            raise CommandError(exc)
+        self.stdout.write(self.style.SUCCESS(f"Created {created} customer(s), skipped {skipped}."))
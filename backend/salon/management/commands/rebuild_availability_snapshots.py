@@ -0,0 +1,35 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from salon import snapshots
+
+
+class Command(BaseCommand):
+    help = "Recomputes the per-stylist daily busy bitmaps from the Appointment table and reports any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only report drift; don't write anything. Exits non-zero if drift is found.",
+        )
+        parser.add_argument('--since', help="Only days on or after this date (YYYY-MM-DD).")
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError(f"Invalid --since date: {options['since']}")
+
+        drifted = snapshots.rebuild(check=options['check'], since=since)
+        for stylist_id, day in drifted:
+            self.stdout.write(f"Stylist {stylist_id} on {day}: snapshot drifted")
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("No drift found."))
+        elif options['check']:
+            raise CommandError(f"{len(drifted)} stylist-day(s) drifted.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt availability snapshots for {len(drifted)} stylist-day(s)."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from salon import search
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the search documents for every stylist, service and inspired work."
+
+    def handle(self, *args, **options):
+        total = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} search document(s)."))
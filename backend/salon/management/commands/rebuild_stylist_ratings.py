@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from salon.models import Review, Stylist
+
+
+class Command(BaseCommand):
+    help = "Recomputes Stylist.rating_sum and review_count from the Review table and reports any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only report drift; don't write anything. Exits non-zero if drift is found.",
+        )
+
+    def handle(self, *args, **options):
+        totals = {
+            row['stylist_id']: (row['rating_sum'], row['review_count'])
+            for row in Review.objects.order_by().values('stylist_id').annotate(
+                rating_sum=Sum('rating'), review_count=Count('id')
+            )
+        }
+
+        drifted = []
+        with transaction.atomic():
+            stylists = Stylist.objects.select_for_update().only('id', 'rating_sum', 'review_count')
+            for stylist in stylists:
+                expected_sum, expected_count = totals.get(stylist.id, (0, 0))
+                if (stylist.rating_sum, stylist.review_count) == (expected_sum, expected_count):
+                    continue
+                self.stdout.write(
+                    f"Stylist {stylist.id}: rating_sum {stylist.rating_sum} -> {expected_sum}, "
+                    f"review_count {stylist.review_count} -> {expected_count}"
+                )
+                stylist.rating_sum = expected_sum
+                stylist.review_count = expected_count
+                drifted.append(stylist)
+
+            if drifted and not options['check']:
+                Stylist.objects.bulk_update(drifted, ['rating_sum', 'review_count'], batch_size=500)
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("No drift found."))
+        elif options['check']:
+            raise CommandError(f"{len(drifted)} stylist(s) drifted.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt rating aggregates for {len(drifted)} stylist(s)."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from salon import images
+from salon.tasks import generate_image_variants
+
+
+class Command(BaseCommand):
+    help = "Writes the resized variants of every uploaded image whose row doesn't record them yet. Without a broker, schedule this; uploads only leave their rows pending."
+
+    def handle(self, *args, **options):
+        rendered = failed = 0
+        for model, name in images.pending():
+            if generate_image_variants(name, model._meta.label) is None:
+                failed += 1
+            else:
+                rendered += 1
+        self.stdout.write(self.style.SUCCESS(f"Rendered variants of {rendered} images, {failed} failed."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from salon.embeddings import sync
+
+
+class Command(BaseCommand):
+    help = "Embeds every inspired-work and portfolio image not yet in the similarity store and drops deleted ones."
+
+    def handle(self, *args, **options):
+        counts = sync()
+        self.stdout.write(self.style.SUCCESS(
+            f"Embedded {counts['embedded']}, unchanged {counts['unchanged']}, removed {counts['removed']}."
+        ))
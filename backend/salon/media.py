@@ -0,0 +1,174 @@
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Files whose name doesn't carry their content hash may change.
+REVALIDATE_CACHE_CONTROL = 'public, max-age=0, must-revalidate'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+HASH_LENGTH = 16
+# ``a/b.<hash>.png``, possibly with the suffix FileSystemStorage adds to a
+# taken name, or a variant of it named after it (``a/b.<hash>__w320.webp``,
+# see images.variant_name), which is derived from the same content.
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{%d}(?:_[a-zA-Z0-9]{7})?(?:__w\d+)?\.[^./]+$' % HASH_LENGTH)
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks(CHUNK_SIZE):
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def is_hashed(name):
+    return HASHED_NAME_RE.search(name) is not None
+
+
+class HashedMediaStorage(FileSystemStorage):
+    """
+    FileSystemStorage that puts a hash of each file's content in its name
+    when it's saved (``a.jpg`` -> ``a.3f2a....jpg``), so a name, and the URL
+    built from it, always means the same bytes. serve_media marks such URLs
+    immutable, and building one costs no file access.
+    """
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        if not is_hashed(name):
+            stem, extension = os.path.splitext(name)
+            name = f'{stem}.{content_hash(content)}{extension}'
+        return super().save(name, content, max_length=max_length)
+
+
+def _parse_range(header, size):
+    """
+    ``(start, end)`` (inclusive) for a single-range ``Range`` header, None to
+    ignore it (absent, malformed or multi-range: all answered with the whole
+    file), or ``False`` if it can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def _iter_range(path, start, length):
+    with open(path, 'rb') as handle:
+        handle.seek(start)
+        while length > 0:
+            chunk = handle.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_media(request, path):
+    """
+    Serves a file under MEDIA_ROOT according to MEDIA_SERVE_MODE:
+
+    - ``django``: streams it, with single-range ``Range`` requests (206/416)
+      and ``If-Range`` handled.
+    - ``x-accel``: hands the transfer to nginx with ``X-Accel-Redirect``
+      pointing at MEDIA_ACCEL_PREFIX (an ``internal`` location, see
+      deploy/nginx-media.conf). nginx does the ranges itself.
+    - ``x-sendfile``: the same for Apache/lighttpd with ``X-Sendfile``.
+
+    All modes answer conditional requests (ETag / Last-Modified) with a 304
+    before touching the file's bytes. Files whose name carries their content
+    hash (see HashedMediaStorage) are marked immutable.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponse(status=405, headers={'Allow': 'GET, HEAD'})
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (ValueError, OSError):
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    last_modified = int(stat.st_mtime)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': IMMUTABLE_CACHE_CONTROL if is_hashed(path) else REVALIDATE_CACHE_CONTROL,
+        'Accept-Ranges': 'bytes',
+    }
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        for header, value in headers.items():
+            not_modified[header] = value
+        return not_modified
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    mode = getattr(settings, 'MEDIA_SERVE_MODE', 'django')
+
+    if mode in ('x-accel', 'x-sendfile'):
+        response = HttpResponse(content_type=content_type, headers=headers)
+        if mode == 'x-accel':
+            response['X-Accel-Redirect'] = quote(settings.MEDIA_ACCEL_PREFIX.rstrip('/') + '/' + path)
+        else:
+            response['X-Sendfile'] = full_path
+        return response
+
+    size = stat.st_size
+    byte_range = _parse_range(request.META.get('HTTP_RANGE'), size)
+    if byte_range is not None and not _if_range_matches(request, etag, last_modified):
+        byte_range = None
+    if byte_range is False:
+        response = HttpResponse(status=416, headers=headers)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type, headers=headers)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _iter_range(full_path, start, end - start + 1), status=206, content_type=content_type, headers=headers
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
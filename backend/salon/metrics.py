@@ -0,0 +1,288 @@
+import bisect
+import hmac
+import json
+import logging
+import random
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework import serializers
+
+from . import cache
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds / queries) of the histogram buckets; +Inf is implied.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+# Served by metrics_view (see glowapp_backend/urls.py); not itself measured.
+METRICS_PATH = '/metrics'
+
+_current = ContextVar('salon_request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    What one sampled request spent its time on. Cache lookups and
+    serializers report into whichever instance is current.
+    """
+    __slots__ = ('db_queries', 'db_time', 'serializer_time', 'cache_hits', 'cache_misses', '_serializing')
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        # Called by _time_query for queries made while this is current.
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += perf_counter() - started
+            self.db_queries += 1
+
+
+def record_cache(hit):
+    metrics = _current.get()
+    if metrics is not None:
+        if hit:
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+
+
+class TimedSerializer(serializers.Serializer):
+    """
+    Base for the app's serializers: adds ``to_representation`` time to the
+    current request's metrics. Nested serializers are counted once, as part
+    of their parent.
+    """
+    def to_representation(self, instance):
+        metrics = _current.get()
+        if metrics is None or metrics._serializing:
+            return super().to_representation(instance)
+        metrics._serializing = True
+        started = perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics._serializing = False
+            metrics.serializer_time += perf_counter() - started
+
+
+class TimedModelSerializer(TimedSerializer, serializers.ModelSerializer):
+    pass
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    """
+    Process-local per-endpoint histograms. Each worker process keeps its
+    own; Prometheus sums them across scrape targets.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.durations = {}
+            self.db_queries = {}
+            self.db_seconds = {}
+            self.serializer_seconds = {}
+
+    def _observe(self, series, labels, buckets, value):
+        histogram = series.get(labels)
+        if histogram is None:
+            histogram = series[labels] = Histogram(buckets)
+        histogram.observe(value)
+
+    def observe(self, labels, duration, metrics=None):
+        with self._lock:
+            self._observe(self.durations, labels, DURATION_BUCKETS, duration)
+            if metrics is not None:
+                self._observe(self.db_queries, labels, QUERY_BUCKETS, metrics.db_queries)
+                self._observe(self.db_seconds, labels, DURATION_BUCKETS, metrics.db_time)
+                self._observe(self.serializer_seconds, labels, DURATION_BUCKETS, metrics.serializer_time)
+
+    def render(self):
+        """
+        The histograms and cache counters in Prometheus text format.
+        """
+        lines = []
+        with self._lock:
+            for name, help_text, series in (
+                ('glowapp_request_duration_seconds', 'Wall time per request.', self.durations),
+                ('glowapp_request_db_queries', 'Database queries per sampled request.', self.db_queries),
+                ('glowapp_request_db_seconds', 'Database time per sampled request.', self.db_seconds),
+                ('glowapp_request_serializer_seconds', 'Serializer time per sampled request.', self.serializer_seconds),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for labels, histogram in sorted(series.items()):
+                    label_text = _labels(labels)
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{{label_text}}} {histogram.total}')
+                    lines.append(f'{name}_count{{{label_text}}} {histogram.count}')
+        counters = cache.stats.as_dict()
+        for kind in ('hits', 'misses'):
+            name = f'glowapp_catalog_cache_{kind}_total'
+            lines += [f'# TYPE {name} counter', f'{name} {counters[kind]}']
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    method, route, status = labels
+    escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'method="{escape(method)}",route="{escape(route)}",status="{status}"'
+
+
+registry = Registry()
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+class RequestMetricsMiddleware:
+    """
+    Times every request into the per-endpoint histograms and adds a
+    ``Server-Timing`` header. A METRICS_SAMPLE_RATE fraction of requests is
+    also instrumented in detail (DB queries and time, serializer time, cache
+    hits), which goes to the histograms and a JSON log line, and in DEBUG to
+    the header too: clients otherwise only see the total.
+    Unsampled requests only pay for two clock reads, a histogram update and
+    a context lookup per query.
+    Runs natively under both WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.path == METRICS_PATH:
+            return self.get_response(request)
+        metrics = self._sample()
+        started = perf_counter()
+        with _measuring(metrics):
+            response = self.get_response(request)
+        return self._record(request, response, metrics, perf_counter() - started)
+
+    async def __acall__(self, request):
+        if request.path == METRICS_PATH:
+            return await self.get_response(request)
+        metrics = self._sample()
+        started = perf_counter()
+        with _measuring(metrics):
+            response = await self.get_response(request)
+        return self._record(request, response, metrics, perf_counter() - started)
+
+    def _sample(self):
+        sample_rate = getattr(settings, 'METRICS_SAMPLE_RATE', 0.05)
+        return RequestMetrics() if sample_rate and random.random() < sample_rate else None
+
+    def _record(self, request, response, metrics, duration):
+        labels = (request.method, _route(request), response.status_code)
+        registry.observe(labels, duration, metrics)
+        timings = [f'total;dur={duration * 1000:.1f}']
+        if metrics is not None:
+            if settings.DEBUG:
+                timings += [
+                    f'db;desc="{metrics.db_queries} queries";dur={metrics.db_time * 1000:.1f}',
+                    f'serialize;dur={metrics.serializer_time * 1000:.1f}',
+                    f'cache;desc="{metrics.cache_hits} hits, {metrics.cache_misses} misses"',
+                ]
+            logger.info(json.dumps({
+                'method': request.method,
+                'route': labels[1],
+                'status': response.status_code,
+                'duration_ms': round(duration * 1000, 2),
+                'db_queries': metrics.db_queries,
+                'db_ms': round(metrics.db_time * 1000, 2),
+                'serializer_ms': round(metrics.serializer_time * 1000, 2),
+                'cache_hits': metrics.cache_hits,
+                'cache_misses': metrics.cache_misses,
+            }))
+        response['Server-Timing'] = ', '.join(timings)
+        return response
+
+
+@contextmanager
+def _measuring(metrics):
+    if metrics is None:
+        yield
+        return
+    token = _current.set(metrics)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def _time_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    """
+    Times every connection's queries into the current request's metrics.
+    Connections are per thread, and a sync view under ASGI runs in another
+    thread than the middleware, so the hook goes on each connection as it
+    opens and finds the request through the context variable, which
+    follows the view into that thread.
+    """
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. With METRICS_TOKEN set, it must be sent as a
+    bearer token. Without one it is only served in DEBUG.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        sent = request.headers.get('Authorization', '').encode()
+        if not hmac.compare_digest(sent, f'Bearer {token}'.encode()):
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.11 on 2026-10-17 23:33
+
+from django.db import migrations, models
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Review = apps.get_model('salon', 'Review')
+    Stylist = apps.get_model('salon', 'Stylist')
+    totals = Review.objects.order_by().values('stylist_id').annotate(
+        rating_sum=models.Sum('rating'), review_count=models.Count('id')
+    )
+    for row in totals:
+        Stylist.objects.filter(pk=row['stylist_id']).update(
+            rating_sum=row['rating_sum'], review_count=row['review_count']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0004_inspiredwork'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stylist',
+            name='rating_sum',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='stylist',
+            name='review_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
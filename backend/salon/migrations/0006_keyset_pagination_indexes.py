@@ -0,0 +1,29 @@
+# Generated by Django 4.2.11 on 2026-10-17 23:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0005_stylist_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['appointment_date', 'appointment_time', 'id'], name='appt_schedule_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['customer', 'appointment_date', 'appointment_time', 'id'], name='appt_customer_schedule_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['stylist', 'appointment_date', 'appointment_time', 'id'], name='appt_stylist_schedule_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['-created_at', '-id'], name='review_recent_idx'),
+        ),
+    ]
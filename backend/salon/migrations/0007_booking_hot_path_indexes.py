@@ -0,0 +1,25 @@
+# Generated by Django 4.2.11 on 2026-10-17 23:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0006_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('status__in', ('pending', 'approved', 'rescheduled'))), fields=['stylist', 'appointment_date', 'appointment_time'], name='appt_stylist_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='favoritestylist',
+            index=models.Index(fields=['customer', '-added_at'], name='favorite_customer_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['stylist', '-created_at'], name='review_stylist_recent_idx'),
+        ),
+    ]
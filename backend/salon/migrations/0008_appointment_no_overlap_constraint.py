@@ -0,0 +1,39 @@
+from django.db import migrations
+
+# Postgres-only backstop for salon.booking.lock_stylist_day: no two active
+# appointments for the same stylist may overlap. Other backends rely on the
+# lock alone (see booking.py).
+CREATE_CONSTRAINT = """
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+ALTER TABLE salon_appointment ADD CONSTRAINT appt_no_active_overlap EXCLUDE USING gist (
+    stylist_id WITH =,
+    tsrange(
+        appointment_date + appointment_time,
+        appointment_date + appointment_time + duration_minutes * interval '1 minute',
+        '[)'
+    ) WITH &&
+) WHERE (stylist_id IS NOT NULL AND status IN ('pending', 'approved', 'rescheduled'));
+"""
+
+DROP_CONSTRAINT = "ALTER TABLE salon_appointment DROP CONSTRAINT IF EXISTS appt_no_active_overlap;"
+
+
+def add_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_CONSTRAINT)
+
+
+def remove_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_CONSTRAINT)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0007_booking_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_constraint, remove_constraint),
+    ]
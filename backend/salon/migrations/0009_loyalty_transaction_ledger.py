@@ -0,0 +1,52 @@
+# Generated by Django 4.2.11 on 2026-10-17 23:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def open_ledger_with_current_balances(apps, schema_editor):
+    LoyaltyPoint = apps.get_model('salon', 'LoyaltyPoint')
+    LoyaltyTransaction = apps.get_model('salon', 'LoyaltyTransaction')
+    LoyaltyTransaction.objects.bulk_create(
+        [
+            LoyaltyTransaction(
+                customer_id=balance.customer_id, kind='snapshot', points=balance.points,
+                description='Opening balance'
+            )
+            for balance in LoyaltyPoint.objects.exclude(points=0).iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0008_appointment_no_overlap_constraint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoyaltyTransaction',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('award', 'Award'), ('redeem', 'Redeem'), ('referral_bonus', 'Referral Bonus'), ('expiry', 'Expiry'), ('snapshot', 'Snapshot')], max_length=20)),
+                ('points', models.IntegerField(help_text='Signed change to the balance')),
+                ('description', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('appointment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='loyalty_transactions', to='salon.appointment')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='loyalty_transactions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['customer', '-created_at', '-id'], name='loyalty_customer_recent_idx'), models.Index(fields=['created_at'], name='loyalty_created_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='loyaltytransaction',
+            constraint=models.UniqueConstraint(condition=models.Q(('kind', 'award')), fields=('appointment',), name='loyalty_one_award_per_appointment'),
+        ),
+        migrations.RunPython(open_ledger_with_current_balances, migrations.RunPython.noop),
+    ]
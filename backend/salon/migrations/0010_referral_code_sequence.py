@@ -0,0 +1,78 @@
+# Generated by Django 4.2.11 on 2026-10-17 23:47
+
+import re
+
+from django.db import migrations, models
+from django.db.models import F
+
+# Frozen copies of salon.referrals as of this migration, so later changes to
+# the code format can't change what it does.
+SEQUENCE_NAME = 'salon_referral_code_seq'
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+CHECK_LETTERS = 'ABCDEFGHJKMNPQRSTVWXYZ'
+TOKEN_WIDTH = 4
+MAX_PREFIX_LENGTH = 20
+
+
+def format_code(email, number):
+    token = ''
+    while number:
+        number, remainder = divmod(number, len(ALPHABET))
+        token = ALPHABET[remainder] + token
+    token = token.rjust(TOKEN_WIDTH, '0')
+    check = CHECK_LETTERS[sum((position + 1) * ALPHABET.index(char) for position, char in enumerate(token)) % len(CHECK_LETTERS)]
+    prefix = re.sub(r'[^A-Z0-9]', '', email.split('@')[0].upper())[:MAX_PREFIX_LENGTH]
+    return f'{prefix}-{token}{check}'
+
+
+def create_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'CREATE SEQUENCE IF NOT EXISTS {SEQUENCE_NAME}')
+
+
+def drop_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP SEQUENCE IF EXISTS {SEQUENCE_NAME}')
+
+
+def assign_missing_codes(apps, schema_editor):
+    # Users created before this migration only got a code on their second
+    # save; give the rest one now. Existing codes are left untouched.
+    User = apps.get_model('salon', 'User')
+    ReferralCodeCounter = apps.get_model('salon', 'ReferralCodeCounter')
+    connection = schema_editor.connection
+    users = list(User.objects.using(connection.alias).filter(referral_code__isnull=True).only('id', 'email'))
+    if not users:
+        return
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT nextval(%s) FROM generate_series(1, %s)', [SEQUENCE_NAME, len(users)])
+            numbers = [row[0] for row in cursor.fetchall()]
+    else:
+        counter, _ = ReferralCodeCounter.objects.using(connection.alias).get_or_create(pk=1)
+        ReferralCodeCounter.objects.using(connection.alias).filter(pk=1).update(value=F('value') + len(users))
+        numbers = range(counter.value + 1, counter.value + len(users) + 1)
+
+    for user, number in zip(users, numbers):
+        user.referral_code = format_code(user.email, number)
+    User.objects.using(connection.alias).bulk_update(users, ['referral_code'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0009_loyalty_transaction_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferralCodeCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_sequence, drop_sequence),
+        migrations.RunPython(assign_missing_codes, migrations.RunPython.noop),
+    ]
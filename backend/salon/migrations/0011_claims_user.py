@@ -0,0 +1,24 @@
+# Generated by Django 4.2.11 on 2026-10-18 00:08
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0010_referral_code_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaimsUser',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('salon.user',),
+        ),
+    ]
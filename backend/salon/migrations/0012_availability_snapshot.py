@@ -0,0 +1,67 @@
+# Generated by Django 4.2.11 on 2026-10-18 00:23
+
+from collections import defaultdict
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+ACTIVE_STATUSES = ('pending', 'approved', 'rescheduled')
+
+# Frozen copies of salon.snapshots as of this migration.
+SLOT_MINUTES = 5
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+BITMAP_BYTES = SLOTS_PER_DAY // 8
+
+
+def window_mask(start, duration):
+    first = max(start, 0) // SLOT_MINUTES
+    last = min(-(-(start + duration) // SLOT_MINUTES), SLOTS_PER_DAY)
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def encode(mask):
+    return mask.to_bytes(BITMAP_BYTES, 'little')
+
+
+def backfill_snapshots(apps, schema_editor):
+    Appointment = apps.get_model('salon', 'Appointment')
+    AvailabilitySnapshot = apps.get_model('salon', 'AvailabilitySnapshot')
+    alias = schema_editor.connection.alias
+    rows = Appointment.objects.using(alias).filter(
+        status__in=ACTIVE_STATUSES, stylist__isnull=False
+    ).values_list('stylist_id', 'appointment_date', 'appointment_time', 'duration_minutes')
+
+    masks = defaultdict(int)
+    for stylist_id, appointment_date, appointment_time, duration in rows.iterator():
+        start = appointment_time.hour * 60 + appointment_time.minute
+        masks[(stylist_id, appointment_date)] |= window_mask(start, duration)
+    AvailabilitySnapshot.objects.using(alias).bulk_create([
+        AvailabilitySnapshot(stylist_id=stylist_id, date=day, busy=encode(mask))
+        for (stylist_id, day), mask in masks.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0011_claims_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvailabilitySnapshot',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('busy', models.BinaryField()),
+                ('stylist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability_snapshots', to='salon.stylist')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='availabilitysnapshot',
+            constraint=models.UniqueConstraint(fields=('stylist', 'date'), name='availability_snapshot_stylist_date'),
+        ),
+        migrations.RunPython(backfill_snapshots, migrations.RunPython.noop),
+    ]
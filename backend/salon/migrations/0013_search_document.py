@@ -0,0 +1,110 @@
+# Generated by Django 4.2.11 on 2026-10-18 00:28
+
+from django.db import migrations, models
+
+# Frozen copies of salon.search as of this migration.
+FTS_TABLE = 'salon_searchdocument_fts'
+PG_VECTOR = "setweight(to_tsvector('english', title), 'A') || setweight(to_tsvector('english', body), 'B')"
+
+
+def stylist_document(stylist):
+    specialties = ' '.join(category.name for category in stylist.specialties.all())
+    name = f'{stylist.user.first_name} {stylist.user.last_name}'.strip()
+    return name, '\n'.join(part for part in (stylist.bio, specialties) if part)
+
+
+def service_document(service):
+    category = service.category.name if service.category else ''
+    return service.name, '\n'.join(part for part in (service.description, category) if part)
+
+
+def work_document(work):
+    return work.title, work.description or ''
+
+
+PG_CREATE = [f"CREATE INDEX search_document_vector_idx ON salon_searchdocument USING gin (({PG_VECTOR}))"]
+PG_DROP = ["DROP INDEX IF EXISTS search_document_vector_idx"]
+
+# An external-content FTS5 table over salon_searchdocument, kept current by
+# triggers, so writes only ever touch the document table. No porter stemmer:
+# it stems the prefix queries search.py sends ('balay' to 'balai'), which
+# then miss words they are the start of.
+SQLITE_CREATE = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        title, body, content='salon_searchdocument', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER salon_searchdocument_ai AFTER INSERT ON salon_searchdocument BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+    f"""CREATE TRIGGER salon_searchdocument_ad AFTER DELETE ON salon_searchdocument BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+    END""",
+    f"""CREATE TRIGGER salon_searchdocument_au AFTER UPDATE ON salon_searchdocument BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS salon_searchdocument_ai",
+    "DROP TRIGGER IF EXISTS salon_searchdocument_ad",
+    "DROP TRIGGER IF EXISTS salon_searchdocument_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def _execute(schema_editor, statements):
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def create_full_text_index(apps, schema_editor):
+    _execute(schema_editor, {'postgresql': PG_CREATE, 'sqlite': SQLITE_CREATE})
+
+
+def drop_full_text_index(apps, schema_editor):
+    _execute(schema_editor, {'postgresql': PG_DROP, 'sqlite': SQLITE_DROP})
+
+
+def backfill_documents(apps, schema_editor):
+    SearchDocument = apps.get_model('salon', 'SearchDocument')
+    alias = schema_editor.connection.alias
+    sources = [
+        ('stylist', apps.get_model('salon', 'Stylist').objects.using(alias)
+         .select_related('user').prefetch_related('specialties'), stylist_document),
+        ('service', apps.get_model('salon', 'Service').objects.using(alias)
+         .filter(is_active=True).select_related('category'), service_document),
+        ('inspired_work', apps.get_model('salon', 'InspiredWork').objects.using(alias), work_document),
+    ]
+    documents = []
+    for kind, queryset, document in sources:
+        for obj in queryset:
+            title, body = document(obj)
+            documents.append(SearchDocument(kind=kind, object_id=obj.pk, title=title[:255], body=body))
+    SearchDocument.objects.using(alias).bulk_create(documents, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0012_availability_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('stylist', 'Stylist'), ('service', 'Service'), ('inspired_work', 'Inspired work')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('body', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchdocument',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='search_document_kind_object'),
+        ),
+        migrations.RunPython(create_full_text_index, drop_full_text_index),
+        migrations.RunPython(backfill_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.11 on 2026-10-18 00:51
+
+from django.db import migrations, models
+
+
+def mark_unpriced(apps, schema_editor):
+    # Bookings made before pricing was recorded were left at the 0.00
+    # default. Ones that were priced to 0.00 got there through a discount.
+    Appointment = apps.get_model('salon', 'Appointment')
+    Appointment.objects.filter(final_price=0, discount=0).update(final_price=None)
+
+
+def unmark_unpriced(apps, schema_editor):
+    Appointment = apps.get_model('salon', 'Appointment')
+    Appointment.objects.filter(final_price=None).update(final_price=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0013_search_document'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='appointment',
+            name='final_price',
+            field=models.DecimalField(blank=True, decimal_places=2, default=None, max_digits=10, null=True),
+        ),
+        migrations.RunPython(mark_unpriced, unmark_unpriced),
+    ]
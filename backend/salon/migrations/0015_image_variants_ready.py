@@ -0,0 +1,38 @@
+# Generated by Django 4.2.11 on 2026-10-18 01:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0014_appointment_final_price_unpriced'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inspiredwork',
+            name='image_variants',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='portfolioimage',
+            name='image_variants',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='image_variants',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='stylist',
+            name='image_variants',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='profile_image_variants',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+    ]
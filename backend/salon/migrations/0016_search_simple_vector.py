@@ -0,0 +1,36 @@
+# Generated by Django 4.2.11 on 2026-10-18 03:12
+
+from django.db import migrations
+
+# Frozen copies of salon.search.PG_VECTOR before and after this migration.
+OLD_VECTOR = "setweight(to_tsvector('english', title), 'A') || setweight(to_tsvector('english', body), 'B')"
+NEW_VECTOR = (
+    "setweight(to_tsvector('english', title), 'A') || setweight(to_tsvector('english', body), 'B') || "
+    "setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B')"
+)
+
+
+def _reindex(schema_editor, vector):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS search_document_vector_idx")
+    schema_editor.execute(f"CREATE INDEX search_document_vector_idx ON salon_searchdocument USING gin (({vector}))")
+
+
+def index_simple_vector(apps, schema_editor):
+    _reindex(schema_editor, NEW_VECTOR)
+
+
+def index_english_vector(apps, schema_editor):
+    _reindex(schema_editor, OLD_VECTOR)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon', '0015_image_variants_ready'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_simple_vector, index_english_vector),
+    ]
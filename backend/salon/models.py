@@ -1,7 +1,10 @@
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.db import models
+from django.db.models import OuterRef, Q
+from django.db.models.functions import Cast, Coalesce, ExtractHour, ExtractMinute, NullIf
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
+from datetime import time
 import uuid
 
 # Custom User Manager
@@ -39,6 +42,8 @@ class User(AbstractUser):
     phone_number = models.CharField(max_length=20, blank=True, null=True)
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='customer')
     profile_image = models.ImageField(upload_to='profile_images/', blank=True, null=True)
+    # Name of the image whose resized variants exist (see images.py).
+    profile_image_variants = models.CharField(max_length=100, blank=True, default='', editable=False)
     username = None
     referral_code = models.CharField(max_length=50, unique=True, blank=True, null=True)
 
@@ -51,23 +56,42 @@ class User(AbstractUser):
         return self.email
 
     def save(self, *args, **kwargs):
-        # Generate a referral code only if the user has an ID and no referral code yet.
-        if not self.referral_code and self.pk:
-            # Create a base code from the user's email and ID.
-            base_code = self.email.split('@')[0].replace('.', '').upper()
-            self.referral_code = f"{base_code}{self.pk}"
-            
-            # Ensure the code is unique, appending a number if necessary.
-            counter = 1
-            while User.objects.filter(referral_code=self.referral_code).exclude(pk=self.pk).exists():
-                self.referral_code = f"{base_code}{self.pk}-{counter}"
-                counter += 1
+        # Codes come from a sequence (see referrals.py), so new users get one
+        # in the same INSERT instead of a second save after the pk is known.
+        # Existing codes, including the legacy email-prefix + pk ones, are kept.
+        update_fields = kwargs.get('update_fields')
+        if not self.referral_code and (update_fields is None or 'referral_code' in update_fields):
+            from .referrals import allocate_codes
+            self.referral_code = allocate_codes([self.email], using=kwargs.get('using') or 'default')[0]
         super().save(*args, **kwargs)
 
     class Meta:
         verbose_name = 'User'
         verbose_name_plural = 'Users'
 
+
+class ClaimsUser(User):
+    """
+    The request user TokenUserAuthentication builds from access-token claims
+    (salon/authentication.py): only ``id`` and ``role`` are loaded, plus a
+    ``stylist_id`` attribute. The first access to any other field fills them
+    all from the short-lived user cache instead of a query per field.
+    """
+    class Meta:
+        proxy = True
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        if fields is None:
+            return super().refresh_from_db(using=using, fields=fields, **kwargs)
+        from .authentication import get_cached_user
+        user = get_cached_user(self.pk)
+        if user is None:
+            raise User.DoesNotExist('User matching claims no longer exists.')
+        deferred = self.get_deferred_fields()
+        for field in self._meta.concrete_fields:
+            if field.attname in deferred:
+                setattr(self, field.attname, getattr(user, field.attname))
+
 # New Category Model
 class Category(models.Model):
     name = models.CharField(max_length=50, unique=True)
@@ -86,11 +110,40 @@ class Service(models.Model):
     duration_minutes = models.IntegerField(default=30, validators=[MinValueValidator(1)])
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='services')
     image = models.ImageField(upload_to='service_images/', blank=True, null=True)
+    # Name of the image whose resized variants exist (see images.py).
+    image_variants = models.CharField(max_length=100, blank=True, default='', editable=False)
     is_active = models.BooleanField(default=True)
 
     def __str__(self):
         return self.name
 
+class StylistQuerySet(models.QuerySet):
+    def with_listing_data(self, user=None):
+        """
+        Annotates whether ``user`` favorited each stylist and prefetches the
+        related rows StylistSerializer renders, so listing stylists costs a
+        fixed number of queries.
+        """
+        queryset = self.select_related('user').prefetch_related(
+            'specialties',
+            models.Prefetch('portfolio_images', queryset=PortfolioImage.objects.order_by('id')),
+        )
+        if user is not None and user.is_authenticated:
+            return queryset.annotate(
+                user_has_favorited=models.Exists(FavoriteStylist.objects.filter(stylist=OuterRef('pk'), customer=user))
+            )
+        return queryset.annotate(user_has_favorited=models.Value(False))
+
+    def order_by_rating(self, descending=True):
+        rating = Coalesce(
+            Cast('rating_sum', models.FloatField()) / NullIf('review_count', 0),
+            models.Value(0.0),
+        )
+        queryset = self.annotate(rating_value=rating)
+        if descending:
+            return queryset.order_by('-rating_value', '-review_count', 'id')
+        return queryset.order_by('rating_value', 'review_count', 'id')
+
 class Stylist(models.Model):
     id = models.BigAutoField(primary_key=True)
     user = models.OneToOneField('User', on_delete=models.CASCADE, limit_choices_to={'role': 'stylist'})
@@ -101,13 +154,29 @@ class Stylist(models.Model):
     is_available = models.BooleanField(default=True)
     is_featured = models.BooleanField(default=False)
     image = models.ImageField(upload_to='stylist_images/', blank=True, null=True)
+    # Name of the image whose resized variants exist (see images.py).
+    image_variants = models.CharField(max_length=100, blank=True, default='', editable=False)
+    # Running totals over this stylist's reviews, kept in sync by the Review
+    # signals in signals.py. `manage.py rebuild_stylist_ratings` repairs drift.
+    rating_sum = models.IntegerField(default=0, editable=False)
+    review_count = models.IntegerField(default=0, editable=False)
+
+    objects = StylistQuerySet.as_manager()
 
     def __str__(self):
         return self.user.get_full_name() or self.user.email
 
+    @property
+    def average_rating(self):
+        if not self.review_count:
+            return 0.0
+        return self.rating_sum / self.review_count
+
 class InspiredWork(models.Model):
     id = models.BigAutoField(primary_key=True)
     image = models.ImageField(upload_to='inspired_work/')
+    # Name of the image whose resized variants exist (see images.py).
+    image_variants = models.CharField(max_length=100, blank=True, default='', editable=False)
     title = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -120,12 +189,42 @@ class PortfolioImage(models.Model):
     id = models.BigAutoField(primary_key=True)
     stylist = models.ForeignKey(Stylist, on_delete=models.CASCADE, related_name='portfolio_images')
     image = models.ImageField(upload_to='portfolio_images/')
+    # Name of the image whose resized variants exist (see images.py).
+    image_variants = models.CharField(max_length=100, blank=True, default='', editable=False)
     description = models.CharField(max_length=255, blank=True, null=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f'Portfolio for {self.stylist.user.first_name} - {self.id}'
 
+# Statuses that still hold a stylist's time slot.
+ACTIVE_APPOINTMENT_STATUSES = ('pending', 'approved', 'rescheduled')
+
+class AppointmentQuerySet(models.QuerySet):
+    def active(self):
+        # Keep this filter literal: it is what lets appt_stylist_active_idx match.
+        return self.filter(status__in=ACTIVE_APPOINTMENT_STATUSES)
+
+    def overlapping(self, appointment_date, start_time, duration_minutes):
+        """
+        Active appointments on ``appointment_date`` that overlap the window of
+        ``duration_minutes`` starting at ``start_time``.
+
+        End times are compared as minutes since midnight rather than with
+        time + interval arithmetic, which SQLite can't do and which wraps
+        around midnight on Postgres.
+        """
+        start_minutes = start_time.hour * 60 + start_time.minute
+        end_minutes = start_minutes + duration_minutes
+        queryset = self.active().filter(appointment_date=appointment_date)
+        if end_minutes < 24 * 60:
+            queryset = queryset.filter(appointment_time__lt=time(end_minutes // 60, end_minutes % 60))
+        return queryset.annotate(
+            existing_appointment_end_minutes=(
+                ExtractHour('appointment_time') * 60 + ExtractMinute('appointment_time') + models.F('duration_minutes')
+            )
+        ).filter(existing_appointment_end_minutes__gt=start_minutes)
+
 class Appointment(models.Model):
     STATUS_CHOICES = (
         ('pending', 'Pending'),
@@ -147,14 +246,79 @@ class Appointment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     discount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
-    final_price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    # None until the booking is priced (see pricing.py); 0.00 is a free booking.
+    final_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, default=None)
+
+    objects = AppointmentQuerySet.as_manager()
 
     class Meta:
         ordering = ['appointment_date', 'appointment_time']
+        # Match the keyset pagination ordering (ordering + pk) for the admin,
+        # stylist and customer appointment listings.
+        indexes = [
+            models.Index(fields=['appointment_date', 'appointment_time', 'id'], name='appt_schedule_idx'),
+            models.Index(fields=['customer', 'appointment_date', 'appointment_time', 'id'], name='appt_customer_schedule_idx'),
+            models.Index(fields=['stylist', 'appointment_date', 'appointment_time', 'id'], name='appt_stylist_schedule_idx'),
+            # Conflict detection and availability only ever look at bookings
+            # that still hold a slot. Queries must filter on exactly
+            # ACTIVE_APPOINTMENT_STATUSES for the planner to pick this up.
+            models.Index(
+                fields=['stylist', 'appointment_date', 'appointment_time'],
+                condition=Q(status__in=ACTIVE_APPOINTMENT_STATUSES),
+                name='appt_stylist_active_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.customer.email} with {self.stylist.user.get_full_name() or self.stylist.user.email} on {self.appointment_date} at {self.appointment_time}'
 
+class AvailabilitySnapshot(models.Model):
+    """
+    A stylist's booked time on one day as a bitmap of 5-minute slots (bit n
+    covers minutes 5n to 5n+5), kept in step with their active appointments
+    by the signals in signals.py. See salon/snapshots.py.
+    """
+    id = models.BigAutoField(primary_key=True)
+    stylist = models.ForeignKey(Stylist, on_delete=models.CASCADE, related_name='availability_snapshots')
+    date = models.DateField()
+    busy = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['stylist', 'date'], name='availability_snapshot_stylist_date'),
+        ]
+
+    def __str__(self):
+        return f'{self.stylist_id} on {self.date}'
+
+class SearchDocument(models.Model):
+    """
+    The searchable text of one stylist, service or piece of inspired work,
+    kept in sync by the signals in signals.py. Migration 0013 indexes it: a
+    GIN index over its weighted tsvector on Postgres, or an FTS5 table fed
+    by triggers on SQLite. On SQLite, a migration that rebuilds this table
+    drops those triggers and must recreate them. See salon/search.py.
+    """
+    KIND_CHOICES = (
+        ('stylist', 'Stylist'),
+        ('service', 'Service'),
+        ('inspired_work', 'Inspired work'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    title = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='search_document_kind_object'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.object_id}'
+
 class Review(models.Model):
     id = models.BigAutoField(primary_key=True)
     appointment = models.OneToOneField(Appointment, on_delete=models.CASCADE, related_name='review')
@@ -167,6 +331,10 @@ class Review(models.Model):
     class Meta:
         unique_together = ('appointment', 'customer')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='review_recent_idx'),
+            models.Index(fields=['stylist', '-created_at'], name='review_stylist_recent_idx'),
+        ]
 
     def __str__(self):
         return f'Review for {self.stylist.user.get_full_name() or self.stylist.user.email} by {self.customer.email}'
@@ -200,6 +368,41 @@ class LoyaltyPoint(models.Model):
     def __str__(self):
         return f'{self.customer.email}: {self.points} points'
 
+class LoyaltyTransaction(models.Model):
+    """
+    Append-only ledger behind LoyaltyPoint.points. Rows are only ever added
+    (see loyalty.py); compaction folds old rows into a single 'snapshot' row
+    per customer without changing the sum.
+    """
+    KIND_CHOICES = (
+        ('award', 'Award'),
+        ('redeem', 'Redeem'),
+        ('referral_bonus', 'Referral Bonus'),
+        ('expiry', 'Expiry'),
+        ('snapshot', 'Snapshot'),
+    )
+    id = models.BigAutoField(primary_key=True)
+    customer = models.ForeignKey('User', on_delete=models.CASCADE, related_name='loyalty_transactions')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    points = models.IntegerField(help_text="Signed change to the balance")
+    appointment = models.ForeignKey(Appointment, on_delete=models.SET_NULL, null=True, blank=True, related_name='loyalty_transactions')
+    description = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['customer', '-created_at', '-id'], name='loyalty_customer_recent_idx'),
+            models.Index(fields=['created_at'], name='loyalty_created_idx'),
+        ]
+        constraints = [
+            # An appointment can only ever earn points once.
+            models.UniqueConstraint(fields=['appointment'], condition=Q(kind='award'), name='loyalty_one_award_per_appointment'),
+        ]
+
+    def __str__(self):
+        return f'{self.customer.email}: {self.points:+d} ({self.kind})'
+
 class FavoriteStylist(models.Model):
     id = models.BigAutoField(primary_key=True)
     customer = models.ForeignKey('User', on_delete=models.CASCADE, limit_choices_to={'role': 'customer'}, related_name='favorite_stylists_customer')
@@ -207,8 +410,12 @@ class FavoriteStylist(models.Model):
     added_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
+        # unique_together already indexes (customer, stylist) lookups.
         unique_together = ('customer', 'stylist')
         ordering = ['-added_at']
+        indexes = [
+            models.Index(fields=['customer', '-added_at'], name='favorite_customer_recent_idx'),
+        ]
 
     def __str__(self):
         return f'{self.customer.email} favorited {self.stylist.user.first_name}'
@@ -222,6 +429,15 @@ class SalonSetting(models.Model):
     def __str__(self):
         return self.key
 
+class ReferralCodeCounter(models.Model):
+    """
+    Single-row counter behind referral codes on backends without sequences.
+    """
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return str(self.value)
+
 class Referral(models.Model):
     id = models.BigAutoField(primary_key=True)
     referrer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='referrals_made')
@@ -0,0 +1,72 @@
+from itertools import islice
+
+from django.db import transaction
+
+from .models import User
+from .passwords import hash_passwords, hash_pool
+from .referrals import allocate_codes
+
+USER_FIELDS = ('first_name', 'last_name', 'phone_number')
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def import_customers(rows, batch_size=1000, workers=1):
+    """
+    Creates customer accounts from ``rows`` (dicts with ``email`` and
+    optionally ``password`` and the USER_FIELDS) with ``bulk_create``, a batch
+    per transaction. Emails that already have an account, or repeat within
+    ``rows``, are skipped. Rows without a password get an unusable one, so
+    those customers sign in through password reset. With ``workers`` > 1,
+    passwords are hashed on a process pool of that size.
+
+    Returns ``(created, skipped)``.
+    """
+    pool = hash_pool(workers) if workers > 1 else None
+    try:
+        return _import(rows, batch_size, pool)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def _import(rows, batch_size, pool):
+    created = skipped = 0
+    seen = set()
+    for batch in _batches(rows, batch_size):
+        by_email = {}
+        for row in batch:
+            email = User.objects.normalize_email((row.get('email') or '').strip())
+            if not email or email in seen:
+                skipped += 1
+                continue
+            seen.add(email)
+            by_email[email] = row
+
+        existing = set(User.objects.filter(email__in=list(by_email)).values_list('email', flat=True))
+        new_rows = [(email, row) for email, row in by_email.items() if email not in existing]
+        skipped += len(by_email) - len(new_rows)
+        if not new_rows:
+            continue
+
+        # Hash before opening the transaction: it's the slow part.
+        passwords = hash_passwords((row.get('password') for _, row in new_rows), pool=pool)
+        with transaction.atomic():
+            codes = allocate_codes(email for email, _ in new_rows)
+            users = [
+                User(
+                    email=email,
+                    password=password,
+                    role='customer',
+                    referral_code=code,
+                    **{field: row.get(field) or '' for field in USER_FIELDS},
+                )
+                for (email, row), password, code in zip(new_rows, passwords, codes)
+            ]
+            User.objects.bulk_create(users, batch_size=batch_size)
+        created += len(users)
+    return created, skipped
@@ -0,0 +1,204 @@
+import base64
+import json
+from collections import OrderedDict
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q
+from django.utils.encoding import force_str
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def _encode_value(value):
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class LinkPagination(BasePagination):
+    """
+    The parts shared by the paginators below: a ``page_size`` parameter and
+    responses that link to the neighbouring pages rather than counting rows.
+    """
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class KeysetPagination(LinkPagination):
+    """
+    Keyset ("seek") pagination over the queryset's own ordering.
+
+    The ordering comes from the queryset (``order_by()`` or ``Meta.ordering``)
+    with the primary key appended as a tie-breaker. The opaque ``cursor``
+    parameter holds the ordering values of the last row served, and the next
+    page is fetched with a lexicographic ``WHERE (a, b, pk) > (x, y, z)``, so
+    every page costs the same regardless of depth and no COUNT(*) is issued.
+    A composite index matching the ordering makes each page an index range scan.
+
+    Ordering fields must be non-null model fields (``__`` lookups are fine).
+    """
+    page_size = api_settings.PAGE_SIZE or 50
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+
+        values, reverse = self.decode_cursor(request)
+        ordering = self._flip(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._seek_filter(ordering, values))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.page = rows
+        if reverse:
+            self.has_next = values is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = values is not None
+        return rows
+
+    def get_ordering(self, queryset):
+        ordering = list(queryset.query.order_by)
+        if not ordering and queryset.query.default_ordering:
+            ordering = list(queryset.model._meta.ordering)
+        if not all(isinstance(field, str) for field in ordering):
+            raise ImproperlyConfigured('KeysetPagination only supports ordering by field names.')
+        ordering = [field for field in ordering if field.lstrip('-') not in ('pk', 'id')]
+        descending = bool(ordering) and ordering[-1].startswith('-')
+        return ordering + ['-pk' if descending else 'pk']
+
+    def _flip(self, ordering):
+        return [field[1:] if field.startswith('-') else '-' + field for field in ordering]
+
+    def _seek_filter(self, ordering, values):
+        if len(values) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+        condition = Q()
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            clause = Q(**{f'{name}__{lookup}': values[index]})
+            for previous_field, previous_value in zip(ordering[:index], values[:index]):
+                clause &= Q(**{previous_field.lstrip('-'): previous_value})
+            condition |= clause
+        return condition
+
+    def _row_values(self, row):
+        values = []
+        for field in self.ordering:
+            value = row
+            for attr in field.lstrip('-').split('__'):
+                value = getattr(value, attr)
+            values.append(_encode_value(value))
+        return values
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            return list(payload['v']), bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, values, reverse):
+        payload = json.dumps({'v': values, 'r': 1 if reverse else 0}, separators=(',', ':'))
+        encoded = force_str(base64.urlsafe_b64encode(payload.encode('utf-8')))
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self._row_values(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self._row_values(self.page[0]), reverse=True)
+
+
+class SearchPagination(LinkPagination):
+    """
+    Offset pagination for ranked search results, which have no column
+    ordering for KeysetPagination to seek on. Fetches one row past the page to
+    tell whether there's another, so a page is one query and no COUNT(*) is
+    issued. Paginates anything sliceable, such as search.Results.
+    """
+    page_size = 20
+    max_page_size = 50
+    offset_query_param = 'offset'
+
+    def paginate_queryset(self, results, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        try:
+            self.offset = _positive_int(request.query_params.get(self.offset_query_param, 0))
+        except ValueError:
+            self.offset = 0
+
+        rows = list(results[self.offset:self.offset + self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        return rows[:self.page_size]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self.base_url, self.offset_query_param, self.offset + self.page_size)
+
+    def get_previous_link(self):
+        if not self.offset:
+            return None
+        previous = max(self.offset - self.page_size, 0)
+        if not previous:
+            return remove_query_param(self.base_url, self.offset_query_param)
+        return replace_query_param(self.base_url, self.offset_query_param, previous)
@@ -0,0 +1,131 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import close_old_connections
+
+
+class ExecutorBusy(Exception):
+    pass
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def _init_hash_worker(settings_module):
+    # Under the 'spawn' start method (macOS, Windows) workers start without
+    # Django configured; under 'fork' this is a no-op.
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+def _hash_chunk(passwords):
+    return [make_password(password) for password in passwords]
+
+
+def hash_pool(workers=None):
+    """
+    A process pool ready to hash passwords. PBKDF2 is CPU-bound, so bulk
+    imports scale with cores instead of queuing on one.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers or default_workers(),
+        initializer=_init_hash_worker,
+        initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'glowapp_backend.settings'),),
+    )
+
+
+def hash_passwords(passwords, pool=None, chunk_size=64):
+    """
+    ``make_password`` for each of ``passwords``, in order. Empty passwords
+    become unusable ones in this process; the rest are hashed on ``pool``
+    (or here, if there isn't one).
+    """
+    passwords = list(passwords)
+    hashed = [None] * len(passwords)
+    to_hash = []
+    for index, password in enumerate(passwords):
+        if password:
+            to_hash.append(index)
+        else:
+            hashed[index] = make_password(None)
+
+    if pool is None:
+        results = _hash_chunk([passwords[index] for index in to_hash])
+    else:
+        chunks = [
+            [passwords[index] for index in to_hash[start:start + chunk_size]]
+            for start in range(0, len(to_hash), chunk_size)
+        ]
+        results = [password for chunk in pool.map(_hash_chunk, chunks) for password in chunk]
+
+    for index, password in zip(to_hash, results):
+        hashed[index] = password
+    return hashed
+
+
+class BoundedExecutor:
+    """
+    Runs blocking calls (password checks, mostly) off the event loop on a
+    fixed number of threads. hashlib releases the GIL during PBKDF2, so the
+    threads hash in parallel while the loop keeps serving other requests.
+    Once ``max_pending`` calls are queued or running, new ones fail fast
+    with ExecutorBusy instead of piling up behind them.
+    """
+    def __init__(self, max_workers, max_pending):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='salon-login')
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    async def run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise ExecutorBusy()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, _with_db, func, *args)
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def _with_db(func, *args):
+    # Executor threads outlive requests, so they don't get the request
+    # signals that normally recycle database connections.
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+_login_executor = None
+_login_executor_lock = threading.Lock()
+
+
+def get_login_executor():
+    global _login_executor
+    with _login_executor_lock:
+        if _login_executor is None:
+            _login_executor = BoundedExecutor(
+                max_workers=getattr(settings, 'LOGIN_HASH_WORKERS', None) or default_workers(),
+                max_pending=getattr(settings, 'LOGIN_MAX_PENDING', 256),
+            )
+        return _login_executor
+
+
+def set_login_executor(executor):
+    """
+    Replaces the shared login executor (for benchmarks and tests) and returns
+    the previous one.
+    """
+    global _login_executor
+    with _login_executor_lock:
+        previous, _login_executor = _login_executor, executor
+    return previous
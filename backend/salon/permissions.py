@@ -20,12 +20,12 @@ class IsOwnerOrAdmin(permissions.BasePermission):
             return True
         
         # Check if the object has a 'customer' and if it matches the request user
-        if hasattr(obj, 'customer'):
-            return obj.customer == request.user
+        if hasattr(obj, 'customer_id'):
+            return obj.customer_id == request.user.pk
         
         # Check if the object has a 'user' (like Stylist model) and if it matches
-        if hasattr(obj, 'user'):
-            return obj.user == request.user
+        if hasattr(obj, 'user_id'):
+            return obj.user_id == request.user.pk
             
         return False
 
@@ -41,8 +41,8 @@ class IsOwner(permissions.BasePermission):
     Custom permission to only allow the owner of an object to access it.
     """
     def has_object_permission(self, request, view, obj):
-        if hasattr(obj, 'customer'):
-            return obj.customer == request.user
-        if hasattr(obj, 'user'): # Fallback for other user-linked models
-            return obj.user == request.user
+        if hasattr(obj, 'customer_id'):
+            return obj.customer_id == request.user.pk
+        if hasattr(obj, 'user_id'): # Fallback for other user-linked models
+            return obj.user_id == request.user.pk
         return False
@@ -0,0 +1,154 @@
+import bisect
+import threading
+import time
+from dataclasses import dataclass
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import cache
+from .models import Appointment, LoyaltyPoint, Promotion
+
+CENT = Decimal('0.01')
+ZERO = Decimal('0.00')
+# Appointments in these states don't count as a customer's earlier booking.
+NOT_BOOKED = ('cancelled', 'rejected')
+
+
+@dataclass(frozen=True)
+class Quote:
+    subtotal: Decimal
+    discount: Decimal
+    final_price: Decimal
+    promotion: Promotion = None
+    # Loyalty points the discount costs; only for loyalty_redemption.
+    points: int = 0
+
+
+def _money(value):
+    return Decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def discount_for(promotion, subtotal):
+    if promotion.promo_type == 'percentage':
+        amount = subtotal * promotion.discount_value / 100
+    else:
+        # first_time, fixed_amount and loyalty_redemption are amounts off.
+        amount = promotion.discount_value
+    return min(_money(amount), subtotal)
+
+
+def points_for_discount(discount):
+    return int((discount * getattr(settings, 'LOYALTY_POINTS_PER_UNIT', 10)).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+class PromotionIndex:
+    """
+    Active promotions, grouped by type and sorted by minimum_booking_price,
+    so a quote only looks at promotions whose threshold the subtotal meets.
+    Promotions that haven't started yet are included and filtered by their
+    validity window at quote time, so the index stays correct as time passes.
+    """
+    def __init__(self, promotions):
+        self.by_type = {}
+        for promotion in sorted(promotions, key=lambda promotion: (promotion.minimum_booking_price, promotion.id)):
+            thresholds, rows = self.by_type.setdefault(promotion.promo_type, ([], []))
+            thresholds.append(promotion.minimum_booking_price)
+            rows.append(promotion)
+
+    @classmethod
+    def build(cls, now=None):
+        now = now or timezone.now()
+        return cls(Promotion.objects.filter(is_active=True).filter(Q(valid_until__isnull=True) | Q(valid_until__gt=now)))
+
+    def has(self, promo_type):
+        return promo_type in self.by_type
+
+    def candidates(self, promo_type, subtotal, now):
+        thresholds, rows = self.by_type.get(promo_type, ((), ()))
+        for promotion in rows[:bisect.bisect_right(thresholds, subtotal)]:
+            if promotion.valid_from <= now and (promotion.valid_until is None or now < promotion.valid_until):
+                yield promotion
+
+    def quote(self, subtotal, first_booking=False, loyalty_balance=None, now=None):
+        """
+        The best single promotion for a booking worth ``subtotal``.
+        first_time promotions need ``first_booking``. loyalty_redemption ones
+        need a ``loyalty_balance`` (only passed when the customer asked to
+        redeem) that covers their points cost. Ties go to the promotion that
+        expires first.
+        """
+        now = now or timezone.now()
+        subtotal = _money(subtotal)
+        types = ['percentage', 'fixed_amount']
+        if first_booking:
+            types.append('first_time')
+        if loyalty_balance is not None:
+            types.append('loyalty_redemption')
+
+        best, best_key = None, None
+        for promo_type in types:
+            for promotion in self.candidates(promo_type, subtotal, now):
+                discount = discount_for(promotion, subtotal)
+                points = points_for_discount(discount) if promo_type == 'loyalty_redemption' else 0
+                if points > (loyalty_balance or 0):
+                    continue
+                expires = promotion.valid_until.timestamp() if promotion.valid_until else float('inf')
+                key = (discount, -expires, -promotion.id)
+                if discount > ZERO and (best_key is None or key > best_key):
+                    best, best_key = (promotion, discount, points), key
+
+        if best is None:
+            return Quote(subtotal, ZERO, subtotal)
+        promotion, discount, points = best
+        return Quote(subtotal, discount, subtotal - discount, promotion, points)
+
+
+_index = None
+_index_version = None
+_index_built = 0.0
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """
+    The process-wide PromotionIndex. It's rebuilt when the Promotion cache
+    version changes (every Promotion save or delete bumps it, see
+    signals.py; the cache is shared by every process) and at least every
+    PROMOTION_INDEX_TTL seconds, which bounds how long writes that skip
+    signals, like queryset updates, go unseen. A quote costs a cache lookup
+    rather than a query.
+    """
+    global _index, _index_version, _index_built
+    version = cache.get_versions((Promotion,))
+    ttl = getattr(settings, 'PROMOTION_INDEX_TTL', 60)
+    with _index_lock:
+        if _index is None or _index_version != version or time.monotonic() - _index_built > ttl:
+            _index = PromotionIndex.build()
+            _index_version = version
+            _index_built = time.monotonic()
+        return _index
+
+
+def is_first_booking(customer):
+    return not Appointment.objects.filter(customer=customer).exclude(status__in=NOT_BOOKED).exists()
+
+
+def quote_for(customer, services, redeem_points=False, first_booking=None):
+    """
+    Prices a booking of ``services`` for ``customer``. Only looks up the
+    customer's history or points balance when a first_time or (with
+    ``redeem_points``) loyalty_redemption promotion could apply. Pass
+    ``first_booking`` when the history is already known, e.g. when
+    repricing a booking that now counts as its own earlier one.
+    """
+    index = get_index()
+    subtotal = sum((service.price for service in services), ZERO)
+    if first_booking is None:
+        first_booking = index.has('first_time') and is_first_booking(customer)
+    loyalty_balance = None
+    if redeem_points and index.has('loyalty_redemption'):
+        loyalty_balance = LoyaltyPoint.objects.filter(customer=customer).values_list('points', flat=True).first() or 0
+    return index.quote(subtotal, first_booking=first_booking, loyalty_balance=loyalty_balance)
@@ -0,0 +1,411 @@
+import hashlib
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+from django.conf import settings
+
+from . import cache, embeddings
+from .embeddings import KIND_PORTFOLIO, KIND_WORK
+from .models import Category, InspiredWork, PortfolioImage, Service, Stylist
+
+# Terms are hashed into 2**20 feature slots (crc32, so stable across
+# processes), which keeps the index free of a vocabulary to persist or merge.
+FEATURE_BITS = 20
+FEATURE_MASK = (1 << FEATURE_BITS) - 1
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+STOP_WORDS = frozenset(
+    'a an and are as at be but by for from i in into is it like look looking me my of on or '
+    'so some something that the this to want with would'.split()
+)
+REFRESH_LOCK_KEY = 'salon:recommendations:refresh'
+STALE_KEY = 'salon:recommendations:stale'
+# Reciprocal rank fusion constant; 60 is the usual choice.
+RRF_K = 60
+
+_EMPTY_FEATURES = np.empty(0, dtype=np.int32)
+_EMPTY_WEIGHTS = np.empty(0, dtype=np.float32)
+
+
+def tokenize(text):
+    words = [word for word in TOKEN_RE.findall((text or '').lower()) if word not in STOP_WORDS]
+    return words + [f'{first} {second}' for first, second in zip(words, words[1:])]
+
+
+def term_counts(text):
+    counts = {}
+    for token in tokenize(text):
+        feature = zlib.crc32(token.encode()) & FEATURE_MASK
+        counts[feature] = counts.get(feature, 0) + 1
+    if not counts:
+        return _EMPTY_FEATURES, _EMPTY_WEIGHTS
+    features = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+    tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    return features, tf
+
+
+def document_vector(text):
+    """
+    Log-scaled, cosine-normalized term weights with no IDF (SMART "lnc").
+    IDF is applied on the query side instead, so a document's vector never
+    changes when other documents do and refreshes only touch changed rows.
+    """
+    features, tf = term_counts(text)
+    if not len(features):
+        return features, tf
+    weights = 1 + np.log(tf)
+    return features, (weights / np.linalg.norm(weights)).astype(np.float32)
+
+
+def _fingerprint(text):
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'little', signed=True)
+
+
+def _work_text(title, description):
+    return f'{title}\n{description or ""}'
+
+
+def category_profiles():
+    """
+    Each category's text (its name plus its active services' names and
+    descriptions) as document vectors, and a fingerprint of all of them.
+    """
+    texts = {category_id: [name] for category_id, name in Category.objects.values_list('id', 'name')}
+    services = Service.objects.filter(is_active=True, category__isnull=False).order_by('id')
+    for category_id, name, description in services.values_list('category_id', 'name', 'description'):
+        texts[category_id].extend((name, description or ''))
+    joined = {category_id: '\n'.join(parts) for category_id, parts in sorted(texts.items())}
+    fingerprint = _fingerprint(repr(sorted(joined.items())))
+    return {category_id: document_vector(text) for category_id, text in joined.items()}, fingerprint
+
+
+class _CategoryMatcher:
+    """
+    Picks the category whose profile is closest to a work's text, so works
+    (which carry no category of their own) can be linked to specialists.
+    """
+    def __init__(self, profiles):
+        self.category_ids = np.array(list(profiles), dtype=np.int64)
+        self.by_feature = {}
+        for column, (features, weights) in enumerate(profiles.values()):
+            for feature, weight in zip(features.tolist(), weights.tolist()):
+                self.by_feature.setdefault(feature, np.zeros(len(profiles), dtype=np.float32))[column] = weight
+
+    def match(self, features, weights):
+        if not len(self.category_ids):
+            return -1
+        scores = np.zeros(len(self.category_ids), dtype=np.float32)
+        for feature, weight in zip(features.tolist(), weights.tolist()):
+            row = self.by_feature.get(feature)
+            if row is not None:
+                scores += weight * row
+        best = int(scores.argmax())
+        return int(self.category_ids[best]) if scores[best] > 0 else -1
+
+
+class RecommendationIndex:
+    """
+    Inspired work as a sparse term matrix held in NumPy.
+
+    Postings (feature, work position, weight) are kept sorted by feature, so a
+    query's columns are found with ``searchsorted`` and scoring is one sparse
+    matrix-vector product done with a single ``bincount``. Document frequency
+    is just a column's length, so IDF needs no separate bookkeeping.
+    """
+    ARRAYS = ('work_ids', 'fingerprints', 'categories', 'features', 'docs', 'weights')
+
+    def __init__(self, work_ids, fingerprints, categories, features, docs, weights, profile_fingerprint):
+        self.work_ids = work_ids
+        self.fingerprints = fingerprints
+        self.categories = categories
+        self.features = features
+        self.docs = docs
+        self.weights = weights
+        self.profile_fingerprint = int(profile_fingerprint)
+
+    def __len__(self):
+        return len(self.work_ids)
+
+    @classmethod
+    def build(cls, previous=None):
+        """
+        Indexes every InspiredWork. Works whose text is unchanged since
+        ``previous`` keep their postings; only new or edited works are
+        re-tokenized. A change to any category profile re-matches everything.
+        """
+        profiles, profile_fingerprint = category_profiles()
+        matcher = _CategoryMatcher(profiles)
+        if previous is not None and previous.profile_fingerprint != profile_fingerprint:
+            previous = None
+        known = {} if previous is None else dict(zip(previous.work_ids.tolist(), previous.fingerprints.tolist()))
+
+        kept_ids = []
+        new_rows = []
+        for work_id, title, description in InspiredWork.objects.order_by('id').values_list('id', 'title', 'description').iterator():
+            text = _work_text(title, description)
+            fingerprint = _fingerprint(text)
+            if known.get(work_id) == fingerprint:
+                kept_ids.append(work_id)
+            else:
+                new_rows.append((work_id, fingerprint, text))
+
+        if previous is not None and kept_ids:
+            keep = np.isin(previous.work_ids, np.array(kept_ids, dtype=np.int64))
+            positions = np.full(len(previous), -1, dtype=np.int64)
+            positions[keep] = np.arange(int(keep.sum()))
+            kept_postings = keep[previous.docs]
+            parts = {
+                'work_ids': [previous.work_ids[keep]],
+                'fingerprints': [previous.fingerprints[keep]],
+                'categories': [previous.categories[keep]],
+                'features': [previous.features[kept_postings]],
+                'docs': [positions[previous.docs[kept_postings]].astype(np.int32)],
+                'weights': [previous.weights[kept_postings]],
+            }
+            offset = int(keep.sum())
+        else:
+            parts = {name: [] for name in cls.ARRAYS}
+            offset = 0
+
+        for position, (work_id, fingerprint, text) in enumerate(new_rows, start=offset):
+            features, weights = document_vector(text)
+            parts['work_ids'].append(np.array([work_id], dtype=np.int64))
+            parts['fingerprints'].append(np.array([fingerprint], dtype=np.int64))
+            parts['categories'].append(np.array([matcher.match(features, weights)], dtype=np.int64))
+            parts['features'].append(features)
+            parts['docs'].append(np.full(len(features), position, dtype=np.int32))
+            parts['weights'].append(weights)
+
+        dtypes = {'work_ids': np.int64, 'fingerprints': np.int64, 'categories': np.int64,
+                  'features': np.int32, 'docs': np.int32, 'weights': np.float32}
+        arrays = {
+            name: np.concatenate(parts[name]) if parts[name] else np.empty(0, dtype=dtypes[name])
+            for name in cls.ARRAYS
+        }
+        order = np.argsort(arrays['features'], kind='stable')
+        for name in ('features', 'docs', 'weights'):
+            arrays[name] = arrays[name][order]
+        index = cls(profile_fingerprint=profile_fingerprint, **arrays)
+        index.reused = len(kept_ids)
+        index.rebuilt = len(new_rows)
+        return index
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp.npz'
+        np.savez(tmp_path, profile_fingerprint=self.profile_fingerprint, **{name: getattr(self, name) for name in self.ARRAYS})
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(profile_fingerprint=data['profile_fingerprint'], **{name: data[name] for name in cls.ARRAYS})
+
+    def category_of(self, work_id):
+        """
+        The category a work was matched to, or None.
+        """
+        positions = np.flatnonzero(self.work_ids == work_id)
+        if not len(positions) or self.categories[positions[0]] < 0:
+            return None
+        return int(self.categories[positions[0]])
+
+    def search(self, query, limit=5):
+        """
+        Returns ``(positions, scores)`` of the best ``limit`` works for
+        ``query``, best first. Works sharing no term with the query are left out.
+        """
+        features, tf = term_counts(query)
+        if not len(self) or not len(features):
+            return np.empty(0, dtype=np.int64), _EMPTY_WEIGHTS
+
+        starts = np.searchsorted(self.features, features, side='left')
+        ends = np.searchsorted(self.features, features, side='right')
+        lengths = ends - starts
+        present = lengths > 0
+        if not present.any():
+            return np.empty(0, dtype=np.int64), _EMPTY_WEIGHTS
+        starts, lengths, tf = starts[present], lengths[present], tf[present]
+
+        query_weights = (1 + np.log(tf)) * np.log(len(self) / lengths)
+        # Flatten the query's posting ranges into one gather.
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        postings = np.arange(int(lengths.sum())) + offsets
+        scores = np.bincount(
+            self.docs[postings],
+            weights=self.weights[postings] * np.repeat(query_weights, lengths),
+            minlength=len(self),
+        )
+
+        limit = min(limit, int((scores > 0).sum()))
+        if not limit:
+            return np.empty(0, dtype=np.int64), _EMPTY_WEIGHTS
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return top, scores[top]
+
+
+def index_path():
+    return getattr(settings, 'RECOMMENDATION_INDEX_PATH', os.path.join(settings.BASE_DIR, 'var', 'recommendations.npz'))
+
+
+_loaded = {'mtime': None, 'index': None}
+_loaded_lock = threading.Lock()
+
+
+def get_index():
+    """
+    The index on disk, loaded once per process and reloaded whenever a
+    refresh replaces the file. Built on first use if there isn't one, and
+    refreshed first if writes marked it stale (see schedule_refresh).
+    """
+    path = index_path()
+    with _loaded_lock:
+        if _eager() and cache.get_cache().get(STALE_KEY):
+            cache.get_cache().delete(STALE_KEY)
+            refresh_index()
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            index = RecommendationIndex.build()
+            index.save(path)
+            mtime = os.stat(path).st_mtime_ns
+            _loaded.update(mtime=mtime, index=index)
+        if _loaded['mtime'] != mtime:
+            _loaded.update(mtime=mtime, index=RecommendationIndex.load(path))
+        return _loaded['index']
+
+
+def refresh_index():
+    """
+    Brings the index on disk up to date, re-tokenizing only changed works.
+    """
+    path = index_path()
+    previous = RecommendationIndex.load(path) if os.path.exists(path) else None
+    index = RecommendationIndex.build(previous)
+    index.save(path)
+    return {'works': len(index), 'reused': index.reused, 'rebuilt': index.rebuilt}
+
+
+def schedule_refresh():
+    """
+    Queues a refresh after catalog writes. A burst of writes shares one task:
+    the first schedules it RECOMMENDATION_REFRESH_DELAY seconds out and the
+    rest are covered by it. Nothing to do until the index has been built.
+
+    Without a broker the task would run inside the writing request, once per
+    write, so the index is only marked stale and the next get_index()
+    catches up on every write since in one refresh.
+    """
+    if not os.path.exists(index_path()):
+        return
+    if _eager():
+        cache.get_cache().set(STALE_KEY, True, timeout=None)
+        return
+    from .tasks import refresh_recommendation_index
+
+    delay = getattr(settings, 'RECOMMENDATION_REFRESH_DELAY', 30)
+    if cache.get_cache().add(REFRESH_LOCK_KEY, True, timeout=delay):
+        refresh_recommendation_index.apply_async(countdown=delay)
+
+
+def _eager():
+    return getattr(settings, 'CELERY_TASK_ALWAYS_EAGER', False)
+
+
+_specialists = {'versions': None, 'table': {}}
+_specialists_lock = threading.Lock()
+
+
+def specialists_by_category():
+    """
+    ``{category_id: [stylist_id, ...]}`` for available stylists, best rated
+    first. Rebuilt (one query) only when stylists or categories change.
+    """
+    versions = cache.get_versions((Stylist, Category))
+    with _specialists_lock:
+        if _specialists['versions'] != versions:
+            table = {}
+            rows = Stylist.objects.filter(is_available=True, specialties__isnull=False).order_by_rating()
+            for stylist_id, category_id in rows.values_list('id', 'specialties'):
+                table.setdefault(category_id, []).append(stylist_id)
+            _specialists.update(versions=versions, table=table)
+        return _specialists['table']
+
+
+def _fuse(rankings, limit):
+    """
+    Reciprocal rank fusion: merges ranked key lists without having to make
+    their scores comparable.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0) + 1 / (RRF_K + rank + 1)
+    return sorted(scores, key=lambda key: -scores[key])[:limit]
+
+
+def recommend(preferences='', limit=5, image=None):
+    """
+    Inspired work (and, given an ``image``, portfolio photos) best matching
+    ``preferences`` and/or looking like ``image``, fused into one ranking.
+
+    Portfolio photos link to the stylist who took them. Inspired work links
+    to a specialist in the category it matches, rotating within a category
+    so several results don't all point at the same stylist. With nothing to
+    match on, falls back to the newest work.
+    """
+    index = get_index()
+    rankings = []
+    if preferences:
+        positions, _ = index.search(preferences, limit)
+        rankings.append([(KIND_WORK, work_id) for work_id in index.work_ids[positions].tolist()])
+    if image is not None:
+        rankings.append([(kind, pk) for kind, pk, _ in embeddings.similar(image, limit)])
+    keys = _fuse(rankings, limit)
+    if not keys:
+        keys = [(KIND_WORK, work_id) for work_id in np.sort(index.work_ids)[::-1][:limit].tolist()]
+
+    works = InspiredWork.objects.in_bulk([pk for kind, pk in keys if kind == KIND_WORK])
+    photos = PortfolioImage.objects.in_bulk([pk for kind, pk in keys if kind == KIND_PORTFOLIO])
+    specialists = specialists_by_category()
+    turns = {}
+    recommendations = []
+    for kind, pk in keys:
+        if kind == KIND_PORTFOLIO:
+            photo = photos.get(pk)
+            if photo is None:
+                continue
+            recommendations.append({
+                'kind': 'portfolio',
+                'id': photo.id,
+                'title': photo.description or '',
+                'description': photo.description or '',
+                'imageUrl': photo.image.url if photo.image else '',
+                'categoryId': None,
+                'specialistId': photo.stylist_id,
+            })
+            continue
+
+        work = works.get(pk)
+        if work is None:
+            continue
+        category_id = index.category_of(pk)
+        candidates = specialists.get(category_id, [])
+        specialist_id = None
+        if candidates:
+            turn = turns.get(category_id, 0)
+            specialist_id = candidates[turn % len(candidates)]
+            turns[category_id] = turn + 1
+        recommendations.append({
+            'kind': 'inspired_work',
+            'id': work.id,
+            'title': work.title,
+            'description': work.description or work.title,
+            'imageUrl': work.image.url if work.image else '',
+            'categoryId': category_id,
+            'specialistId': specialist_id,
+        })
+    return recommendations
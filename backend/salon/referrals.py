@@ -0,0 +1,78 @@
+import re
+
+from django.db import connections, transaction
+from django.db.models import F
+
+# Crockford base32: no I, L, O or U, so codes survive being read aloud or retyped.
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+CHECK_LETTERS = 'ABCDEFGHJKMNPQRSTVWXYZ'
+TOKEN_WIDTH = 4
+MAX_PREFIX_LENGTH = 20
+
+# Postgres allocates from a native sequence (created in migration 0010), so
+# concurrent registrations never wait on each other. Other backends bump the
+# single ReferralCodeCounter row.
+SEQUENCE_NAME = 'salon_referral_code_seq'
+
+
+def _encode(number):
+    digits = ''
+    while number:
+        number, remainder = divmod(number, len(ALPHABET))
+        digits = ALPHABET[remainder] + digits
+    return digits.rjust(TOKEN_WIDTH, '0')
+
+
+def _check_letter(token):
+    total = sum((position + 1) * ALPHABET.index(char) for position, char in enumerate(token))
+    return CHECK_LETTERS[total % len(CHECK_LETTERS)]
+
+
+def code_prefix(email):
+    return re.sub(r'[^A-Z0-9]', '', email.split('@')[0].upper())[:MAX_PREFIX_LENGTH]
+
+
+def format_code(email, number):
+    """
+    ``<EMAIL PREFIX>-<base32 number><check letter>``, e.g. ``JANEDOE-000KF``.
+
+    Codes differ in their number, which is everything after the last '-', so
+    they're unique whatever the prefix. Legacy codes (``<prefix><pk>`` and
+    ``<prefix><pk>-<n>``) always end in a digit and these always end in a
+    letter, so the two formats can't collide either.
+    """
+    token = _encode(number)
+    return f'{code_prefix(email)}-{token}{_check_letter(token)}'
+
+
+def allocate_numbers(count, using='default'):
+    """
+    Reserves ``count`` fresh numbers in a single allocation. A Postgres sequence
+    never hands a number out twice; the counter row only goes back if the
+    transaction that used the numbers (and so the rows holding them) rolls back.
+    """
+    if count <= 0:
+        return []
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT nextval(%s) FROM generate_series(1, %s)', [SEQUENCE_NAME, count])
+            return [row[0] for row in cursor.fetchall()]
+
+    from .models import ReferralCodeCounter
+
+    with transaction.atomic(using=using):
+        counters = ReferralCodeCounter.objects.using(using)
+        if not counters.filter(pk=1).update(value=F('value') + count):
+            counters.get_or_create(pk=1)
+            counters.filter(pk=1).update(value=F('value') + count)
+        last = counters.values_list('value', flat=True).get(pk=1)
+    return list(range(last - count + 1, last + 1))
+
+
+def allocate_codes(emails, using='default'):
+    """
+    One referral code per email, in order, from a single allocation.
+    """
+    emails = list(emails)
+    return [format_code(email, number) for email, number in zip(emails, allocate_numbers(len(emails), using))]
@@ -0,0 +1,192 @@
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q, Value
+
+from .models import InspiredWork, SearchDocument, Service, Stylist
+
+KIND_STYLIST = 'stylist'
+KIND_SERVICE = 'service'
+KIND_WORK = 'inspired_work'
+KINDS = (KIND_STYLIST, KIND_SERVICE, KIND_WORK)
+# Longer queries are cut to their first MAX_TERMS words.
+MAX_TERMS = 8
+SNIPPET_LENGTH = 200
+
+FTS_TABLE = 'salon_searchdocument_fts'
+# Titles weigh more than bodies. The english half matches other forms of a
+# word; the unstemmed 'simple' half lets a partial word match as a prefix of
+# what was written ('stylin' never prefixes the stem 'style'). The Postgres
+# GIN index (migration 0016) is built over exactly this expression, copied
+# there, so a change here needs a migration that rebuilds the index.
+PG_VECTOR = (
+    "setweight(to_tsvector('english', title), 'A') || setweight(to_tsvector('english', body), 'B') || "
+    "setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B')"
+)
+PG_INDEX = 'search_document_vector_idx'
+# A word matches as a prefix of either its stem or itself.
+PG_TERM = "(to_tsquery('english', %s) || to_tsquery('simple', %s))"
+
+# The SQLite FTS5 table indexes salon_searchdocument through these triggers.
+# A migration that rebuilds the document table (as SQLite does to alter a
+# column) drops them with it; ensure_full_text_index() puts them back.
+SQLITE_TRIGGERS = {
+    'salon_searchdocument_ai': f"""AFTER INSERT ON salon_searchdocument BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+    'salon_searchdocument_ad': f"""AFTER DELETE ON salon_searchdocument BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+    END""",
+    'salon_searchdocument_au': f"""AFTER UPDATE ON salon_searchdocument BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+}
+SQLITE_TABLE = f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    title, body, content='salon_searchdocument', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+)"""
+
+
+def stylist_document(stylist):
+    specialties = ' '.join(category.name for category in stylist.specialties.all())
+    # The same as User.get_full_name(), which migrations' models lack.
+    name = f'{stylist.user.first_name} {stylist.user.last_name}'.strip()
+    return name, '\n'.join(part for part in (stylist.bio, specialties) if part)
+
+
+def service_document(service):
+    category = service.category.name if service.category else ''
+    return service.name, '\n'.join(part for part in (service.description, category) if part)
+
+
+def work_document(work):
+    return work.title, work.description or ''
+
+
+SOURCES = {
+    KIND_STYLIST: (Stylist, lambda: Stylist.objects.select_related('user').prefetch_related('specialties'), stylist_document),
+    KIND_SERVICE: (Service, lambda: Service.objects.filter(is_active=True).select_related('category'), service_document),
+    KIND_WORK: (InspiredWork, lambda: InspiredWork.objects.all(), work_document),
+}
+
+
+def index(kind, ids):
+    """
+    Rewrites the documents of the ``kind`` objects with ``ids``, dropping
+    those that no longer exist or shouldn't be found (inactive services).
+    """
+    ids = set(ids)
+    if not ids:
+        return
+    _, queryset, document = SOURCES[kind]
+    rows = []
+    for obj in queryset().filter(pk__in=ids):
+        title, body = document(obj)
+        rows.append(SearchDocument(kind=kind, object_id=obj.pk, title=title[:255], body=body))
+    with transaction.atomic(savepoint=False):
+        if rows:
+            SearchDocument.objects.bulk_create(
+                rows, update_conflicts=True, unique_fields=['kind', 'object_id'], update_fields=['title', 'body'],
+                batch_size=1000,
+            )
+        SearchDocument.objects.filter(kind=kind, object_id__in=ids - {row.object_id for row in rows}).delete()
+
+
+def remove(kind, ids):
+    SearchDocument.objects.filter(kind=kind, object_id__in=list(ids)).delete()
+
+
+def ensure_full_text_index():
+    """
+    Recreates whatever is missing of the backend's full-text index. On
+    SQLite the FTS table is then rebuilt from the documents, since any
+    written while a trigger was missing never reached it.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {PG_INDEX} ON salon_searchdocument USING gin (({PG_VECTOR}))")
+        elif connection.vendor == 'sqlite':
+            cursor.execute(SQLITE_TABLE)
+            for name, body in SQLITE_TRIGGERS.items():
+                cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def rebuild(batch_size=1000):
+    """
+    Restores the full-text index, reindexes every stylist, service and
+    inspired work, and drops documents whose object is gone. Returns the
+    number of documents indexed.
+    """
+    ensure_full_text_index()
+    total = 0
+    for kind, (model, _, _) in SOURCES.items():
+        ids = list(model.objects.values_list('pk', flat=True))
+        for start in range(0, len(ids), batch_size):
+            index(kind, ids[start:start + batch_size])
+        SearchDocument.objects.filter(kind=kind).exclude(object_id__in=model.objects.values('pk')).delete()
+        total += SearchDocument.objects.filter(kind=kind).count()
+    return total
+
+
+def terms(query):
+    """
+    The words of ``query`` that get matched, lowercased. Everything else,
+    including each backend's query syntax, is dropped.
+    """
+    return re.findall(r'[^\W_]+', query.lower())[:MAX_TERMS]
+
+
+def search(query, kinds=None, limit=20, offset=0):
+    """
+    Documents matching every word of ``query`` (each as a prefix, so partial
+    words typed so far match), best first, in one query. Each has a
+    ``rank``: higher is better, comparable only within one backend.
+    """
+    words = terms(query)
+    if not words:
+        return []
+    kinds = [kind for kind in kinds or KINDS if kind in KINDS]
+    if not kinds:
+        return []
+    kind_filter = f"AND d.kind IN ({', '.join(['%s'] * len(kinds))})"
+
+    if connection.vendor == 'postgresql':
+        sql = f"""
+            SELECT d.id, d.kind, d.object_id, d.title, d.body, ts_rank({PG_VECTOR}, query.q) AS rank
+            FROM salon_searchdocument d, (SELECT {' && '.join([PG_TERM] * len(words))} AS q) query
+            WHERE {PG_VECTOR} @@ query.q {kind_filter}
+            ORDER BY rank DESC, d.id LIMIT %s OFFSET %s
+        """
+        params = [*(f'{word}:*' for word in words for _ in range(2)), *kinds, limit, offset]
+    elif connection.vendor == 'sqlite':
+        # bm25 is lower for better matches; columns are weighted title, body.
+        sql = f"""
+            SELECT d.id, d.kind, d.object_id, d.title, d.body, -bm25({FTS_TABLE}, 10.0, 1.0) AS rank
+            FROM {FTS_TABLE} JOIN salon_searchdocument d ON d.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH %s {kind_filter}
+            ORDER BY rank DESC, d.id LIMIT %s OFFSET %s
+        """
+        params = [' '.join(f'"{word}"*' for word in words), *kinds, limit, offset]
+    else:
+        # No full-text index elsewhere: an unranked substring match.
+        condition = Q()
+        for word in words:
+            condition &= Q(title__icontains=word) | Q(body__icontains=word)
+        queryset = SearchDocument.objects.filter(condition, kind__in=kinds).annotate(rank=Value(0.0))
+        return list(queryset.order_by('id')[offset:offset + limit])
+    return list(SearchDocument.objects.raw(sql, params))
+
+
+class Results:
+    """
+    ``search()`` as a sliceable sequence, for SearchPagination: slicing runs
+    the query for just that window.
+    """
+    def __init__(self, query, kinds=None):
+        self.query = query
+        self.kinds = kinds
+
+    def __getitem__(self, window):
+        return search(self.query, self.kinds, limit=window.stop - window.start, offset=window.start)
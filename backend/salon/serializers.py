@@ -1,21 +1,27 @@
 from rest_framework import serializers
-from .models import User, Service, Stylist, Appointment, Review, Promotion, LoyaltyPoint, SalonSetting, PortfolioImage, FavoriteStylist, Category, Referral, InspiredWork
+from .models import User, Service, Stylist, Appointment, Review, Promotion, LoyaltyPoint, LoyaltyTransaction, SalonSetting, PortfolioImage, FavoriteStylist, Category, Referral, InspiredWork
 from django.contrib.auth import authenticate
-from django.db.models import Avg, Q, Count
-from django.db.models.functions import ExtractMinute
-from django.db.models import F, ExpressionWrapper, fields
 from django.urls import reverse_lazy
 from django.utils import timezone
-from datetime import timedelta, datetime, time
+from django.utils.text import Truncator
+from datetime import datetime, time
 import pytz
-
-class InspiredWorkSerializer(serializers.ModelSerializer):
+from django.db import IntegrityError, transaction
+from . import loyalty, pricing
+from .booking import lock_stylist_day
+from .images import srcset
+from .metrics import TimedModelSerializer, TimedSerializer
+from .search import SNIPPET_LENGTH
+from .assignment import assign_stylist, qualified_stylists
+
+class InspiredWorkSerializer(TimedModelSerializer):
     imageUrl = serializers.SerializerMethodField()
+    imageSrcset = serializers.SerializerMethodField()
 
     class Meta:
         model = InspiredWork
-        fields = ('id', 'title', 'description', 'image', 'imageUrl', 'created_at')
-        read_only_fields = ('imageUrl', 'created_at')
+        fields = ('id', 'title', 'description', 'image', 'imageUrl', 'imageSrcset', 'created_at')
+        read_only_fields = ('imageUrl', 'imageSrcset', 'created_at')
         extra_kwargs = {'image': {'write_only': True}}
 
     def get_imageUrl(self, obj):
@@ -24,13 +30,17 @@ class InspiredWorkSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.image.url)
         return None
 
-class UserSerializer(serializers.ModelSerializer):
+    def get_imageSrcset(self, obj):
+        return srcset(obj.image, self.context.get('request'))
+
+class UserSerializer(TimedModelSerializer):
     name = serializers.SerializerMethodField()
     profile_image_url = serializers.SerializerMethodField()
+    profile_image_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = User
-        fields = ('id', 'email', 'first_name', 'last_name', 'phone_number', 'role', 'is_staff', 'is_superuser', 'date_joined', 'name', 'profile_image_url', 'referral_code')
+        fields = ('id', 'email', 'first_name', 'last_name', 'phone_number', 'role', 'is_staff', 'is_superuser', 'date_joined', 'name', 'profile_image_url', 'profile_image_srcset', 'referral_code')
         read_only_fields = ('is_staff', 'is_superuser', 'date_joined', 'role', 'referral_code')
 
     def get_name(self, obj):
@@ -42,7 +52,10 @@ class UserSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.profile_image.url)
         return None
 
-class RegisterSerializer(serializers.ModelSerializer):
+    def get_profile_image_srcset(self, obj):
+        return srcset(obj.profile_image, self.context.get('request'))
+
+class RegisterSerializer(TimedModelSerializer):
     password = serializers.CharField(write_only=True)
     name = serializers.CharField(write_only=True, required=False)
     profile_image = serializers.ImageField(required=False, allow_null=True)
@@ -89,19 +102,20 @@ class LoginSerializer(serializers.Serializer):
         data['user'] = user
         return data
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedModelSerializer):
     class Meta:
         model = Category
         fields = ('id', 'name')
 
-class ServiceSerializer(serializers.ModelSerializer):
+class ServiceSerializer(TimedModelSerializer):
     imageUrl = serializers.SerializerMethodField()
+    imageSrcset = serializers.SerializerMethodField()
     category_name = serializers.CharField(source='category.name', read_only=True)
 
     class Meta:
         model = Service
-        fields = ('id', 'name', 'description', 'price', 'duration_minutes', 'category', 'category_name', 'image', 'imageUrl', 'is_active')
-        read_only_fields = ('imageUrl', 'category_name')
+        fields = ('id', 'name', 'description', 'price', 'duration_minutes', 'category', 'category_name', 'image', 'imageUrl', 'imageSrcset', 'is_active')
+        read_only_fields = ('imageUrl', 'imageSrcset', 'category_name')
         extra_kwargs = {'category': {'write_only': True}}
 
     def get_imageUrl(self, obj):
@@ -110,13 +124,17 @@ class ServiceSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.image.url)
         return None
 
-class PortfolioImageSerializer(serializers.ModelSerializer):
+    def get_imageSrcset(self, obj):
+        return srcset(obj.image, self.context.get('request'))
+
+class PortfolioImageSerializer(TimedModelSerializer):
     imageUrl = serializers.SerializerMethodField()
+    imageSrcset = serializers.SerializerMethodField()
 
     class Meta:
         model = PortfolioImage
-        fields = ('id', 'image', 'imageUrl', 'description', 'uploaded_at')
-        read_only_fields = ('uploaded_at', 'imageUrl')
+        fields = ('id', 'image', 'imageUrl', 'imageSrcset', 'description', 'uploaded_at')
+        read_only_fields = ('uploaded_at', 'imageUrl', 'imageSrcset')
         extra_kwargs = {'image': {'write_only': True}}
 
     def get_imageUrl(self, obj):
@@ -125,13 +143,18 @@ class PortfolioImageSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.image.url)
         return None
 
-class StylistSerializer(serializers.ModelSerializer):
+    def get_imageSrcset(self, obj):
+        return srcset(obj.image, self.context.get('request'))
+
+class StylistSerializer(TimedModelSerializer):
     user = UserSerializer(read_only=True)
     user_id = serializers.PrimaryKeyRelatedField(queryset=User.objects.filter(role='stylist'), write_only=True, source='user', required=False)
     rating = serializers.SerializerMethodField()
     reviewCount = serializers.SerializerMethodField()
     portfolio = serializers.SerializerMethodField()
+    portfolioSrcset = serializers.SerializerMethodField()
     imageUrl = serializers.SerializerMethodField()
+    imageSrcset = serializers.SerializerMethodField()
     specialties = serializers.SlugRelatedField(
         many=True,
         queryset=Category.objects.all(),
@@ -140,45 +163,73 @@ class StylistSerializer(serializers.ModelSerializer):
         allow_empty=True
     )
     is_favorited = serializers.SerializerMethodField()
+    # Only set by available-for-service when asked about a date; omitted otherwise.
+    next_free_slot = serializers.CharField(read_only=True)
 
     class Meta:
         model = Stylist
         fields = (
             'id', 'user', 'user_id', 'bio', 'specialties', 'working_hours_start',
             'working_hours_end', 'is_available', 'is_featured', 'image', 
-            'rating', 'reviewCount', 'portfolio', 'imageUrl', 'is_favorited'
+            'rating', 'reviewCount', 'portfolio', 'portfolioSrcset', 'imageUrl', 'imageSrcset', 'is_favorited',
+            'next_free_slot'
         )
-        read_only_fields = ('user', 'rating', 'reviewCount', 'portfolio', 'imageUrl', 'is_favorited')
+        read_only_fields = ('user', 'rating', 'reviewCount', 'portfolio', 'portfolioSrcset', 'imageUrl', 'imageSrcset', 'is_favorited', 'next_free_slot')
         extra_kwargs = {'image': {'write_only': True}}
 
     def get_rating(self, obj):
-        return obj.review_set.aggregate(avg_rating=Avg('rating'))['avg_rating'] or 0.0
+        return obj.average_rating
 
     def get_reviewCount(self, obj):
-        return obj.review_set.count()
+        return obj.review_count
 
     def get_portfolio(self, obj):
         request = self.context.get('request')
         return [request.build_absolute_uri(img.image.url) for img in obj.portfolio_images.all() if img.image]
 
+    def get_portfolioSrcset(self, obj):
+        # Parallel to ``portfolio``.
+        request = self.context.get('request')
+        return [srcset(img.image, request) for img in obj.portfolio_images.all() if img.image]
+
     def get_imageUrl(self, obj):
         request = self.context.get('request')
+        image = self._display_image(obj)
+        if image:
+            return request.build_absolute_uri(image.url)
+        return "https://placehold.co/1200x800"
+
+    def get_imageSrcset(self, obj):
+        image = self._display_image(obj)
+        return srcset(image, self.context.get('request')) if image else None
+
+    def _display_image(self, obj):
+        # The stylist's own image, else their profile photo, else their first portfolio image.
         if obj.image and hasattr(obj.image, 'url'):
-            return request.build_absolute_uri(obj.image.url)
+            return obj.image
         if obj.user.profile_image and hasattr(obj.user.profile_image, 'url'):
-            return request.build_absolute_uri(obj.user.profile_image.url)
-        first_portfolio_image = obj.portfolio_images.first()
+            return obj.user.profile_image
+        first_portfolio_image = self._first_portfolio_image(obj)
         if first_portfolio_image and first_portfolio_image.image:
-            return request.build_absolute_uri(first_portfolio_image.image.url)
-        return "https://placehold.co/1200x800"
+            return first_portfolio_image.image
+        return None
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'user_has_favorited'):
+            return obj.user_has_favorited
         user = self.context['request'].user
         if user.is_authenticated:
             return FavoriteStylist.objects.filter(stylist=obj, customer=user).exists()
         return False
 
-class AppointmentSerializer(serializers.ModelSerializer):
+    def _first_portfolio_image(self, obj):
+        # .first() would bypass a prefetch, so read from the cache when present.
+        if 'portfolio_images' in getattr(obj, '_prefetched_objects_cache', {}):
+            images = list(obj.portfolio_images.all())
+            return images[0] if images else None
+        return obj.portfolio_images.first()
+
+class AppointmentSerializer(TimedModelSerializer):
     customer = UserSerializer(read_only=True)
     stylist = StylistSerializer(read_only=True)
     services = ServiceSerializer(many=True, read_only=True)
@@ -187,11 +238,17 @@ class AppointmentSerializer(serializers.ModelSerializer):
         child=serializers.IntegerField(), write_only=True
     )
     can_review = serializers.SerializerMethodField()
+    redeem_points = serializers.BooleanField(
+        write_only=True, required=False, default=False,
+        help_text="Apply a loyalty-redemption promotion if the customer has enough points.",
+    )
+
+    SLOT_TAKEN_MESSAGE = "This time slot was just booked. Please choose another time."
 
     class Meta:
         model = Appointment
-        fields = ('id', 'customer', 'stylist', 'stylist_id', 'services', 'service_ids', 'appointment_date', 'appointment_time', 'duration_minutes', 'status', 'created_at', 'updated_at', 'can_review')
-        read_only_fields = ('customer', 'created_at', 'updated_at', 'status', 'stylist', 'duration_minutes')
+        fields = ('id', 'customer', 'stylist', 'stylist_id', 'services', 'service_ids', 'appointment_date', 'appointment_time', 'duration_minutes', 'status', 'discount', 'final_price', 'redeem_points', 'created_at', 'updated_at', 'can_review')
+        read_only_fields = ('customer', 'created_at', 'updated_at', 'status', 'stylist', 'duration_minutes', 'discount', 'final_price')
 
     def validate(self, data):
         stylist_id = data.get('stylist_id')
@@ -228,21 +285,8 @@ class AppointmentSerializer(serializers.ModelSerializer):
                 missing_category_names = [cat.name for cat in missing_categories]
                 raise serializers.ValidationError({"stylist_id": f"Preferred stylist does not specialize in category(ies): {', '.join(missing_category_names)}."})
 
-            start_datetime = datetime.combine(appointment_date, appointment_time)
-            end_datetime = start_datetime + timedelta(minutes=total_duration)
-
-            conflicting_appointments = Appointment.objects.filter(
-                stylist=stylist,
-                appointment_date=appointment_date,
-                status__in=['pending', 'approved', 'rescheduled']
-            ).annotate(
-                existing_appointment_end_time=ExpressionWrapper(
-                    F('appointment_time') + timedelta(minutes=1) * F('duration_minutes'),
-                    output_field=fields.TimeField()
-                )
-            ).filter(
-                Q(appointment_time__lt=end_datetime.time()) &
-                Q(existing_appointment_end_time__gt=appointment_time)
+            conflicting_appointments = Appointment.objects.filter(stylist=stylist).overlapping(
+                appointment_date, appointment_time, total_duration
             )
 
             if self.instance:
@@ -254,50 +298,15 @@ class AppointmentSerializer(serializers.ModelSerializer):
             data['stylist'] = stylist
         else:
             required_category_ids = [cat.id for cat in required_categories]
-            available_stylists = Stylist.objects.filter(
-                is_available=True,
-                specialties__id__in=required_category_ids
-            ).annotate(
-                num_matching_specialties=Count('specialties', filter=Q(specialties__id__in=required_category_ids))
-            ).filter(
-                num_matching_specialties=len(required_category_ids)
-            ).distinct()
-
-            if not available_stylists.exists():
-                raise serializers.ValidationError({"detail": "No stylist available for the selected services' categories."})
-
-            potential_stylists = []
-            for s in available_stylists:
-                if s.working_hours_start and appointment_time < s.working_hours_start:
-                    continue
-                if s.working_hours_end and appointment_time > s.working_hours_end:
-                    continue
-
-                start_datetime = datetime.combine(appointment_date, appointment_time)
-                end_datetime = start_datetime + timedelta(minutes=total_duration)
-
-                conflicting_appointments = Appointment.objects.filter(
-                    stylist=s,
-                    appointment_date=appointment_date,
-                    status__in=['pending', 'approved', 'rescheduled']
-                ).annotate(
-                    existing_appointment_end_time=ExpressionWrapper(
-                        F('appointment_time') + timedelta(minutes=1) * F('duration_minutes'),
-                        output_field=fields.TimeField()
-                    )
-                ).filter(
-                    Q(appointment_time__lt=end_datetime.time()) &
-                    Q(existing_appointment_end_time__gt=appointment_time)
-                )
-                
-                if not conflicting_appointments.exists():
-                    potential_stylists.append(s)
-
-            if not potential_stylists:
+            assigned_stylist = assign_stylist(required_category_ids, appointment_date, appointment_time, total_duration)
+
+            if assigned_stylist is None:
+                if not qualified_stylists(required_category_ids).exists():
+                    raise serializers.ValidationError({"detail": "No stylist available for the selected services' categories."})
                 raise serializers.ValidationError({"detail": "No stylist available at the requested time for the selected services."})
 
-            assigned_stylist = potential_stylists[0]
             data['stylist'] = assigned_stylist
+            data['assignment_category_ids'] = required_category_ids
 
         now = timezone.now()
         appointment_datetime = datetime.combine(appointment_date, appointment_time)
@@ -316,11 +325,119 @@ class AppointmentSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         services = validated_data.pop('services')
         validated_data.pop('service_ids', None)
-        appointment = Appointment.objects.create(**validated_data)
-        appointment.services.set(services)
+        validated_data.pop('stylist_id', None)
+        redeem_points = validated_data.pop('redeem_points', False)
+        with transaction.atomic():
+            self._lock_and_recheck(validated_data)
+            # Looked up before the booking exists: once it does, it would
+            # count as the customer's earlier booking if _redeem reprices it.
+            first_booking = pricing.is_first_booking(validated_data['customer']) if redeem_points else None
+            quote = pricing.quote_for(
+                validated_data['customer'], services, redeem_points=redeem_points, first_booking=first_booking
+            )
+            try:
+                with transaction.atomic():
+                    appointment = Appointment.objects.create(
+                        **validated_data, discount=quote.discount, final_price=quote.final_price
+                    )
+            except IntegrityError:
+                # Postgres' exclusion constraint caught an overlap the lock didn't.
+                raise serializers.ValidationError({"detail": self.SLOT_TAKEN_MESSAGE})
+            appointment.services.set(services)
+            if quote.points:
+                self._redeem(appointment, services, quote, first_booking)
         return appointment
 
-class ReviewSerializer(serializers.ModelSerializer):
+    def _redeem(self, appointment, services, quote, first_booking):
+        try:
+            loyalty.redeem(
+                appointment.customer, quote.points, appointment=appointment, description=f'Redeemed: {quote.promotion.name}'
+            )
+        except loyalty.InsufficientPoints:
+            # The balance was spent since the quote; price it without redeeming.
+            quote = pricing.quote_for(appointment.customer, services, first_booking=first_booking)
+            appointment.discount, appointment.final_price = quote.discount, quote.final_price
+            appointment.save(update_fields=['discount', 'final_price'])
+
+    def update(self, instance, validated_data):
+        validated_data.pop('service_ids', None)
+        validated_data.pop('stylist_id', None)
+        # Prices are fixed at booking time.
+        validated_data.pop('redeem_points', None)
+        with transaction.atomic():
+            self._lock_and_recheck(validated_data, exclude=instance)
+            try:
+                with transaction.atomic():
+                    return super().update(instance, validated_data)
+            except IntegrityError:
+                raise serializers.ValidationError({"detail": self.SLOT_TAKEN_MESSAGE})
+
+    def _lock_and_recheck(self, validated_data, exclude=None):
+        """
+        validate() checks for conflicts without holding a lock, so two requests
+        can both pass it. Take the per-stylist, per-day booking lock and check
+        again before writing; the loser of the race gets a validation error.
+        """
+        stylist = validated_data['stylist']
+        appointment_date = validated_data['appointment_date']
+        appointment_time = validated_data['appointment_time']
+        duration = validated_data['duration_minutes']
+        # Set by validate() when the customer didn't pick a stylist, so losing
+        # the race for one stylist can fall through to the next free one.
+        category_ids = validated_data.pop('assignment_category_ids', None)
+        tried = []
+
+        while stylist is not None:
+            lock_stylist_day(stylist.id, appointment_date)
+            conflicts = Appointment.objects.filter(stylist=stylist).overlapping(appointment_date, appointment_time, duration)
+            if exclude is not None:
+                conflicts = conflicts.exclude(pk=exclude.pk)
+            if not conflicts.exists():
+                validated_data['stylist'] = stylist
+                return
+            if category_ids is None:
+                break
+            tried.append(stylist.id)
+            stylist = assign_stylist(category_ids, appointment_date, appointment_time, duration, exclude_ids=tried)
+
+        raise serializers.ValidationError({"detail": self.SLOT_TAKEN_MESSAGE})
+
+class AppointmentCompactSerializer(TimedModelSerializer):
+    """
+    Flat, read-only appointment shape for calendar views (``?view=compact``).
+    Pair it with AppointmentViewSet's compact queryset, which loads only the
+    columns read here.
+    """
+    customer_id = serializers.IntegerField(read_only=True)
+    customer_name = serializers.SerializerMethodField()
+    stylist_id = serializers.IntegerField(read_only=True)
+    stylist_name = serializers.SerializerMethodField()
+    service_ids = serializers.SerializerMethodField()
+    service_names = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Appointment
+        fields = (
+            'id', 'customer_id', 'customer_name', 'stylist_id', 'stylist_name', 'service_ids', 'service_names',
+            'appointment_date', 'appointment_time', 'duration_minutes', 'status', 'final_price'
+        )
+        read_only_fields = fields
+
+    def get_customer_name(self, obj):
+        return obj.customer.get_full_name() or obj.customer.email
+
+    def get_stylist_name(self, obj):
+        if obj.stylist is None:
+            return None
+        return obj.stylist.user.get_full_name() or obj.stylist.user.email
+
+    def get_service_ids(self, obj):
+        return [service.id for service in obj.services.all()]
+
+    def get_service_names(self, obj):
+        return [service.name for service in obj.services.all()]
+
+class ReviewSerializer(TimedModelSerializer):
     customer_name = serializers.SerializerMethodField()
     stylist_name = serializers.SerializerMethodField()
     appointment_id = serializers.IntegerField(write_only=True)
@@ -359,19 +476,25 @@ class ReviewSerializer(serializers.ModelSerializer):
         data['stylist'] = appointment.stylist
         return data
 
-class PromotionSerializer(serializers.ModelSerializer):
+class PromotionSerializer(TimedModelSerializer):
     class Meta:
         model = Promotion
         fields = '__all__'
 
-class LoyaltyPointSerializer(serializers.ModelSerializer):
+class LoyaltyPointSerializer(TimedModelSerializer):
     customer = UserSerializer(read_only=True)
     class Meta:
         model = LoyaltyPoint
         fields = '__all__'
         read_only_fields = ('customer',)
 
-class FavoriteStylistSerializer(serializers.ModelSerializer):
+class LoyaltyTransactionSerializer(TimedModelSerializer):
+    class Meta:
+        model = LoyaltyTransaction
+        fields = ('id', 'kind', 'points', 'appointment', 'description', 'created_at')
+        read_only_fields = fields
+
+class FavoriteStylistSerializer(TimedModelSerializer):
     stylist = StylistSerializer(read_only=True)
     stylist_id = serializers.IntegerField(write_only=True)
 
@@ -401,7 +524,7 @@ class FavoriteStylistSerializer(serializers.ModelSerializer):
 
         return favorite
 
-class SalonSettingSerializer(serializers.ModelSerializer):
+class SalonSettingSerializer(TimedModelSerializer):
     class Meta:
         model = SalonSetting
         fields = '__all__'
@@ -434,7 +557,17 @@ class AIStyleRecommendationOutputSerializer(serializers.Serializer):
 class AIRecommendationResponseSerializer(serializers.Serializer):
     recommendations = AIStyleRecommendationOutputSerializer(many=True)
 
-class ReferralSerializer(serializers.ModelSerializer):
+class SearchResultSerializer(TimedSerializer):
+    type = serializers.CharField(source='kind')
+    id = serializers.IntegerField(source='object_id')
+    title = serializers.CharField()
+    snippet = serializers.SerializerMethodField()
+    rank = serializers.FloatField()
+
+    def get_snippet(self, obj):
+        return Truncator(obj.body).chars(SNIPPET_LENGTH)
+
+class ReferralSerializer(TimedModelSerializer):
     referred_user = UserSerializer(read_only=True)
 
     class Meta:
@@ -0,0 +1,282 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import authentication, cache, embeddings, images, recommendations, search, snapshots
+from .models import (
+    ACTIVE_APPOINTMENT_STATUSES, User, Service, Stylist, Review, Promotion, FavoriteStylist, Category, PortfolioImage,
+    InspiredWork, Appointment
+)
+
+# Models whose writes invalidate cached catalog responses and ETags (see cache.py).
+CATALOG_MODELS = (Service, Category, Stylist, PortfolioImage, InspiredWork, Review, Promotion, FavoriteStylist, User)
+
+
+def _adjust_stylist_rating(stylist_id, rating_delta, count_delta):
+    if stylist_id is None:
+        return
+    Stylist.objects.filter(pk=stylist_id).update(
+        rating_sum=F('rating_sum') + rating_delta,
+        review_count=F('review_count') + count_delta,
+    )
+
+
+def _remember_loaded_rating(instance):
+    instance._loaded_stylist_id = instance.stylist_id
+    instance._loaded_rating = instance.rating
+
+
+@receiver(post_init, sender=Review)
+def track_review_rating(sender, instance, **kwargs):
+    _remember_loaded_rating(instance)
+
+
+@receiver(post_save, sender=Review)
+def add_review_to_stylist_rating(sender, instance, created, **kwargs):
+    if created:
+        _adjust_stylist_rating(instance.stylist_id, instance.rating, 1)
+    elif instance._loaded_rating is None:
+        # Saved without ever being loaded; the rebuild command repairs this.
+        pass
+    elif instance._loaded_stylist_id != instance.stylist_id:
+        _adjust_stylist_rating(instance._loaded_stylist_id, -instance._loaded_rating, -1)
+        _adjust_stylist_rating(instance.stylist_id, instance.rating, 1)
+    elif instance._loaded_rating != instance.rating:
+        _adjust_stylist_rating(instance.stylist_id, instance.rating - instance._loaded_rating, 0)
+    _remember_loaded_rating(instance)
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_from_stylist_rating(sender, instance, **kwargs):
+    if instance._loaded_rating is None:
+        return
+    _adjust_stylist_rating(instance._loaded_stylist_id, -instance._loaded_rating, -1)
+
+
+APPOINTMENT_SCHEDULE_FIELDS = {'stylist_id', 'appointment_date', 'appointment_time', 'duration_minutes', 'status'}
+
+
+def _schedule(instance):
+    return (
+        instance.stylist_id, instance.appointment_date, instance.appointment_time,
+        instance.duration_minutes, instance.status in ACTIVE_APPOINTMENT_STATUSES,
+    )
+
+
+@receiver(post_init, sender=Appointment)
+def track_appointment_schedule(sender, instance, **kwargs):
+    # Reading a deferred field would cost a query per row; such instances
+    # (and unsaved ones) only refresh the stylist-day they're saved to.
+    loaded = instance.pk and not APPOINTMENT_SCHEDULE_FIELDS & instance.get_deferred_fields()
+    instance._loaded_schedule = _schedule(instance) if loaded else None
+
+
+@receiver(post_save, sender=Appointment)
+def refresh_availability_snapshot(sender, instance, created, **kwargs):
+    # Runs in the saving transaction, so the bitmap commits (or rolls back)
+    # with the appointment. Saves that leave the schedule alone cost nothing.
+    loaded, current = instance._loaded_schedule, _schedule(instance)
+    if loaded != current:
+        keys = {(current[0], current[1])}
+        if loaded is not None:
+            keys.add((loaded[0], loaded[1]))
+        snapshots.refresh(keys)
+    instance._loaded_schedule = current
+
+
+@receiver(post_delete, sender=Appointment)
+def clear_availability_snapshot(sender, instance, **kwargs):
+    if not APPOINTMENT_SCHEDULE_FIELDS & instance.get_deferred_fields():
+        snapshots.refresh({(instance.stylist_id, instance.appointment_date)})
+
+
+ACCESS_FIELDS = ('role', 'is_active')
+
+
+@receiver(post_init, sender=User)
+def track_user_access(sender, instance, **kwargs):
+    loaded = instance.pk and not set(ACCESS_FIELDS) & instance.get_deferred_fields()
+    instance._loaded_access = (instance.role, instance.is_active) if loaded else None
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, signal, **kwargs):
+    authentication.user_cache.forget(instance.pk)
+    update_fields = kwargs.get('update_fields')
+    if kwargs.get('created') or (update_fields and not set(update_fields) & set(ACCESS_FIELDS)):
+        return
+    loaded, current = instance._loaded_access, (instance.role, instance.is_active)
+    instance._loaded_access = current
+    # Unknown (deferred) starting values count as changed.
+    if signal is post_delete or loaded != current:
+        authentication.publish_access(instance, deleted=signal is post_delete)
+
+
+# The User fields catalog responses render, all through the user nested in
+# StylistSerializer.
+LISTED_USER_FIELDS = (
+    'email', 'first_name', 'last_name', 'phone_number', 'role', 'is_staff', 'is_superuser', 'profile_image',
+    'referral_code',
+)
+
+
+def _listed_user(instance):
+    return tuple(getattr(getattr(instance, field), 'name', getattr(instance, field)) for field in LISTED_USER_FIELDS)
+
+
+@receiver(post_init, sender=User)
+def track_listed_user_fields(sender, instance, **kwargs):
+    # Reading a deferred field would cost a query per row.
+    loaded = instance.pk and not set(LISTED_USER_FIELDS) & instance.get_deferred_fields()
+    instance._loaded_listing = _listed_user(instance) if loaded else None
+
+
+def _user_listing_changed(instance, signal, **kwargs):
+    """
+    Whether a User write can change a catalog response: only stylists are
+    listed, and only LISTED_USER_FIELDS of theirs. Logins, password
+    upgrades and customers editing their profile leave the catalog alone. A
+    new user isn't listed until its Stylist row exists, which bumps on its
+    own.
+    """
+    update_fields = kwargs.get('update_fields')
+    if update_fields and not set(update_fields) & set(LISTED_USER_FIELDS):
+        return False
+    loaded, current = instance._loaded_listing, _listed_user(instance)
+    instance._loaded_listing = current
+    if kwargs.get('created'):
+        return False
+    roles = {current[LISTED_USER_FIELDS.index('role')]}
+    if loaded is not None:
+        roles.add(loaded[LISTED_USER_FIELDS.index('role')])
+    if 'stylist' not in roles:
+        return False
+    # Unknown (deferred) starting values count as changed.
+    return signal is post_delete or loaded != current
+
+
+def bump_catalog_version(sender, **kwargs):
+    if sender is User and not _user_listing_changed(**kwargs):
+        return
+    cache.bump_version(sender)
+
+
+def bump_stylist_version(sender, **kwargs):
+    if kwargs.get('action', '').startswith('post_'):
+        cache.bump_version(Stylist)
+
+
+for model in CATALOG_MODELS:
+    post_save.connect(bump_catalog_version, sender=model, dispatch_uid=f'catalog_save_{model._meta.label_lower}')
+    post_delete.connect(bump_catalog_version, sender=model, dispatch_uid=f'catalog_delete_{model._meta.label_lower}')
+m2m_changed.connect(bump_stylist_version, sender=Stylist.specialties.through, dispatch_uid='catalog_stylist_specialties')
+
+
+def refresh_recommendations(sender, **kwargs):
+    transaction.on_commit(recommendations.schedule_refresh)
+
+
+# Stylist changes need no refresh: specialists are looked up live.
+for model in (InspiredWork, Service, Category):
+    post_save.connect(refresh_recommendations, sender=model, dispatch_uid=f'recommendations_save_{model._meta.label_lower}')
+    post_delete.connect(refresh_recommendations, sender=model, dispatch_uid=f'recommendations_delete_{model._meta.label_lower}')
+
+
+def _queue_embedding(kind, pk):
+    def queue():
+        from .tasks import sync_image_embeddings
+        sync_image_embeddings.delay([[kind, pk]])
+    transaction.on_commit(queue)
+
+
+def embed_uploaded_image(sender, instance, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    _queue_embedding(EMBEDDED_MODELS[sender], instance.pk)
+
+
+def drop_image_embedding(sender, instance, **kwargs):
+    _queue_embedding(EMBEDDED_MODELS[sender], instance.pk)
+
+
+EMBEDDED_MODELS = {InspiredWork: embeddings.KIND_WORK, PortfolioImage: embeddings.KIND_PORTFOLIO}
+for model in EMBEDDED_MODELS:
+    post_save.connect(embed_uploaded_image, sender=model, dispatch_uid=f'embeddings_save_{model._meta.label_lower}')
+    post_delete.connect(drop_image_embedding, sender=model, dispatch_uid=f'embeddings_delete_{model._meta.label_lower}')
+
+
+def queue_image_variants(sender, instance, **kwargs):
+    field = images.IMAGE_FIELDS[sender]
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and field not in update_fields:
+        return
+    field_file = getattr(instance, field)
+    if not field_file or images.variants_ready(field_file):
+        return
+
+    transaction.on_commit(lambda: images.queue_variants(field_file.name, sender))
+
+
+for model in images.IMAGE_FIELDS:
+    post_save.connect(queue_image_variants, sender=model, dispatch_uid=f'image_variants_{model._meta.label_lower}')
+
+
+def index_search_document(sender, instance, **kwargs):
+    search.index(SEARCHED_MODELS[sender], [instance.pk])
+
+
+def drop_search_document(sender, instance, **kwargs):
+    search.remove(SEARCHED_MODELS[sender], [instance.pk])
+
+
+SEARCHED_MODELS = {Stylist: search.KIND_STYLIST, Service: search.KIND_SERVICE, InspiredWork: search.KIND_WORK}
+for model in SEARCHED_MODELS:
+    post_save.connect(index_search_document, sender=model, dispatch_uid=f'search_save_{model._meta.label_lower}')
+    post_delete.connect(drop_search_document, sender=model, dispatch_uid=f'search_delete_{model._meta.label_lower}')
+
+
+@receiver(post_save, sender=User)
+def reindex_stylist_name(sender, instance, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    if instance.role != 'stylist' or (update_fields and set(update_fields) == {'last_login'}):
+        return
+    search.index(search.KIND_STYLIST, Stylist.objects.filter(user_id=instance.pk).values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=Stylist.specialties.through)
+def reindex_stylist_specialties(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            search.index(search.KIND_STYLIST, [instance.pk])
+    elif action == 'pre_clear':
+        # post_clear doesn't say which stylists lost the category.
+        instance._cleared_stylist_ids = list(instance.stylists.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        search.index(search.KIND_STYLIST, instance._cleared_stylist_ids)
+    elif action.startswith('post_'):
+        search.index(search.KIND_STYLIST, pk_set)
+
+
+def _category_documents(category):
+    return (
+        list(category.stylists.values_list('pk', flat=True)),
+        list(category.services.values_list('pk', flat=True)),
+    )
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_documents(sender, instance, **kwargs):
+    instance._search_documents = _category_documents(instance)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def reindex_category_documents(sender, instance, **kwargs):
+    if kwargs.get('created'):
+        return
+    stylist_ids, service_ids = getattr(instance, '_search_documents', None) or _category_documents(instance)
+    search.index(search.KIND_STYLIST, stylist_ids)
+    search.index(search.KIND_SERVICE, service_ids)
@@ -0,0 +1,135 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import BinaryField, OuterRef, Subquery
+
+from .booking import lock_stylist_day
+from .models import Appointment, AvailabilitySnapshot
+
+SLOT_MINUTES = 5
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+BITMAP_BYTES = SLOTS_PER_DAY // 8
+
+
+def window_mask(start_minutes, duration_minutes):
+    """
+    The bits of every slot the window touches, clipped to the day. A window
+    that starts or ends mid-slot takes the whole slot.
+    """
+    first = max(start_minutes, 0) // SLOT_MINUTES
+    last = min(-(-(start_minutes + duration_minutes) // SLOT_MINUTES), SLOTS_PER_DAY)
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def encode(mask):
+    return mask.to_bytes(BITMAP_BYTES, 'little')
+
+
+def decode(value):
+    return int.from_bytes(bytes(value), 'little') if value else 0
+
+
+def is_free(mask, start_minutes, duration_minutes):
+    return not mask & window_mask(start_minutes, duration_minutes)
+
+
+def _masks(rows):
+    masks = defaultdict(int)
+    for stylist_id, appointment_date, appointment_time, duration in rows:
+        start = appointment_time.hour * 60 + appointment_time.minute
+        masks[(stylist_id, appointment_date)] |= window_mask(start, duration)
+    return masks
+
+
+def _active_rows(stylist_ids=None, dates=None):
+    queryset = Appointment.objects.active().exclude(stylist_id=None)
+    if stylist_ids is not None:
+        queryset = queryset.filter(stylist_id__in=list(stylist_ids))
+    if dates is not None:
+        queryset = queryset.filter(appointment_date__in=list(dates))
+    return queryset.values_list('stylist_id', 'appointment_date', 'appointment_time', 'duration_minutes')
+
+
+def load_masks(stylist_ids, dates):
+    """
+    ``{(stylist_id, date): busy bitmap}`` for the given stylists and dates,
+    in one query. Days without a snapshot have nothing booked.
+    """
+    rows = AvailabilitySnapshot.objects.filter(
+        stylist_id__in=list(stylist_ids), date__in=list(dates)
+    ).values_list('stylist_id', 'date', 'busy')
+    return {(stylist_id, day): decode(busy) for stylist_id, day, busy in rows}
+
+
+def with_busy(stylists, day):
+    """
+    Annotates a Stylist queryset with ``busy_bitmap``, each stylist's raw
+    snapshot for ``day`` (None if nothing is booked; see ``decode``), so the
+    bitmaps come back with the stylists rather than in a second query.
+    """
+    return stylists.annotate(busy_bitmap=Subquery(
+        AvailabilitySnapshot.objects.filter(stylist=OuterRef('pk'), date=day).values('busy')[:1],
+        output_field=BinaryField(),
+    ))
+
+
+def _write(masks, keys):
+    """
+    Stores ``masks`` for ``keys``; keys whose mask is empty lose their row.
+    """
+    empty = [key for key in keys if not masks.get(key)]
+    rows = [
+        AvailabilitySnapshot(stylist_id=stylist_id, date=day, busy=encode(masks[(stylist_id, day)]))
+        for stylist_id, day in keys if masks.get((stylist_id, day))
+    ]
+    with transaction.atomic(savepoint=False):
+        if rows:
+            AvailabilitySnapshot.objects.bulk_create(
+                rows, update_conflicts=True, unique_fields=['stylist', 'date'], update_fields=['busy'], batch_size=1000
+            )
+        for stylist_id, day in empty:
+            AvailabilitySnapshot.objects.filter(stylist_id=stylist_id, date=day).delete()
+
+
+def refresh(keys):
+    """
+    Recomputes the snapshots of the given ``(stylist_id, date)`` keys from
+    their active appointments. Called on every appointment change, so one
+    booking costs a read of that stylist's day and one upsert. Each day is
+    locked first, as booking does, so concurrent changes to the same day
+    can't each write a bitmap missing the other's appointment.
+    """
+    keys = {key for key in keys if key[0] is not None}
+    if not keys:
+        return
+    with transaction.atomic(savepoint=False):
+        for stylist_id, day in sorted(keys):
+            lock_stylist_day(stylist_id, day)
+        rows = (
+            row for row in _active_rows({stylist_id for stylist_id, _ in keys}, {day for _, day in keys})
+            if (row[0], row[1]) in keys
+        )
+        _write(_masks(rows), keys)
+
+
+def rebuild(check=False, since=None):
+    """
+    Recomputes every snapshot (from ``since`` on, if given) from the
+    appointments and compares it with what is stored. Unless ``check``,
+    drifted rows are rewritten. Returns the drifted ``(stylist_id, date)``
+    keys.
+    """
+    rows = _active_rows()
+    stored = AvailabilitySnapshot.objects.values_list('stylist_id', 'date', 'busy')
+    if since is not None:
+        rows = rows.filter(appointment_date__gte=since)
+        stored = stored.filter(date__gte=since)
+    expected = _masks(rows.iterator())
+    actual = {(stylist_id, day): decode(busy) for stylist_id, day, busy in stored.iterator()}
+
+    drifted = sorted(key for key in set(expected) | set(actual) if expected.get(key, 0) != actual.get(key, 0))
+    if drifted and not check:
+        _write(expected, drifted)
+    return drifted
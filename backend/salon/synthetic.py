@@ -0,0 +1,213 @@
+import random
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from . import cache, search, snapshots
+from .models import ACTIVE_APPOINTMENT_STATUSES, Appointment, Category, Review, Service, Stylist, User
+from .referrals import allocate_codes
+
+# Every synthetic account lives under this domain, so they can be found and
+# flushed without touching real data. They all share PASSWORD.
+DOMAIN = 'synthetic.invalid'
+PASSWORD = 'password123'
+
+# (category, [(service, price, minutes, popularity)])
+CATALOG = (
+    ('Hair', [('Haircut', 50, 45, 10), ('Hair Coloring', 120, 90, 4), ('Highlights', 150, 120, 2), ('Blow Dry', 35, 30, 5)]),
+    ('Nails', [('Manicure', 30, 30, 8), ('Pedicure', 40, 45, 5), ('Nail Art', 25, 30, 3)]),
+    ('Beauty', [('Facial', 80, 60, 4), ('Eyebrow Waxing', 20, 15, 6), ('Makeup Application', 75, 60, 2)]),
+)
+SHIFTS = ((time(8), time(16)), (time(9), time(17)), (time(10), time(18)), (time(11), time(19)))
+# Demand by weekday (Monday first), as a multiple of the base occupancy.
+WEEKDAY_DEMAND = (0.6, 0.8, 0.9, 1.0, 1.2, 1.4, 0.3)
+SLOT_MINUTES = 15
+PAST_STATUSES = (('completed', 85), ('cancelled', 10), ('rejected', 5))
+FUTURE_STATUSES = (('approved', 60), ('pending', 40))
+RATINGS = ((5, 50), (4, 30), (3, 12), (2, 5), (1, 3))
+REVIEW_RATE = 0.35
+COMBO_RATE = 0.15
+# Customers are picked as int(n * random() ** SKEW): a minority of regulars
+# makes most of the bookings, as in a real salon.
+CUSTOMER_SKEW = 2.5
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def flush(domain=DOMAIN):
+    """
+    Deletes the synthetic accounts and everything that cascades from them
+    (their stylists, appointments and reviews).
+    """
+    return User.objects.filter(email__endswith='@' + domain).delete()[0]
+
+
+def ensure_catalog():
+    """
+    The categories and services in CATALOG, created if missing. Returns
+    ``{category: [(service, popularity)]}``.
+    """
+    catalog = {}
+    for category_name, services in CATALOG:
+        category, _ = Category.objects.get_or_create(name=category_name)
+        catalog[category] = []
+        for name, price, minutes, popularity in services:
+            service, _ = Service.objects.get_or_create(
+                name=name, category=category,
+                defaults={'price': Decimal(price), 'duration_minutes': minutes, 'description': f'{name} (synthetic).'},
+            )
+            catalog[category].append((service, popularity))
+    return catalog
+
+
+def _create_users(emails, role, password, batch_size, first_names=None):
+    created = []
+    for batch in _batches(emails, batch_size):
+        with transaction.atomic():
+            codes = allocate_codes(batch)
+            users = [
+                User(email=email, password=password, role=role, referral_code=code,
+                     first_name=(first_names or {}).get(email, ''), last_name='Synthetic')
+                for email, code in zip(batch, codes)
+            ]
+            created += User.objects.bulk_create(users, batch_size=batch_size)
+    return created
+
+
+def _day_bookings(rng, shift, demand, services):
+    """
+    ``[(start, [service, ...])]`` for one stylist-day: walks the shift,
+    booking with probability ``demand`` at each free slot.
+    """
+    start = datetime.combine(date.min, shift[0])
+    end = datetime.combine(date.min, shift[1])
+    bookings = []
+    while start < end:
+        if rng.random() >= demand:
+            start += timedelta(minutes=SLOT_MINUTES * rng.choice((1, 2)))
+            continue
+        chosen = [_weighted(rng, services)]
+        if len(services) > 1 and rng.random() < COMBO_RATE:
+            extra = _weighted(rng, services)
+            if extra != chosen[0]:
+                chosen.append(extra)
+        minutes = sum(service.duration_minutes for service in chosen)
+        if start + timedelta(minutes=minutes) > end:
+            break
+        bookings.append((start.time(), chosen))
+        start += timedelta(minutes=minutes)
+    return bookings
+
+
+def generate(stylists=20, customers=1000, days=90, future_days=28, occupancy=0.55, seed=0,
+             batch_size=5000, domain=DOMAIN, today=None, progress=None):
+    """
+    Bulk-creates a synthetic salon: ``stylists`` stylists on fixed shifts,
+    ``customers`` customers, and appointments for every stylist over the past
+    ``days`` days and the next ``future_days``. Booking density follows
+    ``occupancy`` scaled by WEEKDAY_DEMAND; past appointments are mostly
+    completed and about a third of those reviewed. Deterministic for a given
+    ``seed``. Returns counts of what was created.
+    """
+    rng = random.Random(seed)
+    today = today or date.today()
+    password = make_password(PASSWORD)
+    catalog = ensure_catalog()
+    categories = list(catalog)
+
+    # Numbered on from any earlier run's accounts, so runs without a flush add to them.
+    first_customer = User.objects.filter(email__endswith='@' + domain, role='customer').count()
+    customer_users = _create_users(
+        (f'customer{i}@{domain}' for i in range(first_customer, first_customer + customers)), 'customer', password, batch_size
+    )
+    customer_ids = [user.id for user in customer_users]
+    first_stylist = User.objects.filter(email__endswith='@' + domain, role='stylist').count()
+    stylist_users = _create_users(
+        [f'stylist{i}@{domain}' for i in range(first_stylist, first_stylist + stylists)], 'stylist', password, batch_size
+    )
+    if not User.objects.filter(email=f'admin@{domain}').exists():
+        _create_users([f'admin@{domain}'], 'admin', password, batch_size)
+
+    stylist_rows = Stylist.objects.bulk_create([
+        Stylist(user=user, bio='Synthetic stylist.', working_hours_start=shift[0], working_hours_end=shift[1])
+        for user, shift in ((user, rng.choice(SHIFTS)) for user in stylist_users)
+    ], batch_size=batch_size)
+    specialties = {}
+    through = []
+    for stylist in stylist_rows:
+        chosen = rng.sample(categories, k=1 if rng.random() < 0.7 else 2)
+        specialties[stylist.id] = [(service, popularity) for category in chosen for service, popularity in catalog[category]]
+        through += [Stylist.specialties.through(stylist_id=stylist.id, category_id=category.id) for category in chosen]
+    Stylist.specialties.through.objects.bulk_create(through, batch_size=batch_size)
+
+    counts = {'customers': len(customer_ids), 'stylists': len(stylist_rows), 'appointments': 0, 'reviews': 0}
+    if not customer_ids:
+        return counts
+    dates = [today + timedelta(days=offset) for offset in range(-days, future_days)]
+    for day in dates:
+        demand = min(occupancy * WEEKDAY_DEMAND[day.weekday()], 0.95)
+        statuses = PAST_STATUSES if day < today else FUTURE_STATUSES
+        appointments, services_per_appointment = [], []
+        for stylist in stylist_rows:
+            shift = (stylist.working_hours_start, stylist.working_hours_end)
+            for start, chosen in _day_bookings(rng, shift, demand, specialties[stylist.id]):
+                price = sum(service.price for service in chosen)
+                appointments.append(Appointment(
+                    customer_id=customer_ids[int(len(customer_ids) * rng.random() ** CUSTOMER_SKEW)],
+                    stylist_id=stylist.id, appointment_date=day, appointment_time=start,
+                    duration_minutes=sum(service.duration_minutes for service in chosen),
+                    status=_weighted(rng, statuses), final_price=price,
+                ))
+                services_per_appointment.append(chosen)
+
+        with transaction.atomic():
+            Appointment.objects.bulk_create(appointments, batch_size=batch_size)
+            Appointment.services.through.objects.bulk_create([
+                Appointment.services.through(appointment_id=appointment.id, service_id=service.id)
+                for appointment, chosen in zip(appointments, services_per_appointment) for service in chosen
+            ], batch_size=batch_size)
+            reviews = [
+                Review(appointment_id=appointment.id, customer_id=appointment.customer_id,
+                       stylist_id=appointment.stylist_id, rating=_weighted(rng, RATINGS))
+                for appointment in appointments
+                if appointment.status == 'completed' and rng.random() < REVIEW_RATE
+            ]
+            Review.objects.bulk_create(reviews, batch_size=batch_size)
+            # bulk_create skips the signals that keep availability snapshots in step.
+            snapshots.refresh({
+                (appointment.stylist_id, day) for appointment in appointments
+                if appointment.status in ACTIVE_APPOINTMENT_STATUSES
+            })
+        counts['appointments'] += len(appointments)
+        counts['reviews'] += len(reviews)
+        if progress:
+            progress(day, counts)
+
+    # bulk_create skips the Review signals that keep these in sync.
+    totals = Review.objects.filter(stylist__in=stylist_rows).order_by().values('stylist_id').annotate(
+        rating_sum=Sum('rating'), review_count=Count('id')
+    )
+    by_stylist = {row['stylist_id']: row for row in totals}
+    for stylist in stylist_rows:
+        row = by_stylist.get(stylist.id, {'rating_sum': 0, 'review_count': 0})
+        stylist.rating_sum, stylist.review_count = row['rating_sum'], row['review_count']
+    Stylist.objects.bulk_update(stylist_rows, ['rating_sum', 'review_count'], batch_size=batch_size)
+    search.index(search.KIND_STYLIST, [stylist.id for stylist in stylist_rows])
+
+    # ...and the ones that invalidate cached catalog responses.
+    for model in (User, Stylist, Service, Category, Review):
+        cache.bump_version(model)
+    return counts
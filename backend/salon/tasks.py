@@ -1,33 +1,66 @@
 
+import io
+
 from celery import shared_task
-from .models import Style, Stylist
-import random
+
+from . import cache, embeddings, images, recommendations
+
 
 @shared_task
 def get_style_recommendation(preferences: str, image_data: bytes = None):
     """
-    This is a placeholder for the actual AI style recommendation logic.
-    It returns a list of style recommendations based on the provided preferences.
-    """
-    # In a real implementation, you would use a machine learning model
-    # to find styles that match the prompt and/or image.
-    
-    # For now, we'll just return a random selection of 5 styles.
-    all_styles = list(Style.objects.all())
-    if len(all_styles) > 5:
-        recommended_styles = random.sample(all_styles, 5)
-    else:
-        recommended_styles = all_styles
-
-    recommendations = []
-    for style in recommended_styles:
-        # Try to find a stylist who specializes in the style's category
-        specialist = Stylist.objects.filter(specialties=style.category).order_by('?').first()
-
-        recommendations.append({
-            "description": style.description,
-            "imageUrl": style.image.url if style.image else "",
-            "specialistId": specialist.id if specialist else None,
-        })
-        
-    return recommendations
+    Returns up to 5 looks matching ``preferences`` and/or resembling the
+    photo in ``image_data``, each with a specialist (see recommendations.py).
+    """
+    image = io.BytesIO(image_data) if image_data else None
+    return recommendations.recommend(preferences, limit=5, image=image)
+
+
+@shared_task
+def refresh_recommendation_index():
+    """
+    Re-indexes inspired work that changed since the last refresh. Queued by
+    catalog writes (signals.py); safe to run on a schedule as well.
+    """
+    return recommendations.refresh_index()
+
+
+@shared_task
+def sync_image_embeddings(keys=None):
+    """
+    Embeds new or replaced inspired-work and portfolio images and drops
+    deleted ones. Uploads queue it for their own rows (signals.py); run it
+    without ``keys`` as a batch job to reconcile everything.
+    """
+    return embeddings.sync(keys)
+
+
+@shared_task
+def compact_loyalty_ledger(retention_days=None):
+    """
+    Periodic job: folds loyalty ledger rows older than the retention window
+    into one snapshot row per customer.
+    """
+    from datetime import timedelta
+    from django.conf import settings
+    from django.utils import timezone
+    from .loyalty import compact_ledger
+
+    retention_days = retention_days or getattr(settings, 'LOYALTY_LEDGER_RETENTION_DAYS', 365)
+    return compact_ledger(timezone.now() - timedelta(days=retention_days))
+
+
+@shared_task
+def generate_image_variants(name, model_label=None):
+    """
+    Writes the resized WebP/JPEG variants of an uploaded image, records on
+    the ``model_label`` rows showing it that they exist, and invalidates that
+    model's cached responses so they pick up the direct variant URLs.
+    """
+    written = images.generate_variants(name)
+    if written is not None and model_label:
+        from django.apps import apps
+        model = apps.get_model(model_label)
+        if images.mark_ready(model, name):
+            cache.bump_version(model)
+    return written
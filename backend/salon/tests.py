@@ -1,3 +1,1683 @@
-from django.test import TestCase
+import json
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from time import monotonic
+from unittest import mock
+from urllib.parse import unquote
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, is_password_usable
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from drf_yasg import openapi
+from drf_yasg.generators import OpenAPISchemaGenerator
+from PIL import Image
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import (
+    authentication, availability, cache, embeddings, images, loyalty, media, metrics, onboarding, passwords, pricing,
+    recommendations, search, snapshots, synthetic, tasks,
+)
+from .assignment import assign_stylist, free_stylists
+from .availability import get_availability
+from .models import (
+    User, Category, Service, Stylist, Appointment, Review, Promotion, PortfolioImage, FavoriteStylist,
+    LoyaltyPoint, LoyaltyTransaction, InspiredWork, AvailabilitySnapshot, SearchDocument
+)
+from .serializers import AppointmentSerializer, ServiceSerializer
+
+logger = logging.getLogger(__name__)
+
+
+class StylistListQueryCountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.customer = User.objects.create_user(email='customer@example.com', password='password123', role='customer')
+        self.hair = Category.objects.create(name='Hair')
+        self.service = Service.objects.create(name='Haircut', price=50, duration_minutes=45, category=self.hair)
+
+    def create_stylists(self, count):
+        for _ in range(count):
+            index = Stylist.objects.count()
+            user = User.objects.create_user(email=f'stylist{index}@example.com', password='password123', role='stylist')
+            stylist = Stylist.objects.create(user=user)
+            stylist.specialties.add(self.hair)
+            PortfolioImage.objects.create(stylist=stylist, image=f'portfolio_images/{index}.png')
+            appointment = Appointment.objects.create(
+                customer=self.customer, stylist=stylist, appointment_date=date(2030, 1, 1),
+                appointment_time=time(10, 0), status='completed'
+            )
+            Review.objects.create(appointment=appointment, customer=self.customer, stylist=stylist, rating=4)
+            FavoriteStylist.objects.create(customer=self.customer, stylist=stylist)
+
+    def count_list_queries(self, url='/api/salon/stylists/'):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_stylist_list_query_count_is_constant(self):
+        self.create_stylists(2)
+        small, _ = self.count_list_queries()
+        self.create_stylists(10)
+        large, data = self.count_list_queries()
+        self.assertEqual(small, large)
+        self.assertEqual(len(data), 12)
+
+    def test_authenticated_stylist_list_query_count_is_constant(self):
+        self.client.force_authenticate(self.customer)
+        self.create_stylists(2)
+        small, _ = self.count_list_queries()
+        self.create_stylists(10)
+        large, data = self.count_list_queries()
+        self.assertEqual(small, large)
+        self.assertTrue(all(stylist['is_favorited'] for stylist in data))
+
+    def test_available_for_service_query_count_is_constant(self):
+        url = f'/api/salon/stylists/available-for-service/?service_id={self.service.id}'
+        self.create_stylists(2)
+        small, _ = self.count_list_queries(url)
+        self.create_stylists(10)
+        large, _ = self.count_list_queries(url)
+        self.assertEqual(small, large)
+
+    def test_available_for_service_time_window(self):
+        self.create_stylists(3)
+        busy, late, free = Stylist.objects.order_by('id')
+        Stylist.objects.filter(pk=late.pk).update(working_hours_start=time(12, 0))
+        day = date(2030, 1, 2)
+        Appointment.objects.create(
+            customer=self.customer, stylist=busy, appointment_date=day, appointment_time=time(8, 0), duration_minutes=150
+        )
+        url = f'/api/salon/stylists/available-for-service/?service_id={self.service.id}&date={day}'
+
+        data = self.client.get(url).json()
+        self.assertEqual(
+            [(stylist['id'], stylist['next_free_slot']) for stylist in data],
+            [(busy.id, '10:30'), (late.id, '12:00'), (free.id, '08:00')]
+        )
+        data = self.client.get(f'{url}&time=10:00').json()
+        self.assertEqual([stylist['id'] for stylist in data], [free.id])
+        data = self.client.get(f'{url}&time=10:30&duration=30').json()
+        self.assertEqual([stylist['id'] for stylist in data], [busy.id, free.id])
+        self.assertEqual(self.client.get(f'{url}&time=25:00').status_code, 400)
+        self.assertNotIn('next_free_slot', self.client.get(url.replace(f'&date={day}', '')).json()[0])
+
+        small, _ = self.count_list_queries(f'{url}&time=10:00')
+        self.create_stylists(10)
+        large, data = self.count_list_queries(f'{url}&time=10:00')
+        self.assertEqual(small, large)
+        self.assertEqual(len(data), 11)
+
+    def test_annotated_values_match_serializer_fallback(self):
+        self.create_stylists(1)
+        stylist = Stylist.objects.get()
+        other = User.objects.create_user(email='other@example.com', password='password123', role='customer')
+        appointment = Appointment.objects.create(
+            customer=other, stylist=stylist, appointment_date=date(2030, 1, 2),
+            appointment_time=time(11, 0), status='completed'
+        )
+        Review.objects.create(appointment=appointment, customer=other, stylist=stylist, rating=5)
+        self.client.force_authenticate(self.customer)
+
+        data = self.client.get(f'/api/salon/stylists/{stylist.id}/').json()
+        self.assertEqual(data['rating'], 4.5)
+        self.assertEqual(data['reviewCount'], 2)
+        self.assertTrue(data['is_favorited'])
+        self.assertEqual(len(data['portfolio']), 1)
+        self.assertTrue(data['imageUrl'].endswith('/media/portfolio_images/0.png'))
+
+
+class StylistRatingAggregateTests(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(email='customer@example.com', password='password123', role='customer')
+        self.stylist = Stylist.objects.create(
+            user=User.objects.create_user(email='stylist@example.com', password='password123', role='stylist')
+        )
+        self.other_stylist = Stylist.objects.create(
+            user=User.objects.create_user(email='other@example.com', password='password123', role='stylist')
+        )
+
+    def create_review(self, rating, stylist=None, day=1):
+        stylist = stylist or self.stylist
+        appointment = Appointment.objects.create(
+            customer=self.customer, stylist=stylist, appointment_date=date(2030, 1, day),
+            appointment_time=time(10, 0), status='completed'
+        )
+        return Review.objects.create(appointment=appointment, customer=self.customer, stylist=stylist, rating=rating)
+
+    def assertAggregates(self, stylist, rating_sum, review_count):
+        stylist.refresh_from_db()
+        self.assertEqual((stylist.rating_sum, stylist.review_count), (rating_sum, review_count))
+
+    def test_create_edit_and_delete_keep_aggregates_in_sync(self):
+        review = self.create_review(4)
+        self.create_review(2, day=2)
+        self.assertAggregates(self.stylist, 6, 2)
+        self.assertEqual(self.stylist.average_rating, 3.0)
+
+        review.rating = 5
+        review.save()
+        review.save()
+        self.assertAggregates(self.stylist, 7, 2)
+
+        review.stylist = self.other_stylist
+        review.save()
+        self.assertAggregates(self.stylist, 2, 1)
+        self.assertAggregates(self.other_stylist, 5, 1)
+
+        Review.objects.filter(pk=review.pk).delete()
+        self.assertAggregates(self.other_stylist, 0, 0)
+        self.assertEqual(self.other_stylist.average_rating, 0.0)
+
+    def test_rebuild_command_repairs_drift(self):
+        self.create_review(3)
+        Stylist.objects.filter(pk=self.stylist.pk).update(rating_sum=99, review_count=7)
+
+        with self.assertRaisesMessage(CommandError, '1 stylist(s) drifted.'):
+            call_command('rebuild_stylist_ratings', '--check', stdout=StringIO())
+        self.assertAggregates(self.stylist, 99, 7)
+
+        out = StringIO()
+        call_command('rebuild_stylist_ratings', stdout=out)
+        self.assertIn(f'Stylist {self.stylist.id}', out.getvalue())
+        self.assertAggregates(self.stylist, 3, 1)
+
+    def test_stylists_can_be_ordered_by_rating(self):
+        self.create_review(2)
+        self.create_review(5, stylist=self.other_stylist, day=2)
+        data = APIClient().get('/api/salon/stylists/?ordering=-rating').json()
+        self.assertEqual([s['id'] for s in data], [self.other_stylist.id, self.stylist.id])
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.get_cache().clear()
+        cache.stats.reset()
+        self.client = APIClient()
+        self.hair = Category.objects.create(name='Hair')
+        self.service = Service.objects.create(name='Haircut', price=50, duration_minutes=45, category=self.hair)
+
+    def test_repeated_reads_are_served_from_cache(self):
+        first = self.client.get('/api/salon/services/').json()
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/salon/services/').json()
+        self.assertEqual(first, second)
+        self.assertEqual(cache.stats.as_dict(), {'hits': 1, 'misses': 1})
+
+    def test_query_params_are_part_of_the_key(self):
+        self.client.get('/api/salon/categories/')
+        self.client.get('/api/salon/categories/?page=2')
+        self.assertEqual(cache.stats.as_dict(), {'hits': 0, 'misses': 2})
+
+    def test_writes_invalidate_dependent_endpoints(self):
+        self.client.get('/api/salon/services/')
+        self.client.get('/api/salon/categories/')
+        self.hair.name = 'Hair & Scalp'
+        self.hair.save()
+
+        services = self.client.get('/api/salon/services/').json()
+        self.assertEqual(services[0]['category_name'], 'Hair & Scalp')
+        Service.objects.create(name='Colour', price=80, duration_minutes=60, category=self.hair)
+        self.assertEqual(len(self.client.get('/api/salon/services/').json()), 2)
+        self.assertEqual(cache.stats.as_dict(), {'hits': 0, 'misses': 4})
+
+    def test_stylist_entries_vary_on_user(self):
+        customer = User.objects.create_user(email='customer@example.com', password='password123', role='customer')
+        stylist = Stylist.objects.create(
+            user=User.objects.create_user(email='stylist@example.com', password='password123', role='stylist')
+        )
+        FavoriteStylist.objects.create(customer=customer, stylist=stylist)
+
+        self.assertFalse(self.client.get('/api/salon/stylists/').json()[0]['is_favorited'])
+        self.client.force_authenticate(customer)
+        self.assertTrue(self.client.get('/api/salon/stylists/').json()[0]['is_favorited'])
+
+    def test_only_listed_stylist_fields_invalidate_stylists(self):
+        stylist_user = User.objects.create_user(email='stylist@example.com', password='password123', role='stylist')
+        Stylist.objects.create(user=stylist_user)
+        customer = User.objects.create_user(email='customer@example.com', password='password123', role='customer')
+        version = cache.get_versions([User])
+
+        stylist_user.set_password('another-password')
+        stylist_user.save(update_fields=['password'])
+        stylist_user.last_login = timezone.now()
+        stylist_user.save()
+        customer.first_name = 'Casey'
+        customer.save()
+        self.assertEqual(cache.get_versions([User]), version)
+
+        stylist_user = User.objects.get(pk=stylist_user.pk)
+        stylist_user.first_name = 'Sam'
+        stylist_user.save()
+        self.assertNotEqual(cache.get_versions([User]), version)
+
+    @override_settings(DEBUG=False)
+    def test_process_local_cache_is_refused_outside_debug(self):
+        with self.assertRaises(ImproperlyConfigured):
+            cache.require_shared_cache()
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp'}}
+        with override_settings(CACHES=shared):
+            cache.require_shared_cache()
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.hair = Category.objects.create(name='Hair')
+        Service.objects.create(name='Haircut', price=50, duration_minutes=45, category=self.hair)
+
+    def test_matching_etag_returns_304_without_queries(self):
+        response = self.client.get('/api/salon/services/')
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'))
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/salon/services/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_etag_changes_when_catalog_changes(self):
+        etag = self.client.get('/api/salon/promotions/')['ETag']
+        Promotion.objects.create(name='Summer', promo_type='percentage', discount_value=10)
+        response = self.client.get('/api/salon/promotions/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()), 1)
+
+    def test_if_modified_since(self):
+        # Written ten seconds ago, so Last-Modified is settled.
+        for model in ('salon.category', 'salon.service'):
+            cache.get_cache().set(cache.MODIFIED_KEY_PREFIX + model, timezone.now().timestamp() - 10)
+        last_modified = self.client.get('/api/salon/categories/')['Last-Modified']
+        response = self.client.get('/api/salon/categories/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get('/api/salon/categories/', HTTP_IF_MODIFIED_SINCE='Thu, 01 Jan 1970 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+
+    def test_writes_within_the_current_second_are_never_not_modified(self):
+        Category.objects.create(name='Nails')
+        response = self.client.get('/api/salon/categories/')
+        self.assertNotIn('Last-Modified', response)
+        response = self.client.get(
+            '/api/salon/categories/', HTTP_IF_MODIFIED_SINCE=http_date(int(timezone.now().timestamp()))
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_a_write_through_one_process_changes_the_etag_every_process_sends(self):
+        location = tempfile.mkdtemp()
+        backend = 'django.core.cache.backends.filebased.FileBasedCache'
+        caches = {alias: {'BACKEND': backend, 'LOCATION': location} for alias in ('web', 'worker')}
+        with override_settings(CACHES=caches, CATALOG_CACHE_ALIAS='web'):
+            etag = self.client.get('/api/salon/promotions/')['ETag']
+        with override_settings(CACHES=caches, CATALOG_CACHE_ALIAS='worker'):
+            Promotion.objects.create(name='Summer', promo_type='percentage', discount_value=10)
+        with override_settings(CACHES=caches, CATALOG_CACHE_ALIAS='web'):
+            response = self.client.get('/api/salon/promotions/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(email='admin@example.com', password='password123', role='admin')
+        self.customer = User.objects.create_user(email='customer@example.com', password='password123', role='customer')
+        self.stylist = Stylist.objects.create(
+            user=User.objects.create_user(email='stylist@example.com', password='password123', role='stylist')
+        )
+        # Several appointments share a date and time so the pk tie-breaker matters.
+        for day in range(1, 6):
+            for hour in (10, 10, 11):
+                Appointment.objects.create(
+                    customer=self.customer, stylist=self.stylist, appointment_date=date(2030, 1, day),
+                    appointment_time=time(hour, 0), status='completed'
+                )
+
+    def collect(self, url, key='next'):
+        ids, pages = [], 0
+        while url:
+            data = self.client.get(url).json()
+            ids.extend(row['id'] for row in data['results'])
+            url = data[key]
+            pages += 1
+        return ids, pages
+
+    def test_pages_follow_model_ordering_without_gaps_or_duplicates(self):
+        self.client.force_authenticate(self.admin)
+        expected = list(Appointment.objects.order_by('appointment_date', 'appointment_time', 'id').values_list('id', flat=True))
+        ids, pages = self.collect('/api/salon/appointments/?page_size=4')
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 4)
+
+    def test_previous_links_walk_back(self):
+        self.client.force_authenticate(self.admin)
+        first = self.client.get('/api/salon/appointments/?page_size=4').json()
+        second = self.client.get(first['next']).json()
+        self.assertEqual(self.client.get(second['previous']).json()['results'], first['results'])
+        self.assertIsNone(first['previous'])
+
+    def test_descending_ordering(self):
+        for appointment in Appointment.objects.all()[:5]:
+            Review.objects.create(appointment=appointment, customer=self.customer, stylist=self.stylist, rating=5)
+        expected = list(Review.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        ids, _ = self.collect('/api/salon/reviews/?page_size=2')
+        self.assertEqual(ids, expected)
+
+    def test_invalid_cursor_is_404(self):
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get('/api/salon/appointments/?cursor=nope').status_code, 404)
+
+
+class QueryPlanTests(TestCase):
+    """
+    Pins the booking hot paths to their indexes. Tables are tiny in tests, so
+    on Postgres sequential scans are disabled to make the planner show which
+    index it would use at scale.
+    """
+
+    def setUp(self):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest('Query plans are only asserted on SQLite and Postgres.')
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, table, indexes):
+        plan = queryset.explain()
+        self.assertTrue(any(index in plan for index in indexes), plan)
+        self.assertNotIn(f'SCAN {table}\n', plan + '\n')
+        self.assertNotIn(f'Seq Scan on {table}', plan)
+
+    def active_stylist_indexes(self):
+        # Without statistics SQLite ties the partial index with the full
+        # schedule index, which leads with the same columns, and takes the
+        # latter. Postgres must pick the partial one.
+        if connection.vendor == 'postgresql':
+            return ['appt_stylist_active_idx']
+        return ['appt_stylist_active_idx', 'appt_stylist_schedule_idx']
+
+    def test_booking_conflict_check(self):
+        queryset = Appointment.objects.filter(stylist_id=1).overlapping(date(2030, 1, 1), time(10, 0), 60)
+        self.assertUsesIndex(queryset, 'salon_appointment', self.active_stylist_indexes())
+
+    def test_availability_scan(self):
+        queryset = Appointment.objects.active().filter(stylist_id=1, appointment_date=date(2030, 1, 1))
+        self.assertUsesIndex(queryset, 'salon_appointment', self.active_stylist_indexes())
+
+    def test_availability_snapshot_lookup(self):
+        queryset = AvailabilitySnapshot.objects.filter(stylist_id=1, date=date(2030, 1, 1))
+        self.assertUsesIndex(queryset, 'salon_availabilitysnapshot', [
+            'availability_snapshot_stylist_date', 'sqlite_autoindex_salon_availabilitysnapshot'
+        ])
+
+    def test_reviews_for_stylist(self):
+        queryset = Review.objects.filter(stylist_id=1).order_by('-created_at')
+        self.assertUsesIndex(queryset, 'salon_review', ['review_stylist_recent_idx'])
+
+    def test_favorite_lookup(self):
+        queryset = FavoriteStylist.objects.filter(customer_id=1, stylist_id=1)
+        self.assertUsesIndex(queryset, 'salon_favoritestylist', ['customer_id_stylist_id'])
+
+    def test_favorites_for_customer(self):
+        queryset = FavoriteStylist.objects.filter(customer_id=1)
+        self.assertUsesIndex(queryset, 'salon_favoritestylist', ['favorite_customer_recent_idx', 'customer_id_stylist_id'])
+
+    def test_appointment_pages_for_customer(self):
+        queryset = Appointment.objects.filter(customer_id=1).order_by('appointment_date', 'appointment_time', 'pk')[:51]
+        self.assertUsesIndex(queryset, 'salon_appointment', ['appt_customer_schedule_idx'])
+
+
+class CompactAppointmentListTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(email='admin@example.com', password='password123', role='admin')
+        self.customer = User.objects.create_user(
+            email='customer@example.com', password='password123', role='customer', first_name='Jane', last_name='Doe'
+        )
+        self.stylist = Stylist.objects.create(
+            user=User.objects.create_user(email='stylist@example.com', password='password123', role='stylist')
+        )
+        self.service = Service.objects.create(name='Haircut', price=50, duration_minutes=45)
+        self.client.force_authenticate(self.admin)
+
+    def create_appointments(self, count):
+        for _ in range(count):
+            appointment = Appointment.objects.create(
+                customer=self.customer, stylist=self.stylist, appointment_date=date(2030, 1, 1),
+                appointment_time=time(10, 0), final_price=50
+            )
+            appointment.services.add(self.service)
+
+    def test_compact_shape(self):
+        self.create_appointments(1)
+        row = self.client.get('/api/salon/appointments/?view=compact').json()['results'][0]
+        self.assertEqual(row['customer_name'], 'Jane Doe')
+        self.assertEqual(row['stylist_name'], 'stylist@example.com')
+        self.assertEqual(row['service_ids'], [self.service.id])
+        self.assertEqual(row['service_names'], ['Haircut'])
+        self.assertEqual(row['final_price'], '50.00')
+        self.assertNotIn('customer', row)
+
+    def test_compact_and_full_lists_use_constant_queries(self):
+        for view in ('compact', 'full'):
+            self.create_appointments(2)
+            with CaptureQueriesContext(connection) as small:
+                self.client.get(f'/api/salon/appointments/?view={view}')
+            self.create_appointments(10)
+            with CaptureQueriesContext(connection) as large:
+                self.client.get(f'/api/salon/appointments/?view={view}')
+            self.assertEqual(len(small), len(large), view)
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """
+    Fires parallel bookings at the same stylist and slots through the real
+    serializer path and checks that no two active appointments overlap.
+    """
+    workers = 8
+    attempts_per_slot = 4
+
+    def setUp(self):
+        self.hair = Category.objects.create(name='Hair')
+        self.service = Service.objects.create(name='Haircut', price=50, duration_minutes=45, category=self.hair)
+        self.stylist = Stylist.objects.create(
+            user=User.objects.create_user(email='stylist@example.com', password='password123', role='stylist')
+        )
+        self.stylist.specialties.add(self.hair)
+        self.customers = [
+            User.objects.create_user(email=f'customer{i}@example.com', password='password123', role='customer')
+            for i in range(self.workers)
+        ]
+        self.day = date.today() + timedelta(days=30)
+
+    def book(self, customer, slot):
+        # Each worker thread gets its own database connection.
+        client = APIClient()
+        client.force_authenticate(customer)
+        try:
+            return client.post('/api/salon/appointments/', {
+                'stylist_id': self.stylist.id, 'service_ids': [self.service.id],
+                'appointment_date': self.day.isoformat(), 'appointment_time': slot,
+            }, format='json').status_code
+        finally:
+            connection.close()
+
+    def test_parallel_bookings_never_overlap(self):
+        # 09:00, 09:15 and 09:30 all overlap a 45-minute 09:00 booking.
+        slots = ['09:00', '09:15', '09:30', '10:00', '10:30', '11:00'] * self.attempts_per_slot
+        jobs = [(self.customers[i % self.workers], slot) for i, slot in enumerate(slots)]
+
+        started = monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            statuses = list(pool.map(lambda job: self.book(*job), jobs))
+        elapsed = monotonic() - started
+        logger.info('%d booking attempts in %.2fs (%.1f/s)', len(jobs), elapsed, len(jobs) / elapsed)
+
+        self.assertTrue(set(statuses) <= {201, 400}, statuses)
+        booked = list(Appointment.objects.filter(stylist=self.stylist).active().order_by('appointment_time'))
+        self.assertEqual(statuses.count(201), len(booked))
+        self.assertTrue(booked)
+        for earlier, later in zip(booked, booked[1:]):
+            earlier_end = datetime.combine(self.day, earlier.appointment_time) + timedelta(minutes=earlier.duration_minutes)
+            self.assertLessEqual(earlier_end, datetime.combine(self.day, later.appointment_time))
+
+    def test_same_slot_has_exactly_one_winner(self):
+        def book(customer):
+            client = APIClient()
+            client.force_authenticate(customer)
+            try:
+                return client.post('/api/salon/appointments/', {
+                    'stylist_id': self.stylist.id, 'service_ids': [self.service.id],
+                    'appointment_date': self.day.isoformat(), 'appointment_time': '09:00',
+                }, format='json')
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            responses = list(pool.map(book, self.customers))
+
+        self.assertEqual([response.status_code for response in responses].count(201), 1)
+        self.assertEqual(Appointment.objects.filter(stylist=self.stylist).active().count(), 1)
+        # Losers that read after the winner committed fail validate(); the
+        # rest fail the recheck under the booking lock.
+        slot_taken = {
+            AppointmentSerializer.SLOT_TAKEN_MESSAGE,
+            'This time slot conflicts with an existing appointment for the preferred stylist.',
+        }
+        for response in responses:
+            if response.status_code != 201:
+                self.assertEqual(response.status_code, 400)
+                detail = response.json()['detail']
+                self.assertIn(detail if isinstance(detail, str) else detail[0], slot_taken)
+
+
+class StylistAssignmentTests(TestCase):
+    def setUp(self):
+        self.hair = Category.objects.create(name='Hair')
+        self.customer = User.objects.create_user(email='customer@example.com', password='password123', role='customer')
+        self.day = date(2030, 1, 1)
+
+    def create_stylist(self, start=None, end=None):
+        index = Stylist.objects.count()
+        stylist = Stylist.objects.create(
+            user=User.objects.create_user(email=f'stylist{index}@example.com', password='password123', role='stylist'),
+            working_hours_start=start, working_hours_end=end,
+        )
+        stylist.specialties.add(self.hair)
+        return stylist
+
+    def book(self, stylist, hour, minutes=60):
+        return Appointment.objects.create(
+            customer=self.customer, stylist=stylist, appointment_date=self.day,
+            appointment_time=time(hour, 0), duration_minutes=minutes
+        )
+
+    def test_candidates_come_from_one_query(self):
+        for _ in range(3):
+            self.create_stylist()
+        with self.assertNumQueries(1):
+            assign_stylist([self.hair.id], self.day, time(10, 0), 60)
+        for _ in range(10):
+            self.create_stylist()
+        with self.assertNumQueries(1):
+            assign_stylist([self.hair.id], self.day, time(10, 0), 60)
+
+    def test_conflicts_and_working_hours_are_excluded(self):
+        busy = self.create_stylist()
+        self.book(busy, 10)
+        off_duty = self.create_stylist(start=time(12, 0))
+        free = self.create_stylist()
+        self.assertEqual(
+            [stylist.id for stylist in free_stylists([self.hair.id], self.day, time(10, 30), 30)],
+            [free.id]
+        )
+        self.assertNotIn(off_duty, free_stylists([self.hair.id], self.day, time(10, 30), 30))
+
+    def test_policies(self):
+        first, second, third = self.create_stylist(), self.create_stylist(), self.create_stylist()
+        self.book(first, 9, 120)
+        self.book(second, 14, 30)
+        self.book(third, 16, 60)
+
+        self.assertEqual(assign_stylist([self.hair.id], self.day, time(11, 0), 30, policy='first_available'), first)
+        self.assertEqual(assign_stylist([self.hair.id], self.day, time(11, 0), 30, policy='least_booked'), second)
+        self.assertEqual(assign_stylist([self.hair.id], self.day, time(11, 0), 30, policy='round_robin'), first)
+        self.assertEqual(assign_stylist([self.hair.id], self.day, time(15, 0), 60, policy='fewest_gaps'), third)
+
+
+class AvailabilitySnapshotTests(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(email='customer@example.com', password='password123', role='customer')
+        self.stylist = Stylist.objects.create(
+            user=User.objects.create_user(email='stylist@example.com', password='password123', role='stylist'),
+            working_hours_start=time(9, 0), working_hours_end=time(12, 0),
+        )
+        self.day = date(2030, 1, 1)
+
+    def busy(self, day=None):
+        return snapshots.load_masks([self.stylist.id], [day or self.day]).get((self.stylist.id, day or self.day), 0)
+
+    def book(self, start, minutes=60):
+        return Appointment.objects.create(
+            customer=self.customer, stylist=self.stylist, appointment_date=self.day,
+            appointment_time=start, duration_minutes=minutes
+        )
+
+    def test_appointment_changes_keep_the_bitmap_in_step(self):
+        appointment = self.book(time(10, 0))
+        self.assertEqual(self.busy(), snapshots.window_mask(600, 60))
+
+        appointment.appointment_time = time(10, 7)
+        appointment.save()
+        # Windows are rounded out to whole 5-minute slots.
+        self.assertEqual(self.busy(), snapshots.window_mask(605, 65))
+
+        appointment.appointment_date = self.day + timedelta(days=1)
+        appointment.save()
+        self.assertEqual(self.busy(), 0)
+        self.assertEqual(self.busy(self.day + timedelta(days=1)), snapshots.window_mask(605, 65))
+
+        appointment.status = 'cancelled'
+        appointment.save()
+        self.assertFalse(AvailabilitySnapshot.objects.exists())
+
+        other = self.book(time(9, 0))
+        other.delete()
+        self.assertFalse(AvailabilitySnapshot.objects.exists())
+
+    def test_availability_and_assignment_read_the_bitmap(self):
+        hair = Category.objects.create(name='Hair')
+        self.stylist.specialties.add(hair)
+        self.book(time(10, 0))
+        availability = get_availability([self.stylist], self.day, 30)
+        self.assertEqual(
+            availability[self.stylist.id]['slots'], ['09:00', '09:15', '09:30', '11:00', '11:15', '11:30', '11:45']
+        )
+        self.assertIsNone(assign_stylist([hair.id], self.day, time(10, 30), 30))
+        self.assertEqual(assign_stylist([hair.id], self.day, time(11, 0), 30), self.stylist)
+
+    def test_rebuild_reports_and_repairs_drift(self):
+        self.book(time(10, 0))
+        AvailabilitySnapshot.objects.update(busy=snapshots.encode(1))
+        AvailabilitySnapshot.objects.create(stylist=self.stylist, date=self.day - timedelta(days=1), busy=snapshots.encode(1))
+
+        with self.assertRaisesMessage(CommandError, '2 stylist-day(s) drifted.'):
+            call_command('rebuild_availability_snapshots', '--check', stdout=StringIO())
+        self.assertEqual(self.busy(), 1)
+
+        out = StringIO()
+        call_command('rebuild_availability_snapshots', stdout=out)
+        self.assertIn('2 stylist-day(s)', out.getvalue())
+        self.assertEqual(self.busy(), snapshots.window_mask(600, 60))
+        self.assertEqual(AvailabilitySnapshot.objects.count(), 1)
+        self.assertEqual(snapshots.rebuild(check=True), [])
+
+
+def _sweep_availability(stylists, appointment_date, duration, now):
+    """
+    The availability payload as the interval sweep built it before busy
+    bitmaps: a slot is free unless it overlaps an active appointment (one
+    that merely touches it doesn't count), and zero-length slots and
+    appointments never conflict.
+    """
+    busy = [
+        (stylist_id, start.hour * 60 + start.minute, start.hour * 60 + start.minute + minutes)
+        for stylist_id, start, minutes in Appointment.objects.active().filter(
+            appointment_date=appointment_date
+        ).values_list('stylist_id', 'appointment_time', 'duration_minutes')
+    ]
+    payload = {}
+    for stylist in stylists:
+        start_hour, end_hour = availability.working_hours(stylist)
+        slots = []
+        for slot_start in range(start_hour * 60, end_hour * 60, availability.SLOT_INTERVAL_MINUTES):
+            slot_end = slot_start + duration
+            if appointment_date == now.date() and time(slot_start // 60, slot_start % 60) <= now.time():
+                continue
+            if slot_start < slot_end and any(
+                stylist_id == stylist.id and start < end and start < slot_end and slot_start < end
+                for stylist_id, start, end in busy
+            ):
+                continue
+            slots.append(f'{slot_start // 60:02d}:{slot_start % 60:02d}')
+        if slots:
+            payload[stylist.id] = {'stylist_name': stylist.user.get_full_name(), 'slots': slots}
+    return payload
+
+
+class AvailabilityRegressionTests(TestCase):
+    """
+    The bitmap engine against the interval sweep it replaced, on
+    appointments aligned to its 5-minute slots (off-grid ones are rounded
+    out, see snapshots.window_mask).
+    """
+    def setUp(self):
+        self.customer = User.objects.create_user(email='customer@example.com', password='password123', role='customer')
+        self.stylists = [
+            Stylist.objects.create(
+                user=User.objects.create_user(email=f'stylist{n}@example.com', password='password123', role='stylist'),
+                working_hours_start=time(9, 0), working_hours_end=time(13, 0),
+            )
+            for n in range(2)
+        ]
+        self.day = date(2030, 1, 1)
+        first, second = self.stylists
+        for stylist, start, minutes, status in (
+            # Overlapping, then touching the next one.
+            (first, time(9, 30), 45, 'approved'), (first, time(10, 0), 30, 'pending'),
+            (first, time(10, 30), 15, 'approved'),
+            # Zero-length, and a cancelled booking that frees its slot.
+            (first, time(11, 0), 0, 'approved'), (first, time(12, 0), 60, 'cancelled'),
+            # Runs past closing.
+            (second, time(12, 25), 90, 'rescheduled'), (second, time(9, 0), 5, 'pending'),
+        ):
+            Appointment.objects.create(
+                customer=self.customer, stylist=stylist, appointment_date=self.day, appointment_time=start,
+                duration_minutes=minutes, status=status,
+            )
+
+    def assertMatchesSweep(self, duration, now):
+        busy_masks = snapshots.load_masks([stylist.id for stylist in self.stylists], [self.day])
+        self.assertEqual(
+            availability.day_availability(self.stylists, self.day, duration, busy_masks, now),
+            _sweep_availability(self.stylists, self.day, duration, now),
+        )
+
+    def test_payloads_match_the_interval_sweep(self):
+        earlier = timezone.make_aware(datetime(2029, 12, 31, 12, 0))
+        for duration in (0, 5, 15, 30, 45, 60, 240):
+            with self.subTest(duration=duration):
+                self.assertMatchesSweep(duration, earlier)
+
+    def test_cutoff_matches_the_interval_sweep(self):
+        for now in (time(8, 0), time(9, 0), time(10, 10), time(10, 15), time(12, 59), time(13, 0)):
+            with self.subTest(now=now):
+                self.assertMatchesSweep(30, timezone.make_aware(datetime.combine(self.day, now)))
+
+
+class AvailabilityRangeTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        hair = Category.objects.create(name='Hair')
+        self.service = Service.objects.create(name='Haircut', price=50, duration_minutes=60, category=hair)
+        self.stylist = Stylist.objects.create(
+            user=User.objects.create_user(email='stylist@example.com', password='password123', role='stylist'),
+            working_hours_start=time(9, 0), working_hours_end=time(11, 0),
+        )
+        self.stylist.specialties.add(hair)
+        customer = User.objects.create_user(email='customer@example.com', password='password123', role='customer')
+        self.client.force_authenticate(customer)
+        self.start = date(2030, 1, 1)
+        Appointment.objects.create(
+            customer=customer, stylist=self.stylist, appointment_date=self.start + timedelta(days=1),
+            appointment_time=time(9, 0), duration_minutes=60, status='approved',
+        )
+
+    def get(self, start, end):
+        return self.client.get('/api/salon/appointments/availability/', {
+            'start_date': start.isoformat(), 'end_date': end.isoformat(), 'service_ids': self.service.id,
+        })
+
+    def test_streams_one_line_per_date(self):
+        response = self.get(self.start, self.start + timedelta(days=2))
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        with CaptureQueriesContext(connection) as queries:
+            lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([line['date'] for line in lines], ['2030-01-01', '2030-01-02', '2030-01-03'])
+        slots = [line['availability'][str(self.stylist.id)]['slots'] for line in lines]
+        self.assertEqual(slots[0], ['09:00', '09:15', '09:30', '09:45', '10:00', '10:15', '10:30', '10:45'])
+        self.assertEqual(slots[1], ['10:00', '10:15', '10:30', '10:45'])
+        # Every day's bookings come from a single query, before the first line.
+        self.assertEqual(len(queries), 1)
+        self.assertIn('salon_availabilitysnapshot', queries[0]['sql'])
+
+    def test_rejects_bad_ranges(self):
+        too_long = self.get(self.start, self.start + timedelta(days=availability.MAX_RANGE_DAYS))
+        self.assertEqual(too_long.status_code, 400)
+        self.assertEqual(self.get(self.start, self.start + timedelta(days=availability.MAX_RANGE_DAYS - 1)).status_code, 200)
+        self.assertEqual(self.get(self.start, self.start - timedelta(days=1)).status_code, 400)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.hair = Category.objects.create(name='Hair')
+        self.stylist = Stylist.objects.create(
+            user=User.objects.create_user(
+                email='ana@example.com', password='password123', role='stylist', first_name='Ana', last_name='Silva'
+            ),
+            bio='Balayage and curly cuts.',
+        )
+        self.stylist.specialties.add(self.hair)
+        self.service = Service.objects.create(
+            name='Balayage', description='Hand-painted colour.', price=Decimal('150.00'), category=self.hair
+        )
+        self.work = InspiredWork.objects.create(image='inspired_work/waves.jpg', title='Beach waves', description='Loose curls.')
+
+    def found(self, query, **kwargs):
+        return [(document.kind, document.object_id) for document in search.search(query, **kwargs)]
+
+    def test_matches_rank_titles_first_and_follow_edits(self):
+        self.assertEqual(self.found('balay'), [('service', self.service.id), ('stylist', self.stylist.id)])
+        self.assertCountEqual(self.found('curl'), [('stylist', self.stylist.id), ('inspired_work', self.work.id)])
+        self.assertEqual(self.found('hair ana'), [('stylist', self.stylist.id)])
+        self.assertEqual(self.found('curl', kinds=['inspired_work']), [('inspired_work', self.work.id)])
+        self.assertEqual(self.found('"* OR NEAR('), [])
+
+        self.stylist.user.first_name = 'Bea'
+        self.stylist.user.save()
+        self.hair.name = 'Colour'
+        self.hair.save()
+        self.assertEqual(self.found('bea colour'), [('stylist', self.stylist.id)])
+        self.assertEqual(self.found('ana'), [])
+
+        self.stylist.specialties.remove(self.hair)
+        self.assertEqual(self.found('colour', kinds=['stylist']), [])
+
+        self.service.is_active = False
+        self.service.save()
+        self.work.delete()
+        self.assertEqual(self.found('balayage curl'), [('stylist', self.stylist.id)])
+
+    def test_rebuild_restores_the_index(self):
+        SearchDocument.objects.all().delete()
+        self.assertEqual(self.found('balayage'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 3', out.getvalue())
+        self.assertEqual(len(self.found('balayage')), 2)
+
+    def test_sqlite_triggers_exist_and_rebuild_restores_them(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('The FTS5 triggers only exist on SQLite.')
+
+        def triggers():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'salon_searchdocument'")
+                return {name for name, in cursor.fetchall()}
+
+        # Fails if a later migration rebuilds the document table without them.
+        self.assertEqual(triggers(), set(search.SQLITE_TRIGGERS))
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER salon_searchdocument_ai')
+        InspiredWork.objects.create(image='inspired_work/braids.jpg', title='Box braids')
+        self.assertEqual(self.found('braids'), [])
+
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(triggers(), set(search.SQLITE_TRIGGERS))
+        self.assertEqual(len(self.found('braids')), 1)
+        InspiredWork.objects.create(image='inspired_work/twists.jpg', title='Twists')
+        self.assertEqual(len(self.found('twists')), 1)
+
+    def test_postgres_prefixes_match_unstemmed_words(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('Stemming only applies to the Postgres index.')
+        work = InspiredWork.objects.create(image='inspired_work/sleek.jpg', title='Sleek styling')
+        # 'stylin' is no prefix of the stem 'style', only of the word itself.
+        self.assertEqual(self.found('stylin'), [('inspired_work', work.id)])
+        self.assertEqual(self.found('styles'), [('inspired_work', work.id)])
+        self.assertEqual(self.found('sleek stylin'), [('inspired_work', work.id)])
+
+    def test_endpoint_pages_in_one_query(self):
+        for i in range(3):
+            InspiredWork.objects.create(image=f'inspired_work/{i}.jpg', title=f'Braids {i}')
+        client = APIClient()
+        with self.assertNumQueries(1):
+            response = client.get('/api/salon/search/?q=braids&page_size=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['type'] for result in response.data['results']], ['inspired_work'] * 2)
+        self.assertIsNone(response.data['previous'])
+
+        response = client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next'])
+        self.assertIsNotNone(response.data['previous'])
+        self.assertEqual(set(response.data['results'][0]), {'type', 'id', 'title', 'snippet', 'rank'})
+
+        self.assertEqual(client.get('/api/salon/search/?q=+').status_code, 400)
+        self.assertEqual(client.get('/api/salon/search/?q=braids&type=salon').status_code, 400)
+
+
+class LoyaltyLedgerTests(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(email='customer@example.com', password='password123', role='customer')
+        self.stylist = Stylist.objects.create(
+            user=User.objects.create_user(email='stylist@example.com', password='password123', role='stylist')
+        )
+        self.service = Service.objects.create(name='Haircut', price=Decimal('45.50'), duration_minutes=45)
+
+    def complete_appointment(self):
+        appointment = Appointment.objects.create(
+            customer=self.customer, stylist=self.stylist, appointment_date=date(2030, 1, 1),
+            appointment_time=time(10, 0), status='completed'
+        )
+        appointment.services.add(self.service)
+        return appointment
+
+    def balance(self):
+        return LoyaltyPoint.objects.get(customer=self.customer).points
+
+    def ledger_total(self):
+        return LoyaltyTransaction.objects.filter(customer=self.customer).aggregate(total=Sum('points'))['total']
+
+    def test_award_is_idempotent_per_appointment(self):
+        appointment = self.complete_appointment()
+        self.assertIsNotNone(loyalty.award_for_appointment(appointment))
+        self.assertIsNone(loyalty.award_for_appointment(appointment))
+        self.assertEqual(self.balance(), 45)
+        self.assertEqual(self.ledger_total(), 45)
+
+    def test_fully_discounted_bookings_earn_nothing(self):
+        appointment = self.complete_appointment()
+        appointment.final_price = Decimal('0.00')
+        self.assertIsNone(loyalty.award_for_appointment(appointment))
+
+    def test_redeem_never_overdraws(self):
+        loyalty.award_for_appointment(self.complete_appointment())
+        self.assertEqual(loyalty.redeem(self.customer, 40), 5)
+        with self.assertRaises(loyalty.InsufficientPoints):
+            loyalty.redeem(self.customer, 6)
+        self.assertEqual(self.balance(), 5)
+        self.assertEqual(self.ledger_total(), 5)
+
+    def test_redeem_endpoint(self):
+        loyalty.award_for_appointment(self.complete_appointment())
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        response = client.post('/api/salon/loyalty-points/redeem/', {'amount': 10}, format='json')
+        self.assertEqual(response.json()['new_loyalty_points'], 35)
+        history = client.get('/api/salon/loyalty-points/history/').json()['results']
+        self.assertEqual([row['kind'] for row in history], ['redeem', 'award'])
+
+    def test_compaction_keeps_balance(self):
+        for _ in range(3):
+            loyalty.award_for_appointment(self.complete_appointment())
+        loyalty.redeem(self.customer, 20)
+        removed = loyalty.compact_ledger(timezone.now() + timedelta(seconds=1))
+        self.assertEqual(removed, 3)
+        self.assertEqual(LoyaltyTransaction.objects.filter(customer=self.customer).get().kind, 'snapshot')
+        self.assertEqual(self.ledger_total(), self.balance())
+
+        # Nothing new to fold: the snapshot stays as it is.
+        snapshot = LoyaltyTransaction.objects.get(customer=self.customer)
+        self.assertEqual(loyalty.compact_ledger(timezone.now() + timedelta(seconds=1)), 0)
+        self.assertEqual(LoyaltyTransaction.objects.get(customer=self.customer), snapshot)
+
+
+class ReferralCodeTests(TestCase):
+    def test_code_is_assigned_in_the_insert(self):
+        with CaptureQueriesContext(connection) as ctx:
+            user = User.objects.create_user(email='jane.doe@example.com', password='password123')
+        self.assertEqual(sum(query['sql'].startswith('INSERT INTO "salon_user"') for query in ctx.captured_queries), 1)
+        self.assertFalse(any(query['sql'].startswith('UPDATE "salon_user"') for query in ctx.captured_queries))
+        user.refresh_from_db()
+        self.assertRegex(user.referral_code, r'^JANEDOE-[0-9A-Z]{4}[A-Z]$')
+
+    def test_codes_are_unique_for_clashing_prefixes(self):
+        users = [User.objects.create_user(email=f'sam@{domain}.com') for domain in ('a', 'b', 'c')]
+        self.assertEqual(len({user.referral_code for user in users}), 3)
+
+    def test_legacy_codes_are_kept(self):
+        user = User.objects.create_user(email='legacy@example.com')
+        User.objects.filter(pk=user.pk).update(referral_code=f'LEGACY{user.pk}')
+        user.refresh_from_db()
+        user.first_name = 'Lee'
+        user.save()
+        self.assertEqual(User.objects.get(pk=user.pk).referral_code, f'LEGACY{user.pk}')
+
+    def test_bulk_import(self):
+        User.objects.create_user(email='existing@example.com')
+        rows = [{'email': f'customer{i}@example.com', 'first_name': f'C{i}'} for i in range(25)]
+        rows += [{'email': 'existing@example.com'}, {'email': 'customer0@example.com'}, {'email': ''}]
+        with CaptureQueriesContext(connection) as ctx:
+            created, skipped = onboarding.import_customers(rows, batch_size=10)
+        self.assertEqual((created, skipped), (25, 3))
+        self.assertLess(len(ctx.captured_queries), 30)
+        codes = list(User.objects.filter(email__startswith='customer').values_list('referral_code', flat=True))
+        self.assertEqual(len(set(codes)), 25)
+        self.assertFalse(User.objects.get(email='customer3@example.com').has_usable_password())
+
+
+class AsyncLoginTests(TransactionTestCase):
+    # The login executor's threads use their own connections, so the user
+    # has to be committed for them to see it.
+    def setUp(self):
+        User.objects.create_user(email='customer@example.com', password='password123')
+        self.executor = passwords.BoundedExecutor(max_workers=2, max_pending=4)
+        self.previous = passwords.set_login_executor(self.executor)
+
+    def tearDown(self):
+        passwords.set_login_executor(self.previous)
+        self.executor.shutdown()
+
+    def login(self, password, **kwargs):
+        return self.client.post(
+            '/api/salon/login/', {'email': 'customer@example.com', 'password': password},
+            content_type='application/json', **kwargs
+        )
+
+    def test_login(self):
+        response = self.login('password123')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user']['email'], 'customer@example.com')
+        self.assertIn('access', response.json())
+
+    def test_bad_credentials(self):
+        response = self.login('wrong')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('non_field_errors', response.json())
+
+    def test_form_encoded_login(self):
+        response = self.client.post('/api/salon/login/', {'email': 'customer@example.com', 'password': 'password123'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_full_executor_sheds_load(self):
+        passwords.set_login_executor(passwords.BoundedExecutor(max_workers=1, max_pending=0))
+        response = self.login('password123')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_is_an_api_view(self):
+        self.assertEqual(self.client.get('/api/salon/login/').status_code, 405)
+        response = self.client.post('/api/salon/login/', '{"email":', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('JSON parse error', response.json()['detail'])
+        schema = OpenAPISchemaGenerator(openapi.Info(title='GlowApp', default_version='v1')).get_schema(public=True)
+        self.assertIn('post', schema['paths']['/login/'])
+
+
+class PasswordHashingTests(TestCase):
+    def test_pool_hashes_match_serial(self):
+        with passwords.hash_pool(2) as pool:
+            hashed = passwords.hash_passwords(['first-secret', '', 'second-secret'], pool=pool)
+        self.assertTrue(check_password('first-secret', hashed[0]))
+        self.assertFalse(is_password_usable(hashed[1]))
+        self.assertTrue(check_password('second-secret', hashed[2]))
+
+    def test_bulk_import_with_workers(self):
+        rows = [{'email': f'customer{i}@example.com', 'password': f'secret-{i}'} for i in range(3)]
+        self.assertEqual(onboarding.import_customers(rows, workers=2), (3, 0))
+        self.assertTrue(User.objects.get(email='customer2@example.com').check_password('secret-2'))
+
+
+class RecommendationIndexTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(RECOMMENDATION_INDEX_PATH=os.path.join(tmp.name, 'index.npz'))
+        override.enable()
+        self.addCleanup(override.disable)
+
+        hair = Category.objects.create(name='Hair')
+        nails = Category.objects.create(name='Nails')
+        Service.objects.create(name='Balayage', description='Hand-painted blonde highlights', price=120, category=hair)
+        Service.objects.create(name='Gel manicure', description='Long-lasting gel polish', price=40, category=nails)
+        self.hair_stylists = []
+        for index in range(2):
+            stylist = Stylist.objects.create(user=User.objects.create_user(email=f'hair{index}@example.com', role='stylist'))
+            stylist.specialties.add(hair)
+            self.hair_stylists.append(stylist.id)
+        nail_stylist = Stylist.objects.create(user=User.objects.create_user(email='nails@example.com', role='stylist'))
+        nail_stylist.specialties.add(nails)
+
+        self.balayage = InspiredWork.objects.create(title='Soft balayage', description='Sun-kissed blonde balayage', image='a.jpg')
+        self.waves = InspiredWork.objects.create(title='Beach balayage waves', description='Blonde highlights', image='b.jpg')
+        self.nails = InspiredWork.objects.create(title='Chrome nails', description='Gel manicure with chrome polish', image='c.jpg')
+
+    def test_recommends_matching_work_with_specialists(self):
+        results = recommendations.recommend('I want blonde balayage', limit=2)
+        self.assertEqual({row['id'] for row in results}, {self.balayage.id, self.waves.id})
+        # Both works match Hair; the specialist rotates between them.
+        self.assertEqual(sorted(row['specialistId'] for row in results), sorted(self.hair_stylists))
+
+        results = recommendations.recommend('gel nails')
+        self.assertEqual(results[0]['id'], self.nails.id)
+        self.assertEqual(results[0]['categoryId'], Category.objects.get(name='Nails').id)
+
+    def test_unknown_terms_fall_back_to_newest(self):
+        results = recommendations.recommend('zzz', limit=1)
+        self.assertEqual([row['id'] for row in results], [self.nails.id])
+
+    def test_refresh_only_reindexes_changed_work(self):
+        recommendations.get_index()
+        self.waves.title = 'Beach waves'
+        self.waves.save()
+        self.nails.delete()
+        added = InspiredWork.objects.create(title='Copper bob', image='d.jpg')
+
+        stats = recommendations.refresh_index()
+        self.assertEqual(stats, {'works': 3, 'reused': 1, 'rebuilt': 2})
+        index = recommendations.get_index()
+        self.assertEqual(sorted(index.work_ids.tolist()), sorted([self.balayage.id, self.waves.id, added.id]))
+        positions, _ = index.search('copper')
+        self.assertEqual(index.work_ids[positions].tolist(), [added.id])
+
+    def test_writes_without_a_broker_leave_the_refresh_to_the_next_read(self):
+        cache.get_cache().clear()
+        recommendations.get_index()
+        for n in range(3):
+            InspiredWork.objects.create(title=f'Copper bob {n}', image=f'd{n}.jpg')
+            # What signals.refresh_recommendations queues on commit.
+            recommendations.schedule_refresh()
+        self.assertEqual(len(recommendations.RecommendationIndex.load(recommendations.index_path())), 3)
+
+        index = recommendations.get_index()
+        self.assertEqual(len(index), 6)
+        positions, _ = index.search('copper')
+        self.assertEqual(len(positions), 3)
+
+    def test_style_recommendation_task(self):
+        results = tasks.get_style_recommendation('chrome')
+        self.assertEqual(results[0]['id'], self.nails.id)
+        self.assertEqual(set(results[0]), {'kind', 'id', 'title', 'description', 'imageUrl', 'categoryId', 'specialistId'})
+
+
+def _image_file(color, name, split=None):
+    image = Image.new('RGB', (96, 96), color)
+    if split:
+        image.paste(split, (0, 48, 96, 96))
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class ImageSimilarityTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(
+            MEDIA_ROOT=tmp.name,
+            IMAGE_EMBEDDINGS_DIR=os.path.join(tmp.name, 'embeddings'),
+            RECOMMENDATION_INDEX_PATH=os.path.join(tmp.name, 'index.npz'),
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.stylist = Stylist.objects.create(user=User.objects.create_user(email='stylist@example.com', role='stylist'))
+        self.red = InspiredWork.objects.create(title='Copper red', image=_image_file((200, 30, 20), 'red.png'))
+        self.blue = PortfolioImage.objects.create(stylist=self.stylist, image=_image_file((20, 40, 210), 'blue.png'))
+        self.split = InspiredWork.objects.create(
+            title='Two-tone', image=_image_file((240, 240, 240), 'split.png', split=(10, 10, 10))
+        )
+
+    def test_embeddings_are_unit_length(self):
+        vector = embeddings.embed(Image.new('RGB', (30, 50), (90, 160, 40)))
+        self.assertEqual(vector.shape, (embeddings.DIM,))
+        self.assertAlmostEqual(float(np.linalg.norm(vector)), 1.0, places=5)
+
+    def test_sync_is_incremental(self):
+        self.assertEqual(embeddings.sync(), {'embedded': 3, 'unchanged': 0, 'removed': 0})
+        self.assertEqual(embeddings.sync(), {'embedded': 0, 'unchanged': 3, 'removed': 0})
+
+        self.red.image = _image_file((210, 40, 30), 'red-2.png')
+        self.red.save()
+        self.assertEqual(embeddings.sync([(embeddings.KIND_WORK, self.red.id)]), {'embedded': 1, 'unchanged': 0, 'removed': 0})
+
+        self.split.delete()
+        self.assertEqual(embeddings.sync(), {'embedded': 0, 'unchanged': 2, 'removed': 1})
+        # A third of the rows were tombstones, so the store was compacted.
+        keys, vectors = embeddings.get_store().snapshot()
+        self.assertEqual(len(keys), 2)
+        self.assertEqual(vectors.shape, (2, embeddings.DIM))
+        # The replaced generation stays for readers that haven't mapped the new one yet.
+        files = sorted(name for name in os.listdir(settings.IMAGE_EMBEDDINGS_DIR) if name.startswith('vectors-'))
+        self.assertEqual(files, ['vectors-0.f32', 'vectors-1.f32'])
+
+    def test_similar_finds_closest_look(self):
+        embeddings.sync()
+        query = Image.new('RGB', (64, 64), (190, 40, 25))
+        kind, pk, _ = embeddings.similar(query, limit=1)[0]
+        self.assertEqual((kind, pk), (embeddings.KIND_WORK, self.red.id))
+
+    def test_photo_recommendations_link_to_portfolio_stylist(self):
+        embeddings.sync()
+        response = APIClient().post(
+            '/api/salon/style-recommendations/', {'image': _image_file((25, 45, 200), 'query.png')}, format='multipart'
+        )
+        self.assertEqual(response.status_code, 200)
+        first = response.json()['recommendations'][0]
+        self.assertEqual(first['specialistId'], self.stylist.id)
+        self.assertTrue(first['imageUrl'].startswith('http://testserver/media/'))
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(MEDIA_ROOT=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.get_cache().clear()
+
+        buffer = BytesIO()
+        Image.new('RGBA', (800, 400), (200, 100, 50, 255)).save(buffer, format='PNG')
+        self.service = Service.objects.create(
+            name='Color', price=80, image=SimpleUploadedFile('color.png', buffer.getvalue(), content_type='image/png')
+        )
+        self.client = APIClient()
+
+    def test_generates_resized_variants_next_to_original(self):
+        name = self.service.image.name
+        self.assertEqual(images.generate_variants(name), len(images.VARIANT_WIDTHS) * len(images.VARIANT_FORMATS))
+        with default_storage.open(images.variant_name(name, 320, 'webp')) as handle:
+            variant = Image.open(handle)
+            self.assertEqual((variant.format, variant.size), ('WEBP', (320, 160)))
+        with default_storage.open(images.variant_name(name, 1280, 'jpeg')) as handle:
+            # Never upscaled.
+            self.assertEqual(Image.open(handle).size, (800, 400))
+        self.assertEqual(images.generate_variants(name), 0)
+
+    def test_unhashed_original_keeps_plain_variant_names(self):
+        # Saved before names carried hashes.
+        buffer = BytesIO()
+        Image.new('RGB', (400, 200)).save(buffer, format='PNG')
+        name = FileSystemStorage(location=settings.MEDIA_ROOT).save('service_images/legacy.png', buffer)
+        Service.objects.filter(pk=self.service.pk).update(image=name)
+
+        self.assertEqual(tasks.generate_image_variants(name, 'salon.Service'), 8)
+        stored = set(default_storage.listdir('service_images')[1])
+        self.assertTrue({os.path.basename(images.variant_name(name, width, format)) for width, format in images._all_variants()} <= stored)
+        self.assertFalse([file for file in stored if file.startswith('legacy.') and file != 'legacy.png'])
+        self.service.refresh_from_db()
+        self.assertTrue(images.variants_ready(self.service.image))
+
+    def test_nothing_stored_is_not_ready(self):
+        name = self.service.image.name
+        with mock.patch.object(images, '_save'):
+            self.assertIsNone(tasks.generate_image_variants(name, 'salon.Service'))
+        self.service.refresh_from_db()
+        self.assertFalse(images.variants_ready(self.service.image))
+
+    def test_srcset_falls_back_to_on_demand_view(self):
+        data = self.client.get(f'/api/salon/services/{self.service.id}/').json()
+        first = data['imageSrcset']['webp'].split(', ')[0]
+        url, descriptor = first.split(' ')
+        self.assertEqual(descriptor, '160w')
+        self.assertIn('/api/salon/image-variants/?', url)
+
+        # Without a broker nothing renders in the request: the original
+        # stands in and the row stays pending for the command.
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].endswith(self.service.image.url))
+        self.assertFalse(default_storage.exists(images.variant_name(self.service.image.name, 160, 'webp')))
+        self.assertEqual(list(images.pending()), [(Service, self.service.image.name)])
+
+        call_command('render_image_variants', stdout=StringIO())
+        self.assertEqual(list(images.pending()), [])
+        response = self.client.get(url)
+        self.assertRegex(response['Location'], r'\.[0-9a-f]{16}__w160\.webp$')
+        self.service.refresh_from_db()
+        self.assertTrue(images.variants_ready(self.service.image))
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=False)
+    def test_on_demand_view_queues_once(self):
+        name = self.service.image.name
+        with mock.patch.object(tasks.generate_image_variants, 'delay') as delay:
+            for _ in range(2):
+                response = self.client.get('/api/salon/image-variants/', {'name': name, 'width': 320, 'type': 'webp'})
+                self.assertEqual(response.status_code, 302)
+                self.assertTrue(response['Location'].endswith(default_storage.url(name)))
+        delay.assert_called_once_with(name, 'salon.Service')
+
+    def test_srcset_uses_direct_urls_once_ready(self):
+        tasks.generate_image_variants(self.service.image.name, 'salon.Service')
+        self.service.refresh_from_db()
+        with self.assertNumQueries(0):
+            data = ServiceSerializer(self.service, context={'request': APIRequestFactory().get('/')}).data
+        self.assertIn('/media/service_images/', data['imageSrcset']['jpeg'])
+        self.assertRegex(data['imageSrcset']['jpeg'], r'\.[0-9a-f]{16}__w640\.jpg 640w')
+
+    def test_on_demand_view_rejects_unknown_files_and_sizes(self):
+        name = self.service.image.name
+        self.assertEqual(self.client.get('/api/salon/image-variants/', {'name': name, 'width': 333, 'type': 'webp'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/salon/image-variants/', {'name': 'secrets/x.png', 'width': 320, 'type': 'webp'}).status_code, 404)
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(MEDIA_ROOT=tmp.name, MEDIA_SERVE_MODE='django')
+        override.enable()
+        self.addCleanup(override.disable)
+        self.content = bytes(range(256)) * 40
+        self.name = default_storage.save('portfolio_images/clip.bin', SimpleUploadedFile('clip.bin', self.content))
+        self.url = default_storage.url(self.name)
+
+    def get(self, url=None, **headers):
+        return self.client.get(url or self.url, headers=headers)
+
+    def test_hashed_url_is_immutable(self):
+        self.assertRegex(self.url, r'^/media/portfolio_images/clip\.[0-9a-f]{16}\.bin$')
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        # Saved before names carried hashes.
+        FileSystemStorage(location=settings.MEDIA_ROOT).save('portfolio_images/legacy.bin', BytesIO(self.content))
+        legacy = self.get('/media/portfolio_images/legacy.bin')
+        self.assertEqual(legacy['Cache-Control'], 'public, max-age=0, must-revalidate')
+
+    def test_same_content_keeps_its_hash(self):
+        again = default_storage.save('portfolio_images/clip.bin', SimpleUploadedFile('clip.bin', self.content))
+        other = default_storage.save('portfolio_images/clip.bin', SimpleUploadedFile('clip.bin', b'other'))
+        self.assertTrue(media.is_hashed(again))
+        self.assertEqual(again.split('.')[1][:16], self.name.split('.')[1])
+        self.assertNotEqual(other.split('.')[1], self.name.split('.')[1])
+
+    def test_conditional_get_returns_304(self):
+        etag = self.get()['ETag']
+        response = self.get(If_None_Match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_range_requests(self):
+        response = self.get(Range='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+
+        tail = self.get(Range='bytes=-10')
+        self.assertEqual(b''.join(tail.streaming_content), self.content[-10:])
+
+        unsatisfiable = self.get(Range=f'bytes={len(self.content)}-')
+        self.assertEqual(unsatisfiable.status_code, 416)
+        self.assertEqual(unsatisfiable['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_if_range_mismatch_sends_whole_file(self):
+        response = self.get(Range='bytes=0-9', If_Range='"stale"')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.get(Range='bytes=0-9', If_Range=etag).status_code, 206)
+
+    def test_rejects_paths_outside_media_root(self):
+        # safe_join raises SuspiciousFileOperation, which Django answers with a 400.
+        self.assertEqual(self.get('/media/../glowapp_backend/settings.py').status_code, 400)
+        self.assertEqual(self.get('/media/portfolio_images/missing.bin').status_code, 404)
+
+    def test_x_accel_redirect_resolves_through_proxy_config(self):
+        # Stand-in for nginx: read the internal location from the shipped
+        # config and resolve the redirect the way its alias would.
+        with open(os.path.join(settings.BASE_DIR, 'deploy', 'nginx-media.conf')) as handle:
+            config = handle.read()
+        location = re.search(r'location (\S+) \{\s*internal;\s*alias (\S+);', config)
+        self.assertIsNotNone(location)
+        prefix, _ = location.groups()
+
+        name = default_storage.save('portfolio_images/my clip.bin', SimpleUploadedFile('my clip.bin', self.content))
+        with override_settings(MEDIA_SERVE_MODE='x-accel', MEDIA_ACCEL_PREFIX=prefix):
+            response = self.get(default_storage.url(name), Range='bytes=0-9')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertIn('immutable', response['Cache-Control'])
+        redirect = response['X-Accel-Redirect']
+        self.assertTrue(redirect.startswith(prefix))
+        self.assertIn('my%20clip', redirect)
+        with open(os.path.join(settings.MEDIA_ROOT, unquote(redirect[len(prefix):])), 'rb') as handle:
+            self.assertEqual(handle.read(), self.content)
+
+
+class TokenUserAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.get_cache().clear()
+        authentication.user_cache.clear()
+        self.addCleanup(authentication.user_cache.clear)
+        self.customer = User.objects.create_user(email='customer@example.com', password='password123', role='customer', first_name='Ada')
+        stylist_user = User.objects.create_user(email='stylist@example.com', password='password123', role='stylist')
+        self.stylist = Stylist.objects.create(user=stylist_user)
+        self.client = APIClient()
+
+    def authorize(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_tokens_carry_role_and_stylist_claims(self):
+        access = authentication.tokens_for_user(self.stylist.user).access_token
+        self.assertEqual((access['role'], access['stylist_id']), ('stylist', self.stylist.id))
+        access = authentication.tokens_for_user(self.customer).access_token
+        self.assertEqual((access['role'], access['stylist_id']), ('customer', None))
+
+    def test_permission_checks_run_without_loading_the_user(self):
+        self.authorize(authentication.tokens_for_user(self.customer).access_token)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/salon/services/', {'name': 'Cut', 'price': 10}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(len(queries), 0)
+
+    def test_full_user_comes_from_the_cache(self):
+        self.authorize(authentication.tokens_for_user(self.customer).access_token)
+        self.assertEqual(self.client.get('/api/salon/profile/').json()['first_name'], 'Ada')
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get('/api/salon/profile/').json()
+        self.assertEqual(data['email'], 'customer@example.com')
+        self.assertFalse(any('"salon_user"' in query['sql'] for query in queries))
+
+        self.client.patch('/api/salon/profile/', {'first_name': 'Grace'}, format='json')
+        self.assertEqual(self.client.get('/api/salon/profile/').json()['first_name'], 'Grace')
+
+    def test_cached_user_changes_invalidate_claims(self):
+        token = authentication.tokens_for_user(self.customer).access_token
+        self.authorize(token)
+        User.objects.filter(pk=self.customer.pk).update(role='admin')
+        authentication.user_cache.get(self.customer.pk)
+        self.assertEqual(self.client.get('/api/salon/profile/').status_code, 401)
+
+    def test_access_changes_reach_processes_without_the_user_cached(self):
+        token = authentication.tokens_for_user(self.customer).access_token
+        self.authorize(token)
+        self.assertEqual(self.client.get('/api/salon/profile/').status_code, 200)
+        self.customer.role = 'admin'
+        self.customer.save()
+        # As in another process, which never saw the save.
+        authentication.user_cache.clear()
+        self.assertEqual(self.client.get('/api/salon/profile/').status_code, 401)
+
+        admin = User.objects.get(pk=self.customer.pk)
+        self.authorize(authentication.tokens_for_user(admin).access_token)
+        self.assertEqual(self.client.get('/api/salon/profile/').status_code, 200)
+        admin.is_active = False
+        admin.save()
+        authentication.user_cache.clear()
+        self.assertEqual(self.client.get('/api/salon/profile/').status_code, 401)
+
+    def test_published_access_beats_a_stale_cached_row(self):
+        self.authorize(authentication.tokens_for_user(self.customer).access_token)
+        authentication.user_cache.get(self.customer.pk)
+        # Deactivated by another process: this one keeps its old row.
+        User.objects.filter(pk=self.customer.pk).update(is_active=False)
+        authentication.publish_access(User.objects.get(pk=self.customer.pk))
+        self.assertTrue(authentication.user_cache.peek(self.customer.pk).is_active)
+        self.assertEqual(self.client.get('/api/salon/profile/').status_code, 401)
+
+    def test_stylist_appointments_use_the_stylist_claim(self):
+        customer = User.objects.create_user(email='other@example.com', password='password123', role='customer')
+        appointment = Appointment.objects.create(
+            customer=customer, stylist=self.stylist, appointment_date=date(2030, 1, 1), appointment_time=time(10, 0)
+        )
+        self.authorize(authentication.tokens_for_user(self.stylist.user).access_token)
+        with CaptureQueriesContext(connection) as queries:
+            results = self.client.get('/api/salon/appointments/?view=compact').json()['results']
+        self.assertEqual([row['id'] for row in results], [appointment.id])
+        listing = next(query['sql'] for query in queries if 'FROM "salon_appointment"' in query['sql'])
+        self.assertIn(f'"salon_appointment"."stylist_id" = {self.stylist.id}', listing)
+
+    def test_tokens_without_claims_load_the_user(self):
+        self.authorize(RefreshToken.for_user(self.customer).access_token)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/api/salon/services/', {'name': 'Cut', 'price': 10}, format='json')
+        self.assertEqual(len(queries), 1)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        cache.get_cache().clear()
+        Service.objects.create(name='Cut', price=30)
+
+    def test_sampled_request_reports_breakdown(self):
+        with override_settings(METRICS_SAMPLE_RATE=1.0, DEBUG=True):
+            response = self.client.get('/api/salon/services/')
+            cached = self.client.get('/api/salon/services/')
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'^total;dur=[\d.]+, db;desc="[1-9]\d* queries";dur=[\d.]+, serialize;dur=[\d.]+')
+        self.assertIn('cache;desc="0 hits, 1 misses"', timing)
+        self.assertIn('cache;desc="1 hits, 0 misses"', cached['Server-Timing'])
+        self.assertIn('db;desc="0 queries"', cached['Server-Timing'])
+
+        with override_settings(METRICS_SAMPLE_RATE=1.0):
+            response = self.client.get('/api/salon/services/')
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+$')
+        labels = ('GET', 'service-list', 200)
+        self.assertEqual(metrics.registry.db_queries[labels].count, 3)
+
+    def test_unsampled_request_only_times_the_total(self):
+        with override_settings(METRICS_SAMPLE_RATE=0):
+            response = self.client.get('/api/salon/services/')
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+$')
+
+    def test_metrics_endpoint_exposes_histograms(self):
+        with override_settings(METRICS_SAMPLE_RATE=1.0):
+            self.client.get('/api/salon/services/')
+        with override_settings(METRICS_SAMPLE_RATE=0):
+            self.client.get('/api/salon/services/')
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with override_settings(DEBUG=True):
+            body = self.client.get('/metrics').content.decode()
+        labels = 'method="GET",route="service-list",status="200"'
+        self.assertIn(f'glowapp_request_duration_seconds_count{{{labels}}} 2', body)
+        self.assertIn(f'glowapp_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2', body)
+        self.assertIn(f'glowapp_request_db_queries_count{{{labels}}} 1', body)
+        self.assertIn('glowapp_catalog_cache_hits_total', body)
+
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secreT').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    async def test_sampled_async_request_reports_breakdown(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        self.assertTrue(iscoroutinefunction(metrics.RequestMetricsMiddleware(get_response)))
+        with override_settings(METRICS_SAMPLE_RATE=1.0, DEBUG=True):
+            response = await self.async_client.get('/api/salon/services/')
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+, db;desc="[1-9]\d* queries";dur=[\d.]+')
+
+
+class SyntheticDataTests(TestCase):
+    def test_generates_a_consistent_schedule(self):
+        counts = synthetic.generate(stylists=3, customers=50, days=14, future_days=7, seed=1, batch_size=100)
+        self.assertEqual((counts['stylists'], counts['customers']), (3, 50))
+        self.assertEqual(Appointment.objects.count(), counts['appointments'])
+        self.assertGreater(counts['appointments'], 0)
+        self.assertFalse(User.objects.filter(email__endswith='@' + synthetic.DOMAIN, referral_code__isnull=True).exists())
+
+        for appointment in Appointment.objects.exclude(status__in=['cancelled', 'rejected'])[:200]:
+            self.assertFalse(
+                Appointment.objects.filter(stylist_id=appointment.stylist_id).overlapping(
+                    appointment.appointment_date, appointment.appointment_time, appointment.duration_minutes
+                ).exclude(pk=appointment.pk).exclude(status__in=['cancelled', 'rejected']).exists()
+            )
+        for stylist in Stylist.objects.all():
+            reviews = Review.objects.filter(stylist=stylist)
+            self.assertEqual(stylist.review_count, reviews.count())
+            self.assertEqual(stylist.rating_sum, reviews.aggregate(total=Sum('rating'))['total'] or 0)
+        self.assertFalse(Appointment.objects.filter(appointment_date__gte=date.today(), status='completed').exists())
+
+    def test_runs_again_without_a_flush(self):
+        synthetic.generate(stylists=1, customers=5, days=1, future_days=1, batch_size=100)
+        counts = synthetic.generate(stylists=1, customers=5, days=1, future_days=1, batch_size=100)
+        self.assertEqual((counts['stylists'], counts['customers']), (1, 5))
+        accounts = User.objects.filter(email__endswith='@' + synthetic.DOMAIN)
+        self.assertEqual(accounts.filter(role='customer').count(), 10)
+        self.assertEqual(accounts.filter(role='admin').count(), 1)
+
+    def test_benchmark_harness_saves_and_compares_a_baseline(self):
+        synthetic.generate(stylists=2, customers=20, days=7, future_days=7, batch_size=100)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        baseline = os.path.join(tmp.name, 'baseline.json')
+        scenarios = ['--scenario', 'stylist-list', '--scenario', 'booking', '--scenario', 'appointments-customer']
+        call_command('benchmark_api', '--iterations', '3', '--warmup', '0', '--save-baseline', baseline, *scenarios, stdout=StringIO())
+        appointments = Appointment.objects.count()
+        output = StringIO()
+        call_command('benchmark_api', '--iterations', '3', '--warmup', '0', '--baseline', baseline, '--tolerance', '100', *scenarios, stdout=output)
+        self.assertIn('No regressions.', output.getvalue())
+        # Bookings are rolled back.
+        self.assertEqual(Appointment.objects.count(), appointments)
+
+
+class PromotionPricingTests(TestCase):
+    def setUp(self):
+        cache.get_cache().clear()
+        self.now = timezone.now()
+        self.hair = Category.objects.create(name='Hair')
+        self.service = Service.objects.create(name='Color', price=Decimal('120.00'), duration_minutes=60, category=self.hair)
+        self.stylist = Stylist.objects.create(
+            user=User.objects.create_user(email='stylist@example.com', password='password123', role='stylist')
+        )
+        self.stylist.specialties.add(self.hair)
+        self.customer = User.objects.create_user(email='customer@example.com', password='password123', role='customer')
+
+    def promotion(self, name, promo_type, value, minimum=0, **kwargs):
+        return Promotion.objects.create(
+            name=name, promo_type=promo_type, discount_value=Decimal(value), minimum_booking_price=Decimal(minimum), **kwargs
+        )
+
+    def test_picks_the_largest_eligible_discount(self):
+        self.promotion('Ten off', 'fixed_amount', 10)
+        self.promotion('Big spender', 'percentage', 20, minimum=200)
+        self.promotion('Fifteen percent', 'percentage', 15, minimum=100)
+        self.promotion('Expired', 'fixed_amount', 50, valid_until=self.now - timedelta(days=1))
+        self.promotion('Not yet', 'fixed_amount', 60, valid_from=self.now + timedelta(days=1))
+        self.promotion('Welcome', 'first_time', 30)
+
+        index = pricing.get_index()
+        with self.assertNumQueries(0):
+            quote = index.quote(Decimal('120.00'))
+            self.assertIs(pricing.get_index(), index)
+        self.assertEqual((quote.promotion.name, quote.discount, quote.final_price), ('Fifteen percent', Decimal('18.00'), Decimal('102.00')))
+        self.assertEqual(index.quote(Decimal('120.00'), first_booking=True).promotion.name, 'Welcome')
+        self.assertEqual(index.quote(Decimal('50.00')).discount, Decimal('10.00'))
+        self.assertEqual(index.quote(Decimal('5.00')).final_price, Decimal('0.00'))
+        self.assertEqual(index.quote(Decimal('120.00'), now=self.now + timedelta(days=2)).promotion.name, 'Not yet')
+
+    def test_promotion_saves_rebuild_the_index(self):
+        index = pricing.get_index()
+        self.assertIsNone(index.quote(Decimal('120.00')).promotion)
+        self.promotion('Ten off', 'fixed_amount', 10)
+        self.assertEqual(pricing.get_index().quote(Decimal('120.00')).discount, Decimal('10.00'))
+
+    @override_settings(PROMOTION_INDEX_TTL=0)
+    def test_index_expires_for_writes_that_skip_signals(self):
+        promotion = self.promotion('Ten off', 'fixed_amount', 10)
+        self.assertEqual(pricing.get_index().quote(Decimal('120.00')).discount, Decimal('10.00'))
+        Promotion.objects.filter(pk=promotion.pk).update(is_active=False)
+        self.assertIsNone(pricing.get_index().quote(Decimal('120.00')).promotion)
+
+    def test_loyalty_redemption_needs_enough_points(self):
+        self.promotion('Points', 'loyalty_redemption', 25)
+        index = pricing.get_index()
+        self.assertIsNone(index.quote(Decimal('120.00')).promotion)
+        self.assertIsNone(index.quote(Decimal('120.00'), loyalty_balance=249).promotion)
+        quote = index.quote(Decimal('120.00'), loyalty_balance=250)
+        self.assertEqual((quote.discount, quote.points), (Decimal('25.00'), 250))
+
+    def book(self, **extra):
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        return client.post('/api/salon/appointments/', {
+            'stylist_id': self.stylist.id, 'service_ids': [self.service.id],
+            'appointment_date': (date.today() + timedelta(days=7)).isoformat(), 'appointment_time': '10:00', **extra,
+        }, format='json')
+
+    def test_booking_applies_first_time_promotion_once(self):
+        self.promotion('Welcome', 'first_time', 30)
+        response = self.book()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['discount'], response.data['final_price']), ('30.00', '90.00'))
+        self.assertEqual(self.book(appointment_time='14:00').data['final_price'], '120.00')
+
+    def test_booking_redeems_points(self):
+        self.promotion('Points', 'loyalty_redemption', 20)
+        LoyaltyPoint.objects.create(customer=self.customer, points=500)
+        self.assertEqual(self.book().data['final_price'], '120.00')
+        response = self.book(appointment_time='14:00', redeem_points=True)
+        self.assertEqual(response.data['final_price'], '100.00')
+        self.assertEqual(LoyaltyPoint.objects.get(customer=self.customer).points, 300)
+        self.assertTrue(LoyaltyTransaction.objects.filter(kind='redeem', appointment_id=response.data['id'], points=-200).exists())
+
+    def test_spent_balance_reprices_as_the_first_booking_it_was(self):
+        self.promotion('Welcome', 'first_time', 30)
+        self.promotion('Points', 'loyalty_redemption', 50)
+        quote = pricing.get_index().quote(Decimal('120.00'), first_booking=True, loyalty_balance=500)
+        appointment = Appointment.objects.create(
+            customer=self.customer, stylist=self.stylist, appointment_date=date.today() + timedelta(days=7),
+            appointment_time=time(10, 0), discount=quote.discount, final_price=quote.final_price,
+        )
+        # The points were spent elsewhere between the quote and the booking.
+        AppointmentSerializer()._redeem(appointment, [self.service], quote, first_booking=True)
+        appointment.refresh_from_db()
+        self.assertEqual((appointment.discount, appointment.final_price), (Decimal('30.00'), Decimal('90.00')))
@@ -5,7 +5,8 @@ from .views import (
     ServiceViewSet, StylistViewSet, AppointmentViewSet, ReviewViewSet,
     PromotionViewSet, LoyaltyPointViewSet, FavoriteStylistViewSet,
     CategoryViewSet, PasswordResetView, PasswordResetConfirmView,
-    UserReferralView, InspiredWorkViewSet
+    UserReferralView, InspiredWorkViewSet, StyleRecommendationView,
+    ImageVariantView, SearchView
 )
 
 router = DefaultRouter()
@@ -27,5 +28,8 @@ urlpatterns = [
     path('password-reset/', PasswordResetView.as_view(), name='password-reset'),
     path('password-reset/confirm/', PasswordResetConfirmView.as_view(), name='password-reset-confirm'),
     path('referrals/', UserReferralView.as_view(), name='user-referrals'),
+    path('image-variants/', ImageVariantView.as_view(), name='image-variant'),
+    path('style-recommendations/', StyleRecommendationView.as_view(), name='style-recommendations'),
+    path('search/', SearchView.as_view(), name='search'),
     path('', include(router.urls)),
 ]
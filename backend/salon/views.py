@@ -4,17 +4,17 @@ from django.shortcuts import render, get_object_or_404
 from rest_framework import generics, permissions, status, viewsets
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
 from .models import (
     User, Service, Stylist, Appointment, Review, Promotion,
-    LoyaltyPoint, FavoriteStylist, Category, Referral, InspiredWork
+    LoyaltyPoint, LoyaltyTransaction, FavoriteStylist, Category, Referral, InspiredWork, PortfolioImage
 )
 from .serializers import (
     UserSerializer, RegisterSerializer, LoginSerializer,
-    ServiceSerializer, StylistSerializer, AppointmentSerializer, ReviewSerializer,
-    PromotionSerializer, LoyaltyPointSerializer, FavoriteStylistSerializer,
+    ServiceSerializer, StylistSerializer, AppointmentSerializer, AppointmentCompactSerializer, ReviewSerializer,
+    PromotionSerializer, LoyaltyPointSerializer, LoyaltyTransactionSerializer, FavoriteStylistSerializer,
     CategorySerializer, PasswordResetSerializer, PasswordResetConfirmSerializer,
-    ReferralSerializer, InspiredWorkSerializer
+    ReferralSerializer, InspiredWorkSerializer, AIStyleRecommendationInputSerializer,
+    AIRecommendationResponseSerializer, SearchResultSerializer
 )
 from django.contrib.auth import get_user_model
 from django.utils.http import urlsafe_base64_decode
@@ -22,25 +22,36 @@ from django.contrib.auth.tokens import default_token_generator
 from django.core.mail import send_mail
 from django.urls import reverse
 from django.conf import settings
+from .authentication import get_cached_user, tokens_for_user
 from .permissions import IsOwnerOrAdmin, IsAdminOrReadOnly, IsAdminOrStylist, IsOwner
+from . import images, loyalty, search, snapshots
+from .cache import CachedCatalogMixin, ConditionalGetMixin
+from .pagination import KeysetPagination, SearchPagination
+from .passwords import ExecutorBusy, get_login_executor
+from .recommendations import recommend
+from .availability import MAX_RANGE_DAYS, get_availability, iter_availability, next_free_slot, salon_now
 from rest_framework.decorators import action
-from django.db.models import Avg, Count
-from datetime import date, datetime, timedelta, time
+from django.db.models import Count
+from datetime import datetime, timedelta
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from django.db import transaction
-import pytz
-from django.db.models import Q
+from django.db.models import Q, Prefetch
 from rest_framework.parsers import FormParser, MultiPartParser, JSONParser
+from django.core.files.storage import default_storage
+from django.http import Http404, HttpResponseRedirect, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+import asyncio
+import json
 
 
-class InspiredWorkViewSet(viewsets.ModelViewSet):
+class InspiredWorkViewSet(ConditionalGetMixin, CachedCatalogMixin, viewsets.ModelViewSet):
     """
     A viewset for viewing and managing inspired work images.
     """
     queryset = InspiredWork.objects.all().order_by('-created_at')
     serializer_class = InspiredWorkSerializer
     permission_classes = [IsAdminOrReadOnly]
+    pagination_class = None
 
 
 class RegisterView(generics.CreateAPIView):
@@ -48,47 +59,126 @@ class RegisterView(generics.CreateAPIView):
     serializer_class = RegisterSerializer
     permission_classes = [permissions.AllowAny]
 
+def _login(request, data):
+    """
+    Checks the credentials and issues a token pair. Returns ``(status, body)``.
+    Blocking: the password check is a full PBKDF2 run.
+    """
+    serializer = LoginSerializer(data=data, context={'request': request})
+    if not serializer.is_valid():
+        return status.HTTP_400_BAD_REQUEST, serializer.errors
+    user = serializer.validated_data['user']
+    refresh = tokens_for_user(user)
+    return status.HTTP_200_OK, {
+        'refresh': str(refresh),
+        'access': str(refresh.access_token),
+        'user': UserSerializer(user, context={'request': request}).data
+    }
+
+
 class LoginView(generics.GenericAPIView):
+    """
+    Async login for the ASGI entry point. The blocking work in ``_login`` runs
+    on the bounded login executor (salon/passwords.py), so a burst of logins
+    can't tie up the event loop; past LOGIN_MAX_PENDING queued logins the
+    view answers 503 instead of queuing more.
+    """
     serializer_class = LoginSerializer
     permission_classes = [permissions.AllowAny]
+    # Token login: no session to authenticate or protect from CSRF.
+    authentication_classes = []
     parser_classes = [FormParser, MultiPartParser, JSONParser]
 
-    def post(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        user = serializer.validated_data['user']
-        refresh = RefreshToken.for_user(user)
-        return Response({
-            'refresh': str(refresh),
-            'access': str(refresh.access_token),
-            'user': UserSerializer(user).data
-        })
+    async def dispatch(self, request, *args, **kwargs):
+        # APIView.dispatch (DRF 3.14) can't await a handler. This is the same
+        # sequence: parsing, permission and throttle checks and the exception
+        # handler all run as usual, only the handler is awaited.
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            self.initial(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    @swagger_auto_schema(responses={200: 'Token pair and user.', 400: 'Invalid credentials.', 503: 'Too many logins in progress.'})
+    async def post(self, request, *args, **kwargs):
+        try:
+            code, body = await get_login_executor().run(_login, request, request.data)
+        except ExecutorBusy:
+            return Response(
+                {'detail': 'Too many login attempts in progress. Try again shortly.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'},
+            )
+        return Response(body, status=code)
+
 
 class UserProfileView(generics.RetrieveUpdateAPIView):
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        # A token user only carries its claims; the profile needs the full row.
+        user = get_cached_user(self.request.user.pk)
+        if user is None:
+            raise Http404
+        return user
 
-class ServiceViewSet(viewsets.ModelViewSet):
+class ServiceViewSet(ConditionalGetMixin, CachedCatalogMixin, viewsets.ModelViewSet):
     queryset = Service.objects.filter(is_active=True).order_by('name')
     serializer_class = ServiceSerializer
     permission_classes = [IsAdminOrReadOnly]
+    # Catalog endpoints are small, cached and consumed as whole lists.
+    pagination_class = None
+    cache_models = (Category,)
 
-class StylistViewSet(viewsets.ModelViewSet):
+class StylistViewSet(ConditionalGetMixin, CachedCatalogMixin, viewsets.ModelViewSet):
     queryset = Stylist.objects.select_related('user').prefetch_related('specialties').all().order_by('id')
     serializer_class = StylistSerializer
     permission_classes = [IsAdminOrReadOnly]
+    pagination_class = None
+    cache_models = (User, Category, PortfolioImage, Review, FavoriteStylist)
+    # is_favorited depends on who is asking.
+    cache_vary_on_user = True
+
+    def get_queryset(self):
+        queryset = Stylist.objects.with_listing_data(self.request.user)
+        ordering = self.request.query_params.get('ordering')
+        if ordering in ('rating', '-rating'):
+            return queryset.order_by_rating(descending=ordering == '-rating')
+        return queryset.order_by('id')
 
     @swagger_auto_schema(
         method='get',
         manual_parameters=[
             openapi.Parameter('service_id', openapi.IN_QUERY, description="ID of the service to filter by", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('ordering', openapi.IN_QUERY, description="'rating' or '-rating' to sort by average rating", type=openapi.TYPE_STRING),
+            openapi.Parameter('date', openapi.IN_QUERY, description="Only stylists with a free slot that day (YYYY-MM-DD); adds next_free_slot", type=openapi.TYPE_STRING),
+            openapi.Parameter('time', openapi.IN_QUERY, description="With date: only stylists free at exactly this time (HH:MM)", type=openapi.TYPE_STRING),
+            openapi.Parameter('duration', openapi.IN_QUERY, description="With date: minutes to fit (default: the service's duration)", type=openapi.TYPE_INTEGER),
         ]
     )
     @action(detail=False, methods=['get'], url_path='available-for-service')
     def available_for_service(self, request):
+        if 'date' in request.query_params:
+            # Depends on bookings and the clock, which catalog versions don't track.
+            return self._available_for_service(request)
+        return self.conditional_response(
+            request, lambda: self.cached_response(request, lambda: self._available_for_service(request))
+        )
+
+    def _available_for_service(self, request):
         service_id = request.query_params.get('service_id')
         if not service_id:
             return Response({"error": "service_id parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
@@ -98,25 +188,91 @@ class StylistViewSet(viewsets.ModelViewSet):
         except Service.DoesNotExist:
             return Response({"error": "Service not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        stylists = Stylist.objects.filter(
+        stylists = self.get_queryset().filter(
             is_available=True,
             specialties=service.category
         ).distinct()
-        
+
+        if 'date' in request.query_params:
+            try:
+                window = self._parse_window(request, service)
+            except (ValueError, TypeError):
+                return Response(
+                    {"error": "Invalid date, time or duration format (YYYY-MM-DD, HH:MM, minutes)"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            stylists = self._free_in_window(stylists, *window)
+        elif 'time' in request.query_params or 'duration' in request.query_params:
+            return Response({"error": "time and duration need a date"}, status=status.HTTP_400_BAD_REQUEST)
+
         serializer = self.get_serializer(stylists, many=True)
         return Response(serializer.data)
 
+    def _parse_window(self, request, service):
+        appointment_date = datetime.strptime(request.query_params['date'], '%Y-%m-%d').date()
+        time_str = request.query_params.get('time')
+        appointment_time = datetime.strptime(time_str, '%H:%M').time() if time_str else None
+        duration = int(request.query_params.get('duration') or service.duration_minutes)
+        if not 0 < duration <= 24 * 60:
+            raise ValueError(duration)
+        return appointment_date, appointment_time, duration
+
+    def _free_in_window(self, stylists, appointment_date, appointment_time, duration):
+        """
+        The stylists with a free slot for ``duration`` minutes on
+        ``appointment_date`` (exactly at ``appointment_time``, if given), each
+        with a ``next_free_slot`` hint. Their busy bitmaps ride along in the
+        stylist query, so this adds no queries.
+        """
+        now = salon_now()
+        free = []
+        for stylist in snapshots.with_busy(stylists, appointment_date):
+            busy = snapshots.decode(stylist.busy_bitmap)
+            slot = next_free_slot(stylist, appointment_date, duration, busy, after=appointment_time, now=now)
+            if slot is None or (appointment_time is not None and slot != appointment_time.strftime('%H:%M')):
+                continue
+            stylist.next_free_slot = slot
+            free.append(stylist)
+        return free
+
 class AppointmentViewSet(viewsets.ModelViewSet):
     serializer_class = AppointmentSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def is_compact(self):
+        return self.action == 'list' and self.request.query_params.get('view') == 'compact'
+
+    def get_serializer_class(self):
+        if self.is_compact():
+            return AppointmentCompactSerializer
+        return super().get_serializer_class()
+
     def get_queryset(self):
         user = self.request.user
+        if self.is_compact():
+            queryset = Appointment.objects.select_related('customer', 'stylist__user').prefetch_related(
+                Prefetch('services', queryset=Service.objects.only('id', 'name'))
+            ).only(
+                'id', 'appointment_date', 'appointment_time', 'duration_minutes', 'status', 'final_price',
+                'customer__id', 'customer__email', 'customer__first_name', 'customer__last_name',
+                'stylist__id', 'stylist__user__id', 'stylist__user__email',
+                'stylist__user__first_name', 'stylist__user__last_name',
+            )
+        else:
+            queryset = Appointment.objects.select_related('customer', 'review').prefetch_related(
+                Prefetch('stylist', queryset=Stylist.objects.with_listing_data(user)),
+                Prefetch('services', queryset=Service.objects.select_related('category')),
+            )
         if user.role == 'admin':
-            return Appointment.objects.all()
+            return queryset.all()
         elif user.role == 'stylist':
-            return Appointment.objects.filter(stylist__user=user)
-        return Appointment.objects.filter(customer=user)
+            # Token users carry their stylist id; others (and stylists
+            # without a profile when the token was issued) need the join.
+            stylist_id = getattr(user, 'stylist_id', None)
+            if stylist_id is not None:
+                return queryset.filter(stylist_id=stylist_id)
+            return queryset.filter(stylist__user=user)
+        return queryset.filter(customer=user)
 
     def perform_create(self, serializer):
         appointment = serializer.save(customer=self.request.user)
@@ -132,12 +288,7 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             self.award_loyalty_points(updated_appointment)
 
     def award_loyalty_points(self, appointment):
-        customer = appointment.customer
-        points_to_award = int(appointment.total_price) # Example: 1 point per dollar spent
-        loyalty_points, created = LoyaltyPoint.objects.get_or_create(customer=customer)
-        loyalty_points.points += points_to_award
-        loyalty_points.save()
-
+        loyalty.award_for_appointment(appointment)
 
     @action(detail=True, methods=['post'], permission_classes=[IsOwner])
     def cancel(self, request, pk=None):
@@ -148,20 +299,46 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             return Response({'status': 'Appointment cancelled'}, status=status.HTTP_200_OK)
         return Response({'error': 'This appointment cannot be cancelled.'}, status=status.HTTP_400_BAD_REQUEST)
 
+    @swagger_auto_schema(
+        method='get',
+        manual_parameters=[
+            openapi.Parameter('date', openapi.IN_QUERY, description="Single day (YYYY-MM-DD)", type=openapi.TYPE_STRING),
+            openapi.Parameter('start_date', openapi.IN_QUERY, description="First day of a range (YYYY-MM-DD); streams NDJSON", type=openapi.TYPE_STRING),
+            openapi.Parameter('end_date', openapi.IN_QUERY, description="Last day of a range (YYYY-MM-DD), inclusive", type=openapi.TYPE_STRING),
+            openapi.Parameter('service_ids', openapi.IN_QUERY, description="Comma-separated service IDs", type=openapi.TYPE_STRING),
+            openapi.Parameter('stylist_id', openapi.IN_QUERY, description="Restrict to a single stylist", type=openapi.TYPE_INTEGER),
+        ]
+    )
     @action(detail=False, methods=['get'], url_path='availability')
     def availability(self, request):
         date_str = request.query_params.get('date')
+        start_date_str = request.query_params.get('start_date')
+        end_date_str = request.query_params.get('end_date')
         service_ids_str = request.query_params.get('service_ids')
         stylist_id = request.query_params.get('stylist_id')
 
-        if not date_str or not service_ids_str:
+        is_range = bool(start_date_str or end_date_str)
+        if is_range and not (start_date_str and end_date_str):
+            return Response({"error": "Both start_date and end_date are required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not (date_str or is_range) or not service_ids_str:
             return Response({"error": "Date and service_ids are required"}, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            appointment_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+            if is_range:
+                start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+                end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+            else:
+                appointment_date = datetime.strptime(date_str, '%Y-%m-%d').date()
             service_ids = [int(sid) for sid in service_ids_str.split(',')]
         except (ValueError, TypeError):
             return Response({"error": "Invalid date or service_id format"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if is_range:
+            if end_date < start_date:
+                return Response({"error": "end_date must not be before start_date"}, status=status.HTTP_400_BAD_REQUEST)
+            if (end_date - start_date).days >= MAX_RANGE_DAYS:
+                return Response({"error": f"Date range cannot exceed {MAX_RANGE_DAYS} days"}, status=status.HTTP_400_BAD_REQUEST)
         
         services = Service.objects.filter(id__in=service_ids)
         if len(services) != len(service_ids):
@@ -172,7 +349,7 @@ class AppointmentViewSet(viewsets.ModelViewSet):
 
         if stylist_id:
             try:
-                stylist = Stylist.objects.get(id=stylist_id)
+                stylist = Stylist.objects.select_related('user').get(id=stylist_id)
                 if not all(cat in stylist.specialties.all() for cat in required_categories):
                     return Response({"error": "Selected stylist cannot perform all chosen services."}, status=status.HTTP_400_BAD_REQUEST)
                 stylists = [stylist]
@@ -182,65 +359,27 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             stylists = Stylist.objects.filter(is_available=True)
             for category in required_categories:
                 stylists = stylists.filter(specialties=category)
-            stylists = stylists.distinct()
+            stylists = stylists.select_related('user').distinct()
+
+        if is_range:
+            dates = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+            return self._stream_availability(list(stylists), dates, total_duration)
 
         if not stylists:
             return Response({})
         
-        available_slots = {}
-        for stylist in stylists:
-            stylist_slots = self._get_stylist_availability(stylist, appointment_date, total_duration)
-            if stylist_slots:
-                available_slots[stylist.id] = {
-                    "stylist_name": stylist.user.get_full_name(),
-                    "slots": stylist_slots
-                }
-        
-        return Response(available_slots)
+        return Response(get_availability(stylists, appointment_date, total_duration))
 
-    def _get_stylist_availability(self, stylist, appointment_date, duration):
-        slots = []
-        start_hour = 8
-        end_hour = 20 # 8 PM
-        
-        if stylist.working_hours_start:
-            start_hour = stylist.working_hours_start.hour
-        if stylist.working_hours_end:
-            end_hour = stylist.working_hours_end.hour
-
-        existing_appointments = Appointment.objects.filter(
-            stylist=stylist,
-            appointment_date=appointment_date,
-            status__in=['pending', 'approved', 'rescheduled']
-        ).order_by('appointment_time')
-
-        current_time = datetime.now(pytz.utc).astimezone(pytz.timezone(settings.TIME_ZONE))
-        
-        slot_start = datetime.combine(appointment_date, time(start_hour, 0))
+    def _stream_availability(self, stylists, dates, duration):
+        """
+        Streams one NDJSON line per day, e.g.
+        {"date": "2025-08-01", "availability": {<same shape as the single-day response>}}
+        """
+        def lines():
+            for appointment_date, day in iter_availability(stylists, dates, duration):
+                yield json.dumps({"date": appointment_date.isoformat(), "availability": day}, cls=DjangoJSONEncoder) + '\n'
 
-        while slot_start.hour < end_hour:
-            slot_end = slot_start + timedelta(minutes=duration)
-            
-            is_valid_slot = True
-            
-            if appointment_date == current_time.date() and slot_start.time() <= current_time.time():
-                is_valid_slot = False
-            
-            if is_valid_slot:
-                for app in existing_appointments:
-                    app_start = datetime.combine(appointment_date, app.appointment_time)
-                    app_end = app_start + timedelta(minutes=app.duration_minutes)
-                    
-                    if max(slot_start, app_start) < min(slot_end, app_end):
-                        is_valid_slot = False
-                        break
-            
-            if is_valid_slot:
-                slots.append(slot_start.strftime('%H:%M'))
-            
-            slot_start += timedelta(minutes=15)
-            
-        return slots
+        return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
 
 class ReviewViewSet(viewsets.ModelViewSet):
     serializer_class = ReviewSerializer
@@ -263,14 +402,16 @@ class ReviewViewSet(viewsets.ModelViewSet):
         except Appointment.DoesNotExist:
             raise serializers.ValidationError("Appointment not found or you are not the owner.")
             
-class PromotionViewSet(viewsets.ModelViewSet):
+class PromotionViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Promotion.objects.filter(is_active=True).order_by('id')
     serializer_class = PromotionSerializer
     permission_classes = [IsAdminOrReadOnly]
+    pagination_class = None
 
 class LoyaltyPointViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = LoyaltyPointSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = None
 
     def get_queryset(self):
         """
@@ -289,33 +430,38 @@ class LoyaltyPointViewSet(viewsets.ReadOnlyModelViewSet):
         if not isinstance(amount, int) or amount <= 0:
             return Response({"error": "Invalid amount specified."}, status=status.HTTP_400_BAD_REQUEST)
         
-        try:
-            loyalty_points = LoyaltyPoint.objects.get(customer=request.user)
-        except LoyaltyPoint.DoesNotExist:
+        if not LoyaltyPoint.objects.filter(customer=request.user).exists():
             return Response({"error": "No loyalty points found for this user."}, status=status.HTTP_404_NOT_FOUND)
-        
-        if loyalty_points.points < amount:
+
+        try:
+            new_balance = loyalty.redeem(request.user, amount)
+        except loyalty.InsufficientPoints:
             return Response({"error": "Insufficient points."}, status=status.HTTP_400_BAD_REQUEST)
-            
-        with transaction.atomic():
-            loyalty_points.points -= amount
-            loyalty_points.save()
-            
-            # Here you might want to create a discount code or apply credit
-            # For simplicity, we just reduce points and return a success message
-            
+
+        # Here you might want to create a discount code or apply credit
+        # For simplicity, we just reduce points and return a success message
         return Response({
             "message": f"{amount} points successfully redeemed.",
-            "new_loyalty_points": loyalty_points.points
+            "new_loyalty_points": new_balance
         })
 
+    @action(detail=False, methods=['get'], url_path='history')
+    def history(self, request):
+        queryset = LoyaltyTransaction.objects.filter(customer=request.user).order_by('-created_at', '-id')
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(LoyaltyTransactionSerializer(page, many=True).data)
+
 
 class FavoriteStylistViewSet(viewsets.ModelViewSet):
     serializer_class = FavoriteStylistSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = None
 
     def get_queryset(self):
-        return FavoriteStylist.objects.filter(customer=self.request.user)
+        return FavoriteStylist.objects.filter(customer=self.request.user).prefetch_related(
+            Prefetch('stylist', queryset=Stylist.objects.with_listing_data(self.request.user))
+        )
 
     def perform_create(self, serializer):
         stylist_id = self.request.data.get('stylist')
@@ -333,10 +479,12 @@ class FavoriteStylistViewSet(viewsets.ModelViewSet):
         favorite.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ConditionalGetMixin, CachedCatalogMixin, viewsets.ModelViewSet):
     queryset = Category.objects.annotate(service_count=Count('services')).order_by('-service_count')
     serializer_class = CategorySerializer
     permission_classes = [IsAdminOrReadOnly]
+    pagination_class = None
+    cache_models = (Service,)
     
 class PasswordResetView(APIView):
     permission_classes = [permissions.AllowAny]
@@ -391,3 +539,93 @@ class UserReferralView(APIView):
             "referral_bonus_info": "Earn 100 points for each friend who signs up and books an appointment!"
         }
         return Response(response_data)
+
+
+class StyleRecommendationView(APIView):
+    """
+    Looks matching a description and/or resembling an uploaded photo, each
+    linked to a stylist who can do it (see salon/recommendations.py).
+    """
+    permission_classes = [permissions.AllowAny]
+    parser_classes = [MultiPartParser, FormParser, JSONParser]
+
+    @swagger_auto_schema(
+        request_body=AIStyleRecommendationInputSerializer,
+        responses={200: AIRecommendationResponseSerializer}
+    )
+    def post(self, request):
+        serializer = AIStyleRecommendationInputSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = recommend(
+            serializer.validated_data.get('preferences', ''),
+            limit=5,
+            image=serializer.validated_data.get('image'),
+        )
+        for result in results:
+            if result['imageUrl']:
+                result['imageUrl'] = request.build_absolute_uri(result['imageUrl'])
+        return Response(AIRecommendationResponseSerializer({'recommendations': results}).data)
+
+
+class SearchView(APIView):
+    """
+    Ranked full-text search over stylists, services and inspired work (see
+    salon/search.py). Each page is a single query.
+    """
+    permission_classes = [permissions.AllowAny]
+    pagination_class = SearchPagination
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY, description="Words to match; each also matches as a prefix", type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter('type', openapi.IN_QUERY, description="Comma-separated result types: stylist, service, inspired_work", type=openapi.TYPE_STRING),
+            openapi.Parameter('page_size', openapi.IN_QUERY, description="Results per page (at most 50)", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('offset', openapi.IN_QUERY, description="Results to skip", type=openapi.TYPE_INTEGER),
+        ],
+        responses={200: SearchResultSerializer(many=True)}
+    )
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        if not search.terms(query):
+            return Response({"error": "q parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
+        kinds = None
+        kinds_str = request.query_params.get('type')
+        if kinds_str:
+            kinds = [kind.strip() for kind in kinds_str.split(',') if kind.strip()]
+            unknown = sorted(set(kinds) - set(search.KINDS))
+            if unknown:
+                return Response({"error": f"Unknown type(s): {', '.join(unknown)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(search.Results(query, kinds), request, view=self)
+        return paginator.get_paginated_response(SearchResultSerializer(page, many=True).data)
+
+
+class ImageVariantView(APIView):
+    """
+    Fallback for srcset URLs of images whose row doesn't record their
+    variants yet: redirects to the variant requested if it exists, else
+    queues the upload pipeline (at most once per QUEUE_DEDUP_SECONDS, and
+    not at all without a broker) and redirects to the original. The request
+    itself never renders.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        name = request.query_params.get('name', '')
+        # Not 'format': DRF reserves that for content negotiation.
+        image_format = request.query_params.get('type', '')
+        try:
+            width = int(request.query_params.get('width', ''))
+        except ValueError:
+            width = None
+        if width not in images.VARIANT_WIDTHS or image_format not in images.VARIANT_FORMATS:
+            return Response({"error": "Unsupported width or type."}, status=status.HTTP_400_BAD_REQUEST)
+        if images.source_model(name) is None or not default_storage.exists(name):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        variant = images.variant_name(name, width, image_format)
+        if not default_storage.exists(variant):
+            images.queue_variants(name)
+            variant = name
+        return HttpResponseRedirect(request.build_absolute_uri(default_storage.url(variant)))
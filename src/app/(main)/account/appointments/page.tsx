@@ -28,6 +28,8 @@ export default function AppointmentsPage() {
   const { toast } = useToast();
   const { user } = useAuth();
   const [appointments, setAppointments] = useState<Appointment[]>([]);
+  const [nextPage, setNextPage] = useState<string | null>(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [isReviewDialogOpen, setIsReviewDialogOpen] = useState(false);
   const [isCancelAlertOpen, setIsCancelAlertOpen] = useState(false);
   const [selectedAppointment, setSelectedAppointment] = useState<Appointment | null>(null);
@@ -35,14 +37,29 @@ export default function AppointmentsPage() {
   const fetchAppointments = useCallback(async () => {
     if (user) {
       try {
-        const data = await getAppointments();
-        setAppointments(data);
+        const page = await getAppointments();
+        setAppointments(page.results);
+        setNextPage(page.next);
       } catch (err) {
         toast({ title: "Error", description: "Could not fetch appointments.", variant: "destructive" });
       }
     }
   }, [user, toast]);
 
+  const loadMoreAppointments = async () => {
+    if (!nextPage) return;
+    setIsLoadingMore(true);
+    try {
+      const page = await getAppointments(nextPage);
+      setAppointments(prev => [...prev, ...page.results]);
+      setNextPage(page.next);
+    } catch (err) {
+      toast({ title: "Error", description: "Could not fetch more appointments.", variant: "destructive" });
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     fetchAppointments();
   }, [fetchAppointments]);
@@ -149,6 +166,13 @@ export default function AppointmentsPage() {
                 <p className="text-muted-foreground text-center">No past appointments.</p>
               )}
             </div>
+            {nextPage && (
+              <div className="text-center">
+                <Button variant="outline" onClick={loadMoreAppointments} disabled={isLoadingMore}>
+                  {isLoadingMore ? 'Loading...' : 'Load more appointments'}
+                </Button>
+              </div>
+            )}
           </CardContent>
         </Card>
       </div>
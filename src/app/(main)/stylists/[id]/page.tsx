@@ -23,6 +23,8 @@ interface StylistDetailPageProps {
 export default function StylistDetailPage({ params }: StylistDetailPageProps) {
   const [stylist, setStylist] = useState<Stylist | null>(null);
   const [reviews, setReviews] = useState<Review[]>([]);
+  const [nextReviews, setNextReviews] = useState<string | null>(null);
+  const [isLoadingMoreReviews, setIsLoadingMoreReviews] = useState(false);
   const [loading, setLoading] = useState(true);
   const [isFavorited, setIsFavorited] = useState(false);
   
@@ -37,8 +39,9 @@ export default function StylistDetailPage({ params }: StylistDetailPageProps) {
         setStylist(stylistData);
         setIsFavorited(stylistData.is_favorited);
 
-        const reviewsData = await getReviews(Number(params.id));
-        setReviews(reviewsData);
+        const reviewsPage = await getReviews(Number(params.id));
+        setReviews(reviewsPage.results);
+        setNextReviews(reviewsPage.next);
       } catch (error) {
         console.error("Failed to fetch stylist or reviews", error);
         setStylist(null);
@@ -50,6 +53,20 @@ export default function StylistDetailPage({ params }: StylistDetailPageProps) {
     fetchStylistAndReviews();
   }, [params.id]);
 
+  const loadMoreReviews = async () => {
+    if (!nextReviews) return;
+    setIsLoadingMoreReviews(true);
+    try {
+      const page = await getReviews(Number(params.id), nextReviews);
+      setReviews(prev => [...prev, ...page.results]);
+      setNextReviews(page.next);
+    } catch (error) {
+      console.error("Failed to fetch more reviews", error);
+    } finally {
+      setIsLoadingMoreReviews(false);
+    }
+  };
+
   const handleToggleFavorite = async () => {
     if (!isAuthenticated) {
       toast({
@@ -168,6 +185,13 @@ export default function StylistDetailPage({ params }: StylistDetailPageProps) {
                 {reviews.map((review) => (
                   <ReviewCard key={review.id} review={review} />
                 ))}
+                {nextReviews && (
+                  <div className="text-center">
+                    <Button variant="outline" onClick={loadMoreReviews} disabled={isLoadingMoreReviews}>
+                      {isLoadingMoreReviews ? 'Loading...' : 'Load more reviews'}
+                    </Button>
+                  </div>
+                )}
               </div>
             ) : (
                 <p className="text-muted-foreground">This stylist has not received any reviews yet.</p>
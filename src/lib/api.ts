@@ -1,6 +1,6 @@
 
 import Cookies from 'js-cookie';
-import { Service, Stylist, Appointment, Review, Category, UserProfile, ReferralInfo, LoyaltyPoints, InspiredWork } from './types';
+import { Service, Stylist, Appointment, Review, Category, UserProfile, ReferralInfo, LoyaltyPoints, InspiredWork, SearchResult } from './types';
 
 const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000/api';
 
@@ -10,6 +10,12 @@ interface RequestOptions {
   body?: any;
 }
 
+export interface Page<T> {
+  next: string | null;
+  previous: string | null;
+  results: T[];
+}
+
 export interface LoginCredentials {
   email: string;
   password?: string;
@@ -40,7 +46,8 @@ async function request<T>(url: string, options: RequestOptions = {}): Promise<T>
     }
   }
 
-  const response = await fetch(`${API_URL}${url}`, config);
+  // Pagination links come back as absolute URLs.
+  const response = await fetch(url.startsWith('http') ? url : `${API_URL}${url}`, config);
 
   if (!response.ok) {
     let errorData;
@@ -82,11 +89,20 @@ export const deleteService = (id: number) => request<void>(`/salon/services/${id
 // Stylists
 export const getStylists = () => request<Stylist[]>('/salon/stylists/');
 export const getStylist = (id: number) => request<Stylist>(`/salon/stylists/${id}/`);
-export const getAvailableStylists = (serviceId: number) => request<Stylist[]>(`/salon/stylists/available-for-service/?service_id=${serviceId}`);
+export const getAvailableStylists = (serviceId: number, window?: { date: string, time?: string, duration?: number }) => {
+  const params = new URLSearchParams({ service_id: String(serviceId) });
+  if (window) {
+    params.set('date', window.date);
+    if (window.time) params.set('time', window.time);
+    if (window.duration) params.set('duration', String(window.duration));
+  }
+  return request<Stylist[]>(`/salon/stylists/available-for-service/?${params.toString()}`);
+};
 
 
 // Appointments
-export const getAppointments = () => request<Appointment[]>('/salon/appointments/');
+// Cursor-paginated: pass a page's `next` link to fetch the one after it.
+export const getAppointments = (next?: string) => request<Page<Appointment>>(next || '/salon/appointments/');
 export const createAppointment = (appointmentData: object) => request<Appointment>('/salon/appointments/', { method: 'POST', body: appointmentData });
 export const cancelAppointment = (id: number) => request<void>(`/salon/appointments/${id}/cancel/`, { method: 'POST' });
 export const getAvailability = (params: { date: string, service_ids: string, stylist_id?: string }) => {
@@ -96,9 +112,9 @@ export const getAvailability = (params: { date: string, service_ids: string, sty
 
 
 // Reviews
-export const getReviews = (stylistId?: number) => {
+export const getReviews = (stylistId?: number, next?: string) => {
     const url = stylistId ? `/salon/reviews/?stylist_id=${stylistId}` : '/salon/reviews/';
-    return request<Review[]>(url);
+    return request<Page<Review>>(next || url);
 };
 export const createReview = (reviewData: object) => request<Review>('/salon/reviews/', { method: 'POST', body: reviewData });
 
@@ -109,6 +125,13 @@ export const getPromotions = () => request<any[]>('/salon/promotions/');
 // Inspired Work
 export const getInspiredWork = () => request<InspiredWork[]>('/salon/inspired-work/');
 
+// Search
+export const search = (q: string, types?: SearchResult['type'][]) => {
+  const params = new URLSearchParams({ q });
+  if (types?.length) params.set('type', types.join(','));
+  return request<Page<SearchResult>>(`/salon/search/?${params.toString()}`);
+};
+
 
 // Favorites
 export const getFavorites = () => request<any[]>('/salon/favorites/');
@@ -1,3 +1,6 @@
+// Resized variants of an uploaded image: a srcset string per format.
+export type ImageSrcset = { webp: string; jpeg: string } | null;
+
 export interface Service {
     id: number;
     name: string;
@@ -7,6 +10,7 @@ export interface Service {
     category: number;
     category_name: string;
     imageUrl: string;
+    imageSrcset?: ImageSrcset;
     is_active: boolean;
   }
   
@@ -23,6 +27,7 @@ export interface Service {
     last_name: string;
     phone_number: string;
     profile_image_url: string;
+    profile_image_srcset?: ImageSrcset;
     referral_code: string;
     name: string;
     role: 'customer' | 'stylist' | 'admin';
@@ -36,9 +41,13 @@ export interface Service {
     rating: number;
     reviewCount: number;
     portfolio: string[];
+    portfolioSrcset?: ImageSrcset[];
     imageUrl: string;
+    imageSrcset?: ImageSrcset;
     is_featured: boolean;
     is_favorited: boolean;
+    // Only from getAvailableStylists with a date.
+    next_free_slot?: string;
   }
   
   export interface Appointment {
@@ -50,6 +59,8 @@ export interface Service {
     appointment_time: string;
     duration_minutes: number;
     status: 'pending' | 'approved' | 'completed' | 'cancelled';
+    discount: string;
+    final_price: string | null;
     can_review: boolean;
     created_at: string;
   }
@@ -92,4 +103,12 @@ export interface Service {
     imageUrl: string;
     created_at: string;
   }
+
+  export interface SearchResult {
+    type: 'stylist' | 'service' | 'inspired_work';
+    id: number;
+    title: string;
+    snippet: string;
+    rank: number;
+  }
   
\ No newline at end of file